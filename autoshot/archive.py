@@ -0,0 +1,526 @@
+"""
+Archive Module
+Append-only segment files as an alternative to one image file per frame
+
+Segment layout (little endian):
+
+    header   MAGIC (8 bytes) + format name (8 bytes, NUL padded)
+    records  RECORD (timestamp_ms, hash, flags, length) + encoded frame, repeated
+    footer   FOOTER_ENTRY (timestamp_ms, hash, flags, offset, length) per frame
+    trailer  TRAILER (footer offset, frame count, INDEX_MAGIC)
+
+The footer is written when a segment is closed. A segment left without one
+(e.g. after a crash) is still readable by walking its records. Frames with
+FLAG_DELTA are deltas against the previous frame of the same segment (see
+delta.py); every segment starts with a keyframe.
+"""
+import argparse
+import mmap
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+SEGMENT_SUFFIX = ".ashar"
+MAGIC = b"ASHSEG1\0"
+INDEX_MAGIC = b"ASHIDX1\0"
+HEADER = struct.Struct("<8s8s")
+RECORD = struct.Struct("<qQBI")
+FOOTER_ENTRY = struct.Struct("<qQBQI")
+TRAILER = struct.Struct("<QI8s")
+FLAG_HASH = 1
+FLAG_DELTA = 2
+FOOTER_DTYPE = np.dtype([("timestamp", "<i8"), ("hash", "<u8"), ("flags", "u1"),
+                         ("offset", "<u8"), ("length", "<u4")])
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# (path, timestamp, size, hash), like frame_index.FrameEntry
+FrameEntry = Tuple[str, float, int, Optional[int]]
+
+
+class ArchiveFrame:
+    def __init__(self, segment: Path, timestamp: int, hash_value: Optional[int], data: bytes, format: str,
+                 delta: bool = False, reader: Optional["ArchiveReader"] = None):
+        """
+        One frame read from an archive
+
+        Args:
+            segment: Segment file the frame is stored in
+            timestamp: Capture time in milliseconds since the epoch
+            hash_value: 64-bit hash of the frame, if it was recorded
+            data: Encoded frame, or a delta against the previous frame
+            format: Encoder format name of the keyframes ("png", "webp", ...)
+            delta: The data is a delta (see delta.py)
+            reader: Reader the frame came from, used to reconstruct deltas
+        """
+        self.segment = segment
+        self.timestamp = timestamp
+        self.hash = hash_value
+        self.data = data
+        self.format = format
+        self.delta = delta
+        self.reader = reader
+
+    @property
+    def location(self) -> str:
+        """Printable location of the frame: segment path and timestamp"""
+        return f"{self.segment}@{self.timestamp}"
+
+    def image(self) -> Image.Image:
+        """
+        Decode the frame, reconstructing it from its keyframe if it is a delta
+
+        Returns:
+            PIL Image
+        """
+        import io
+
+        if self.delta:
+            return self.reader.reconstruct(self)
+
+        with Image.open(io.BytesIO(self.data)) as image:
+            image.load()
+            return image
+
+
+def _segment_name(timestamp: int) -> str:
+    return f"segment_{timestamp}{SEGMENT_SUFFIX}"
+
+
+def _read_segment_index(mapped, size: int) -> np.ndarray:
+    """Footer entries of a segment, recovered from its records if it has no footer"""
+    if size >= HEADER.size + TRAILER.size:
+        footer_offset, count, magic = TRAILER.unpack_from(mapped, size - TRAILER.size)
+        if magic == INDEX_MAGIC and footer_offset + count * FOOTER_DTYPE.itemsize == size - TRAILER.size:
+            return np.frombuffer(mapped, FOOTER_DTYPE, count, footer_offset).copy()
+
+    entries = []
+    offset = HEADER.size
+    while offset + RECORD.size <= size:
+        timestamp, hash_value, flags, length = RECORD.unpack_from(mapped, offset)
+        data_offset = offset + RECORD.size
+        if timestamp <= 0 or data_offset + length > size:
+            # Torn final record
+            break
+        entries.append((timestamp, hash_value, flags, data_offset, length))
+        offset = data_offset + length
+    return np.array(entries, dtype=FOOTER_DTYPE)
+
+
+class ArchiveWriter:
+    def __init__(self, directory: str, format: str = "png", segment_size: int = DEFAULT_SEGMENT_SIZE):
+        """
+        Append encoded frames to rolling segment files in a directory
+
+        A new segment is started when the current one reaches segment_size
+        bytes, or on the first append after close(). Besides writing, the
+        writer offers the read side of a FrameIndex (latest(), entries(),
+        __len__), so dedupe history loads from the archive directly.
+
+        Args:
+            directory: Directory for the segment files
+            format: Encoder format name of the frames, stored in each segment
+            segment_size: Size in bytes after which a segment is closed
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._file = None
+        self._path: Optional[Path] = None
+        self._entries: List[tuple] = []
+        self._last_timestamp = 0
+
+        reader = ArchiveReader(str(self.directory))
+        self._closed_count = len(reader)
+        self._closed_latest = reader.latest()
+        if self._closed_latest is not None:
+            self._last_timestamp = int(round(self._closed_latest[1] * 1000))
+        reader.close()
+
+    def append(self, data: bytes, hash_value: Optional[int] = None, delta: bool = False) -> str:
+        """
+        Append an encoded frame, stamped with the current time
+
+        Args:
+            data: Encoded frame
+            hash_value: 64-bit hash of the frame (optional)
+            delta: The data is a delta against the previous frame; not
+                allowed as the first frame of a segment (see segment_frames)
+
+        Returns:
+            Location of the frame as "segment path@timestamp"
+        """
+        with self._lock:
+            # Strictly increasing timestamps keep segments sorted and make them unique keys
+            timestamp = max(int(time.time() * 1000), self._last_timestamp + 1)
+            self._last_timestamp = timestamp
+            if self._file is None:
+                if delta:
+                    raise ValueError("A segment must start with a keyframe")
+                self._open_segment(timestamp)
+            offset = self._file.tell() + RECORD.size
+            flags = (FLAG_HASH if hash_value is not None else 0) | (FLAG_DELTA if delta else 0)
+            self._file.write(RECORD.pack(timestamp, hash_value or 0, flags, len(data)))
+            self._file.write(data)
+            self._file.flush()
+            self._entries.append((timestamp, hash_value or 0, flags, offset, len(data)))
+            location = f"{self._path}@{timestamp}"
+            if offset + len(data) >= self.segment_size:
+                self._close_segment()
+            return location
+
+    def _open_segment(self, timestamp: int):
+        self._path = self.directory / _segment_name(timestamp)
+        self._file = open(self._path, "wb")
+        self._file.write(HEADER.pack(MAGIC, self.format.encode("ascii")))
+        self._entries = []
+
+    def _close_segment(self):
+        footer_offset = self._file.tell()
+        for entry in self._entries:
+            self._file.write(FOOTER_ENTRY.pack(*entry))
+        self._file.write(TRAILER.pack(footer_offset, len(self._entries), INDEX_MAGIC))
+        self._file.close()
+        if self._entries:
+            timestamp, hash_value, flags, _, length = self._entries[-1]
+            self._closed_latest = (f"{self._path}@{timestamp}", timestamp / 1000, length,
+                                   int(hash_value) if flags & FLAG_HASH else None)
+        self._closed_count += len(self._entries)
+        self._file = None
+        self._path = None
+        self._entries = []
+
+    @property
+    def segment_frames(self) -> int:
+        """Number of frames in the open segment; 0 means the next frame starts a new one"""
+        with self._lock:
+            return len(self._entries) if self._file is not None else 0
+
+    def close(self):
+        """
+        Write the footer of the current segment and close it
+        """
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+
+    def latest(self, exclude: Optional[str] = None) -> Optional[FrameEntry]:
+        """
+        Get the most recent frame
+
+        Args:
+            exclude: Location to skip (optional)
+
+        Returns:
+            Tuple of (location, timestamp, size, hash) or None if the archive is empty
+        """
+        with self._lock:
+            for timestamp, hash_value, flags, _, length in reversed(self._entries):
+                location = f"{self._path}@{timestamp}"
+                if location != exclude:
+                    return location, timestamp / 1000, length, int(hash_value) if flags & FLAG_HASH else None
+            if self._closed_latest is not None and self._closed_latest[0] != exclude:
+                return self._closed_latest
+        return None
+
+    def entries(self) -> Iterator[FrameEntry]:
+        """
+        Iterate over all frames, oldest first
+
+        Returns:
+            Iterator of (location, timestamp, size, hash)
+        """
+        with self._lock:
+            current_path = self._path
+            current = list(self._entries)
+        reader = ArchiveReader(str(self.directory))
+        try:
+            for segment, index in reader.segment_indexes():
+                if segment == current_path:
+                    continue
+                for entry in index:
+                    yield (f"{segment}@{entry['timestamp']}", entry["timestamp"] / 1000, int(entry["length"]),
+                           int(entry["hash"]) if entry["flags"] & FLAG_HASH else None)
+        finally:
+            reader.close()
+        for timestamp, hash_value, flags, _, length in current:
+            yield f"{current_path}@{timestamp}", timestamp / 1000, length, int(hash_value) if flags & FLAG_HASH else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._closed_count + len(self._entries)
+
+
+class ArchiveReader:
+    def __init__(self, directory: str):
+        """
+        Read the frames of an archive directory through memory maps
+
+        Segment indexes (footers) are loaded on first use and kept; frame
+        data is copied out of the map only for the frames returned.
+
+        Args:
+            directory: Directory holding the segment files
+        """
+        self.directory = Path(directory)
+        self._maps = {}
+        self._indexes = {}
+        # Last reconstructed frame as (segment, position, image), so streaming
+        # through deltas applies each delta once
+        self._reconstructed: Optional[Tuple[Path, int, Image.Image]] = None
+
+    @property
+    def segments(self) -> List[Path]:
+        """Segment files, oldest first"""
+        return sorted(self.directory.glob("segment_*" + SEGMENT_SUFFIX),
+                      key=lambda p: int(p.stem.split("_")[1]))
+
+    def _open(self, segment: Path) -> Tuple[Optional[mmap.mmap], np.ndarray, str]:
+        if segment not in self._indexes:
+            size = segment.stat().st_size
+            mapped = None
+            format = ""
+            index = np.array([], dtype=FOOTER_DTYPE)
+            if size >= HEADER.size:
+                with open(segment, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, format_name = HEADER.unpack_from(mapped, 0)
+                if magic == MAGIC:
+                    format = format_name.rstrip(b"\0").decode("ascii")
+                    index = _read_segment_index(mapped, size)
+            self._maps[segment] = (mapped, format)
+            self._indexes[segment] = index
+        mapped, format = self._maps[segment]
+        return mapped, self._indexes[segment], format
+
+    def segment_indexes(self) -> Iterator[Tuple[Path, np.ndarray]]:
+        """
+        Iterate over the segments and their frame indexes
+
+        Returns:
+            Iterator of (segment path, structured array with timestamp,
+            hash, flags, offset and length per frame)
+        """
+        for segment in self.segments:
+            yield segment, self._open(segment)[1]
+
+    def frames(self, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[ArchiveFrame]:
+        """
+        Stream the frames in a time range, oldest first
+
+        Args:
+            start: First timestamp in milliseconds, inclusive (optional)
+            end: Last timestamp in milliseconds, exclusive (optional)
+
+        Returns:
+            Iterator of ArchiveFrame
+        """
+        segments = self.segments
+        for position, segment in enumerate(segments):
+            # Segment names hold their first timestamp, so whole segments can be skipped
+            if end is not None and int(segment.stem.split("_")[1]) >= end:
+                break
+            if start is not None and position + 1 < len(segments) and \
+                    int(segments[position + 1].stem.split("_")[1]) <= start:
+                continue
+            mapped, index, format = self._open(segment)
+            first = 0 if start is None else int(np.searchsorted(index["timestamp"], start, "left"))
+            last = len(index) if end is None else int(np.searchsorted(index["timestamp"], end, "left"))
+            for entry in index[first:last]:
+                yield self._frame(segment, mapped, entry, format)
+
+    def get(self, timestamp: int) -> Optional[ArchiveFrame]:
+        """
+        Get the frame that was current at a point in time
+
+        Args:
+            timestamp: Time in milliseconds since the epoch
+
+        Returns:
+            The last frame captured at or before the timestamp, or None
+        """
+        for segment in reversed(self.segments):
+            if int(segment.stem.split("_")[1]) > timestamp:
+                continue
+            mapped, index, format = self._open(segment)
+            position = int(np.searchsorted(index["timestamp"], timestamp, "right"))
+            if position > 0:
+                return self._frame(segment, mapped, index[position - 1], format)
+        return None
+
+    def latest(self) -> Optional[FrameEntry]:
+        """
+        Get the most recent frame without reading its data
+
+        Returns:
+            Tuple of (location, timestamp, size, hash) or None if the archive is empty
+        """
+        for segment in reversed(self.segments):
+            index = self._open(segment)[1]
+            if len(index):
+                entry = index[-1]
+                return (f"{segment}@{entry['timestamp']}", entry["timestamp"] / 1000, int(entry["length"]),
+                        int(entry["hash"]) if entry["flags"] & FLAG_HASH else None)
+        return None
+
+    def _frame(self, segment: Path, mapped, entry, format: str) -> ArchiveFrame:
+        offset, length = int(entry["offset"]), int(entry["length"])
+        flags = int(entry["flags"])
+        return ArchiveFrame(segment, int(entry["timestamp"]), int(entry["hash"]) if flags & FLAG_HASH else None,
+                            mapped[offset:offset + length], format, bool(flags & FLAG_DELTA), self)
+
+    def reconstruct(self, frame: ArchiveFrame) -> Image.Image:
+        """
+        Rebuild a frame from the last keyframe before it and the deltas in between
+
+        Args:
+            frame: Frame read from this reader
+
+        Returns:
+            PIL Image
+        """
+        from .delta import apply_delta
+
+        mapped, index, format = self._open(frame.segment)
+        position = int(np.searchsorted(index["timestamp"], frame.timestamp))
+        keyframe = position
+        while index[keyframe]["flags"] & FLAG_DELTA:
+            keyframe -= 1
+
+        cached = self._reconstructed
+        if cached is not None and cached[0] == frame.segment and keyframe <= cached[1] <= position:
+            first, image = cached[1] + 1, cached[2]
+        else:
+            first, image = keyframe + 1, self._frame(frame.segment, mapped, index[keyframe], format).image()
+        for entry in index[first:position + 1]:
+            offset, length = int(entry["offset"]), int(entry["length"])
+            image = apply_delta(image, mapped[offset:offset + length])
+        self._reconstructed = (frame.segment, position, image)
+        return image.copy()
+
+    def __len__(self) -> int:
+        return sum(len(index) for _, index in self.segment_indexes())
+
+    def close(self):
+        """
+        Release the memory maps
+        """
+        for mapped, _ in self._maps.values():
+            if mapped is not None:
+                mapped.close()
+        self._maps = {}
+        self._indexes = {}
+        self._reconstructed = None
+
+
+def export_frames(reader: ArchiveReader, output_dir: str, start: Optional[int] = None,
+                  end: Optional[int] = None) -> int:
+    """
+    Write archived frames back out as individual PNG files
+
+    Frames stored as PNG are copied as is; other formats are decoded and
+    re-encoded. Files are named like the ones AutoShot saves directly.
+
+    Args:
+        reader: Archive to export from
+        output_dir: Directory for the PNG files
+        start: First timestamp in milliseconds, inclusive (optional)
+        end: Last timestamp in milliseconds, exclusive (optional)
+
+    Returns:
+        Number of frames exported
+    """
+    from .image_processor import ImageProcessor
+
+    processor = ImageProcessor(output_dir)
+    count = 0
+    for frame in reader.frames(start, end):
+        filename = f"screenshot_{frame.timestamp}.png"
+        if frame.format == "png" and not frame.delta:
+            processor.save_encoded(frame.data, filename)
+        else:
+            processor.save_image(frame.image(), filename)
+        count += 1
+    return count
+
+
+def parse_time(value: str) -> int:
+    """
+    Parse a command line time: milliseconds since the epoch or an ISO date/time
+
+    Args:
+        value: Time specification
+
+    Returns:
+        Milliseconds since the epoch
+    """
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def main():
+    """
+    Command line interface for inspecting and exporting archives
+    """
+    parser = argparse.ArgumentParser(description="AutoShot archive tool")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="Show the segments of an archive")
+    info.add_argument("directory")
+
+    list_parser = commands.add_parser("list", help="List frames in a time range")
+    export = commands.add_parser("export", help="Export frames in a time range as PNG files")
+    get = commands.add_parser("get", help="Save the frame that was current at a point in time")
+    for sub in (list_parser, export):
+        sub.add_argument("directory")
+        sub.add_argument("--start", type=parse_time, help="Start time (ms since the epoch or ISO date/time)")
+        sub.add_argument("--end", type=parse_time, help="End time, exclusive (ms since the epoch or ISO date/time)")
+    export.add_argument("output_dir")
+    get.add_argument("directory")
+    get.add_argument("time", type=parse_time, help="Time (ms since the epoch or ISO date/time)")
+    get.add_argument("output", help="File to write the frame to; keyframes are written as stored, "
+                                    "delta frames are reconstructed and saved in the format of the extension")
+
+    args = parser.parse_args()
+    reader = ArchiveReader(args.directory)
+    try:
+        if args.command == "info":
+            total = 0
+            for segment, index in reader.segment_indexes():
+                total += len(index)
+                span = f"{index['timestamp'][0]}..{index['timestamp'][-1]}" if len(index) else "empty"
+                print(f"{segment.name}: {len(index)} frames, {segment.stat().st_size:,} bytes, {span}")
+            print(f"Total: {total} frames")
+        elif args.command == "list":
+            for frame in reader.frames(args.start, args.end):
+                hash_text = f"{frame.hash:016x}" if frame.hash is not None else "-"
+                kind = "delta" if frame.delta else "key"
+                print(f"{frame.timestamp}\t{len(frame.data)}\t{kind}\t{hash_text}\t{frame.segment.name}")
+        elif args.command == "export":
+            count = export_frames(reader, args.output_dir, args.start, args.end)
+            print(f"Exported {count} frames to {args.output_dir}")
+        elif args.command == "get":
+            frame = reader.get(args.time)
+            if frame is None:
+                print("No frame at or before that time")
+                return
+            if frame.delta:
+                frame.image().save(args.output)
+            else:
+                Path(args.output).write_bytes(frame.data)
+            print(f"Frame {frame.timestamp} ({frame.format}) written to {args.output}")
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Async Capture Module
+Asyncio interface that streams captured frames to the caller
+"""
+import asyncio
+import concurrent.futures
+import time
+from typing import AsyncIterator, Callable, List, Optional
+
+from PIL import Image
+
+from .metrics import FRAMES, QUIET, log
+from .similarity_detector import hash_to_int
+
+
+class FrameRecord:
+    def __init__(self, timestamp: float, region: str, image: Image.Image, hash_value: Optional[int],
+                 is_duplicate: bool, saved_path: Optional[str]):
+        """
+        One region of one captured frame, as yielded by AsyncAutoShot
+
+        Args:
+            timestamp: Wall-clock time of the grab (time.time())
+            region: Name of the capture region
+            image: Cropped PIL Image, still in memory
+            hash_value: 64-bit perceptual hash, or None if the change gate
+                found the frame unchanged without hashing it
+            is_duplicate: Dedupe verdict
+            saved_path: Path the frame was saved to, or None if it is a
+                duplicate, saving is off or the save failed
+        """
+        self.timestamp = timestamp
+        self.region = region
+        self.image = image
+        self.hash_value = hash_value
+        self.is_duplicate = is_duplicate
+        self.saved_path = saved_path
+
+    def __repr__(self) -> str:
+        return (f"FrameRecord(region={self.region!r}, timestamp={self.timestamp:.3f}, "
+                f"is_duplicate={self.is_duplicate}, saved_path={self.saved_path!r})")
+
+
+class AsyncAutoShot:
+    def __init__(self, autoshot, executor: Optional[concurrent.futures.Executor] = None, save: bool = True,
+                 duplicates: bool = True):
+        """
+        Stream an AutoShot's frames to asyncio code instead of only writing files
+
+        The grab, hash and encode of each cycle run in an executor, one cycle
+        at a time even if capture() and frames() are used concurrently or the
+        executor has several threads, so the event loop never blocks and the
+        dedupe state is only touched by one cycle at a time. frames() captures a tick only when the
+        consumer asks for the next record: a slow consumer is the
+        backpressure, and the ticks it misses are handled by the AutoShot's
+        overrun policy. The AutoShot's own pipeline, if any, is not used.
+
+        Args:
+            autoshot: AutoShot instance whose frame source, regions, interval,
+                probes and streams are used
+            executor: Executor for the blocking work (optional, by default a
+                private single thread, shut down by aclose())
+            save: Encode and save new frames as the capture loop does; if
+                False, new frames only become the dedupe reference and the
+                consumer decides what to keep
+            duplicates: Also yield records of duplicate frames
+        """
+        self.autoshot = autoshot
+        self.save = save
+        self.duplicates = duplicates
+        self._own_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="autoshot-async")
+        self._in_flight: Optional[concurrent.futures.Future] = None
+        # Created in the running loop by _run(): before Python 3.10 a lock is bound to a loop when created
+        self._lock: Optional[asyncio.Lock] = None
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncAutoShot":
+        self.autoshot.start_retention()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def _run(self, func: Callable, *args):
+        """
+        Run blocking work in the executor, after the work submitted before it
+
+        If the awaiting task is cancelled, work that already started still
+        finishes in the executor (so a frame is never half saved); the next
+        call and aclose() wait for it.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._finish_in_flight()
+            self._in_flight = self._executor.submit(func, *args)
+            future = asyncio.wrap_future(self._in_flight)
+            try:
+                return await future
+            finally:
+                if not future.cancelled():
+                    self._in_flight = None
+
+    async def _finish_in_flight(self):
+        """Wait for the work a cancelled task left in the executor and log its error"""
+        if self._in_flight is None:
+            return
+        future = asyncio.wrap_future(self._in_flight)
+        await asyncio.wait([future])
+        self._in_flight = None
+        if not future.cancelled() and future.exception() is not None:
+            log(f"Error in capture cycle: {future.exception()}", QUIET)
+
+    def _cycle(self, use_probes: bool) -> Optional[List[FrameRecord]]:
+        """
+        Grab and process one frame; runs in the executor
+
+        Returns:
+            Records of all regions, an empty list if the probes skipped the
+            tick, or None if the grab failed
+        """
+        if use_probes and not self.autoshot.should_capture():
+            self.autoshot.report_change(False)
+            return []
+        start = time.perf_counter()
+        timestamp = time.time()
+        images = self.autoshot.grab_regions()
+        if images is None:
+            log("Capture failed", QUIET)
+            return None
+
+        records = []
+        for stream, image in zip(self.autoshot.streams, images):
+            is_duplicate, phash = stream.check(image)
+            saved_path = None
+            if is_duplicate:
+                log(f"Duplicate frame skipped ({stream.region.name})", FRAMES)
+            elif self.save:
+                saved_path = stream.keep(image, phash)
+            else:
+                stream.accept(phash)
+            hash_value = hash_to_int(phash) if phash is not None else None
+            records.append(FrameRecord(timestamp, stream.region.name, image, hash_value, is_duplicate, saved_path))
+        self.autoshot.report_change(not all(record.is_duplicate for record in records))
+        self.autoshot.timers["cycle"].record(time.perf_counter() - start)
+        return records
+
+    async def capture(self) -> Optional[List[FrameRecord]]:
+        """
+        Capture one frame now, ignoring the interval and the probes
+
+        Returns:
+            One record per region, or None if the grab failed
+        """
+        return await self._run(self._cycle, False)
+
+    async def frames(self) -> AsyncIterator[FrameRecord]:
+        """
+        Capture on the AutoShot's interval and yield a record per region
+
+        Ticks skipped by the probes and failed grabs yield nothing. The
+        generator ends when aclose() is called; breaking out of the loop or
+        cancelling the consuming task stops it too.
+
+        Yields:
+            FrameRecord of each region of each captured frame
+        """
+        scheduler = self.autoshot.make_scheduler()
+        self.autoshot.scheduler = scheduler
+        try:
+            while not self._closed:
+                deadline = scheduler.next_deadline()
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if self._closed:
+                        break
+                scheduler.mark_tick(deadline)
+                records = await self._run(self._cycle, True)
+                for record in records or ():
+                    if self.duplicates or not record.is_duplicate:
+                        yield record
+        finally:
+            scheduler.stop()
+
+    async def aclose(self):
+        """
+        Stop frames(), wait for the work in progress, then stop retention,
+        flush the open archive segments and shut down the private executor
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._lock is not None:
+            # Also waits for a cycle another task is still awaiting
+            async with self._lock:
+                await self._finish_in_flight()
+        self.autoshot.stop_retention()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.autoshot.flush)
+        if self._own_executor:
+            self._executor.shutdown()
@@ -0,0 +1,229 @@
+"""
+Batch Hash Module
+Vectorized aHash, dHash and pHash over a whole batch of frames
+
+The results are bit-identical to imagehash.average_hash, imagehash.dhash
+and imagehash.phash. To get there, the Lanczos resize reproduces Pillow's
+fixed-point arithmetic exactly.
+"""
+import math
+from functools import lru_cache
+from typing import Sequence, Union
+
+import numpy as np
+from PIL import Image
+
+
+ALGORITHMS = ("ahash", "dhash", "phash")
+
+# Pillow's 8-bit resampling keeps filter coefficients as fixed point
+# integers with this many fractional bits (Resample.c)
+PRECISION_BITS = 32 - 8 - 2
+LANCZOS_SUPPORT = 3.0
+
+Frames = Union[np.ndarray, Sequence[Image.Image]]
+
+
+def _sinc(x: float) -> float:
+    if x == 0.0:
+        return 1.0
+    x = x * math.pi
+    return math.sin(x) / x
+
+
+def _lanczos(x: float) -> float:
+    if -3.0 <= x < 3.0:
+        return _sinc(x) * _sinc(x / 3)
+    return 0.0
+
+
+@lru_cache(maxsize=64)
+def _resample_matrix(in_size: int, out_size: int) -> np.ndarray:
+    """
+    Fixed-point Lanczos weights as an (out_size, in_size) matrix
+
+    Mirrors precompute_coeffs() and normalize_coeffs_8bpp() in Pillow.
+    """
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = LANCZOS_SUPPORT * filterscale
+    matrix = np.zeros((out_size, in_size), dtype=np.float64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        ss = 1.0 / filterscale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size) - xmin
+        weights = [_lanczos((x + xmin - center + 0.5) * ss) for x in range(xmax)]
+        total = sum(weights)
+        for x, w in enumerate(weights):
+            if total != 0.0:
+                w /= total
+            if w < 0:
+                matrix[xx, xmin + x] = int(-0.5 + w * (1 << PRECISION_BITS))
+            else:
+                matrix[xx, xmin + x] = int(0.5 + w * (1 << PRECISION_BITS))
+    return matrix
+
+
+@lru_cache(maxsize=64)
+def _split_resample_matrix(in_size: int, out_size: int):
+    """
+    Split the fixed-point weights into small signed parts for float32 matmul
+
+    float32 is only exact below 2**24, and a 22-bit weight times 255 times
+    hundreds of taps is far above that. Each weight is written as
+    sum(part_i << shift_i) with parts small enough that every partial sum
+    of 255 * part * in_size stays exact in float32.
+
+    Returns:
+        Tuple of (float32 matrix of shape (in_size, parts * out_size), shifts)
+    """
+    weights = _resample_matrix(in_size, out_size).T.astype(np.int64)
+    max_part = max(1, (1 << 24) // (255 * in_size))
+    step = max(1, max_part.bit_length())
+    shifts = []
+    parts = []
+    remaining = weights
+    shift = PRECISION_BITS + 1
+    while np.any(remaining):
+        shift = max(shift - step, 0)
+        part = np.round(remaining / (1 << shift)).astype(np.int64)
+        remaining = remaining - (part << shift)
+        shifts.append(shift)
+        parts.append(part)
+    if not parts:
+        return np.zeros((in_size, out_size), dtype=np.float32), (0,)
+    return np.concatenate(parts, axis=1).astype(np.float32), tuple(shifts)
+
+
+def _resample_horizontal(gray: np.ndarray, width: int) -> np.ndarray:
+    n, height, in_width = gray.shape
+    matrix, shifts = _split_resample_matrix(in_width, width)
+    partial = (gray.reshape(-1, in_width).astype(np.float32) @ matrix).astype(np.float64)
+    acc = np.zeros((partial.shape[0], width), dtype=np.float64)
+    for i, shift in enumerate(shifts):
+        acc += partial[:, i * width:(i + 1) * width] * (1 << shift)
+    return _clip8(acc).reshape(n, height, width)
+
+
+def _clip8(acc: np.ndarray) -> np.ndarray:
+    # All products and partial sums are integers below 2**53, so the float64
+    # accumulation is exact and this matches Pillow's integer clip8()
+    acc = np.floor((acc + (1 << (PRECISION_BITS - 1))) / (1 << PRECISION_BITS))
+    return np.clip(acc, 0, 255)
+
+
+def resize_lanczos(gray: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Resize a batch of grayscale frames the way Image.resize(LANCZOS) does
+
+    Args:
+        gray: Array of shape (N, H, W), dtype uint8
+        width: Output width
+        height: Output height
+
+    Returns:
+        Array of shape (N, height, width), dtype uint8
+    """
+    _, in_height, in_width = gray.shape
+    out = gray
+    # Pillow resizes horizontally first, rounding to 8 bits in between
+    if in_width != width:
+        out = _resample_horizontal(gray, width)
+    if in_height != height:
+        out = _clip8(np.matmul(_resample_matrix(in_height, height), out))
+    return out.astype(np.uint8)
+
+
+def to_grayscale(frames: Frames) -> np.ndarray:
+    """
+    Convert a batch of frames to 8-bit grayscale like Image.convert('L')
+
+    Args:
+        frames: Sequence of same-sized PIL Images, or an array of shape
+            (N, H, W) (already grayscale) or (N, H, W, 3|4) (RGB/RGBA)
+
+    Returns:
+        Array of shape (N, H, W), dtype uint8
+    """
+    if isinstance(frames, np.ndarray):
+        if frames.ndim == 3:
+            return frames.astype(np.uint8, copy=False)
+        if frames.shape[-1] == 4:
+            frames = frames[..., :3]
+        frames = [Image.fromarray(np.ascontiguousarray(frame), "RGB") for frame in frames]
+    # Pillow's per-pixel luma loop is faster than any NumPy formulation of
+    # the same integer math and is the reference result by definition
+    return np.stack([np.asarray(frame if frame.mode == "L" else frame.convert("L")) for frame in frames])
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """
+    Pack (N, h, w) boolean hash matrices into integers
+
+    Bits are taken row-major, most significant first, which is the order
+    str(ImageHash) uses, so the result equals hash_to_int() of the ImageHash.
+
+    Args:
+        bits: Boolean array of shape (N, h, w) with h * w == 64
+
+    Returns:
+        Array of shape (N,), dtype uint64
+    """
+    flat = bits.reshape(len(bits), -1)
+    if flat.shape[1] != 64:
+        raise ValueError("Only 64-bit hashes can be packed into uint64")
+    return np.packbits(flat, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def average_hash_batch(gray: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    pixels = resize_lanczos(gray, hash_size, hash_size)
+    avg = pixels.mean(axis=(1, 2), keepdims=True)
+    return pack_bits(pixels > avg)
+
+
+def dhash_batch(gray: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    pixels = resize_lanczos(gray, hash_size + 1, hash_size)
+    return pack_bits(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def phash_batch(gray: np.ndarray, hash_size: int = 8, highfreq_factor: int = 4) -> np.ndarray:
+    # imagehash uses scipy.fftpack's DCT; the same routine over the batch
+    # axes keeps the low-frequency coefficients (and the median ties) identical
+    import scipy.fftpack
+
+    img_size = hash_size * highfreq_factor
+    pixels = resize_lanczos(gray, img_size, img_size)
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=1), axis=2)
+    low = dct[:, :hash_size, :hash_size]
+    med = np.median(low, axis=(1, 2), keepdims=True)
+    return pack_bits(low > med)
+
+
+_HASHERS = {
+    "ahash": average_hash_batch,
+    "dhash": dhash_batch,
+    "phash": phash_batch,
+}
+
+
+def batch_hash(frames: Frames, algorithm: str = "ahash") -> np.ndarray:
+    """
+    Hash a batch of frames
+
+    Args:
+        frames: Sequence of same-sized PIL Images, or an array of shape
+            (N, H, W) or (N, H, W, 3|4)
+        algorithm: One of "ahash", "dhash" or "phash"
+
+    Returns:
+        Array of shape (N,), dtype uint64
+
+    Raises:
+        ValueError: If the algorithm is unknown
+    """
+    if algorithm not in _HASHERS:
+        raise ValueError(f"Unknown hash algorithm '{algorithm}', expected one of {ALGORITHMS}")
+    if len(frames) == 0:
+        return np.empty(0, dtype=np.uint64)
+    return _HASHERS[algorithm](to_grayscale(frames))
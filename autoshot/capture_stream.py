@@ -0,0 +1,372 @@
+"""
+Capture Stream Module
+Per-region output: dedupe state, saving and counters
+"""
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from imagehash import ImageHash
+
+from .archive import DEFAULT_SEGMENT_SIZE
+from .change_gate import ChangeGate, ChangeResult
+from .encoder import ImageEncoder
+from .image_processor import ImageProcessor
+from .metrics import FRAMES, QUIET, Histogram, MetricsRegistry, log
+from .retention import RetentionManager, RetentionPolicy
+from .roi import Region
+from .similarity_detector import TIERS, SimilarityDetector, Verifier, hash_to_int
+
+
+class CaptureStream:
+    def __init__(self, region: Region, output_dir: str, change_gate: Optional[ChangeGate] = None,
+                 encoder: Optional[ImageEncoder] = None, storage: str = "files",
+                 segment_size: int = DEFAULT_SEGMENT_SIZE, keyframe_interval: int = 1,
+                 retention: Optional[RetentionPolicy] = None, exact_match: bool = True,
+                 verifier: Optional[Verifier] = None):
+        """
+        Output stream of one capture region
+
+        Each stream has its own output directory, frame index and dedupe
+        state, so regions that change independently are deduped independently.
+
+        Args:
+            region: Region this stream captures
+            output_dir: Directory to save the region's frames to
+            change_gate: Gate that lets frames identical to the previous one
+                skip hashing (optional, every frame is hashed if None)
+            encoder: Output format and settings (optional, defaults to PNG)
+            storage: "files" (one image per frame), "archive" (segment files)
+                or "transcript" (scrolling frames stitched into tall tiles)
+            segment_size: Size in bytes at which an archive segment is closed
+            keyframe_interval: Frames per keyframe in an archive; the frames
+                in between are stored as changed tiles (default 1, no deltas)
+            retention: Limits on the frames kept in output_dir, enforced in
+                the background once start_retention() is called (optional,
+                file storage only)
+            exact_match: Look up a digest of the pixels before hashing, so
+                frames identical to an accepted one skip the hash (default True)
+            verifier: Finer check of frames whose hash is close to an
+                accepted frame's (optional, see SimilarityDetector)
+        """
+        self.region = region
+        self.change_gate = change_gate
+        # Dirty tiles of the last checked frame, for later stages
+        self.last_change: Optional[ChangeResult] = None
+        self.image_processor = ImageProcessor(output_dir, encoder, storage, segment_size, keyframe_interval)
+        self.similarity_detector = SimilarityDetector(exact_match=exact_match, verifier=verifier)
+        self.image_processor.open_index(self.similarity_detector.hash_image)
+        self.retention: Optional[RetentionManager] = None
+        if retention is not None and retention.enabled:
+            self.retention = RetentionManager(self.image_processor, self.similarity_detector, retention)
+
+        self.timers = {name: Histogram() for name in ("check", "save")}
+
+        self._last_hash_loaded = False
+        self._last_saved_size = 0
+        # Turns of frames saved by a pool of threads that must reach the disk in capture order
+        self._turns = threading.Condition()
+        self._next_turn = 0
+        self._serving_turn = 0
+        self.frames_saved = 0
+        self.frames_skipped = 0
+        self.bytes_written = 0
+        self.bytes_not_written = 0
+
+    def process(self, image: Image.Image) -> Tuple[bool, Optional[str]]:
+        """
+        Dedupe a cropped frame in memory and save it only if it is new
+
+        The frame is hashed and compared with the cached hash of the last
+        accepted frame and with the hash history of all accepted frames,
+        so a duplicate costs one hash and no disk I/O.
+
+        Args:
+            image: Cropped PIL Image
+
+        Returns:
+            Tuple of (is_duplicate, saved path or None)
+        """
+        is_duplicate, phash = self.check(image)
+        if is_duplicate:
+            return True, None
+        return False, self.keep(image, phash)
+
+    def check(self, image: Image.Image) -> Tuple[bool, ImageHash]:
+        """
+        Hash a frame and check it against the dedupe state, without saving
+
+        Duplicates are counted as skipped; new frames are not accepted until
+        accept() is called. With a change gate, a frame identical to the
+        previous one is a duplicate without being hashed (its hash is None):
+        the previous frame was either a duplicate itself or accepted.
+
+        Args:
+            image: Cropped PIL Image
+
+        Returns:
+            Tuple of (is_duplicate, hash of the frame or None)
+        """
+        start = time.perf_counter()
+        if self.gate(image):
+            return True, None
+        is_duplicate, phash = self.similarity_detector.is_duplicate(image)
+        self._count_check(is_duplicate, start)
+        return is_duplicate, phash
+
+    def gate(self, image: Image.Image) -> bool:
+        """
+        Run only the change gate on a frame
+
+        A frame the gate stops is counted as a skipped duplicate. Frames that
+        pass must be checked next, with check_hashed().
+
+        Args:
+            image: Cropped PIL Image
+
+        Returns:
+            True if the frame is unchanged (a duplicate)
+        """
+        start = time.perf_counter()
+        self._load_history()
+        if self.change_gate is None:
+            return False
+        self.last_change = self.change_gate.check(image)
+        if self.last_change.changed:
+            return False
+        self._count_check(True, start)
+        return True
+
+    def check_hashed(self, phash: ImageHash, digest: Optional[bytes] = None,
+                     signature: Optional[np.ndarray] = None) -> Tuple[bool, ImageHash]:
+        """
+        Check a frame whose hash was computed elsewhere, e.g. in a worker process
+
+        Args:
+            phash: Hash of the frame
+            digest: Pixel digest for the exact tier (optional)
+            signature: Verifier signature (optional)
+
+        Returns:
+            Tuple of (is_duplicate, hash of the frame)
+        """
+        start = time.perf_counter()
+        self._load_history()
+        is_duplicate, phash = self.similarity_detector.is_duplicate_hashed(phash, digest, signature)
+        self._count_check(is_duplicate, start)
+        return is_duplicate, phash
+
+    def _load_history(self):
+        if not self._last_hash_loaded:
+            # One-time directory scan so a restart doesn't store the last frame twice
+            self.similarity_detector.load_last_hash(
+                str(self.image_processor.output_dir), self.image_processor.index,
+                "*" + self.image_processor.encoder.extension
+            )
+            if self.image_processor.index is not None:
+                self.similarity_detector.load_history(self.image_processor.index)
+            self._last_hash_loaded = True
+
+    def _count_check(self, is_duplicate: bool, start: float):
+        if is_duplicate:
+            self.frames_skipped += 1
+            # The encoded size of a duplicate is close to that of the frame it matched
+            self.bytes_not_written += self._last_saved_size
+        self.timers["check"].record(time.perf_counter() - start)
+
+    def keep(self, image: Image.Image, phash: ImageHash) -> Optional[str]:
+        """
+        Save a frame that check() found new and make it the dedupe reference
+
+        Args:
+            image: Cropped PIL Image
+            phash: Hash returned by check()
+
+        Returns:
+            Path to saved image or None if failed
+        """
+        saved_path = self.save(image, hash_to_int(phash))
+        if saved_path is not None:
+            self.accept(phash)
+        elif self.change_gate is not None:
+            # Not kept, so an identical next frame must not be gated as already handled
+            self.change_gate.reset()
+        return saved_path
+
+    def accept(self, phash: ImageHash):
+        """
+        Make a frame the new reference for dedupe
+
+        Args:
+            phash: Hash of the frame being kept
+        """
+        self.similarity_detector.accept(phash, int(time.time() * 1000))
+
+    def reject(self, hash_value: int):
+        """
+        Undo accept() for a frame whose save failed, so the screen is saved
+        again when it reappears
+
+        Called by the saving thread; the dedupe state drops the hash on its
+        next check.
+
+        Args:
+            hash_value: 64-bit hash of the frame
+        """
+        self.similarity_detector.discard(hash_value)
+        if self.change_gate is not None:
+            self.change_gate.reset()
+
+    def take_turn(self) -> Optional[int]:
+        """
+        Number a new frame that will be saved by one of several threads
+
+        Deltas and transcripts depend on the previous frame, so a stream that
+        needs raw frames must save them in the order they were taken. Called
+        by the one thread deciding the stream's frames, in capture order.
+
+        Returns:
+            Turn to pass to save(), or None if the stream can save in any order
+        """
+        if not self.image_processor.needs_raw_frames:
+            return None
+        with self._turns:
+            turn = self._next_turn
+            self._next_turn += 1
+            return turn
+
+    def cancel_turn(self, turn: Optional[int]):
+        """
+        Give back the last turn taken, for a frame that was never handed to a saving thread
+
+        Args:
+            turn: Turn returned by take_turn()
+        """
+        if turn is not None:
+            with self._turns:
+                self._next_turn = turn
+
+    def save(self, image: Image.Image, hash_value: Optional[int] = None,
+             turn: Optional[int] = None) -> Optional[str]:
+        """
+        Save a cropped frame under a unique filename and update the write counters
+
+        Args:
+            image: Cropped PIL Image
+            hash_value: Hash of the frame, recorded in the frame index (optional)
+            turn: Turn from take_turn(); waits until the frames of the earlier
+                turns are saved (optional)
+
+        Returns:
+            Path to saved image or None if failed
+        """
+        if turn is None:
+            return self._save(image, hash_value)
+        with self._turns:
+            self._turns.wait_for(lambda: self._serving_turn == turn)
+            try:
+                return self._save(image, hash_value)
+            finally:
+                self._serving_turn += 1
+                self._turns.notify_all()
+
+    def _save(self, image: Image.Image, hash_value: Optional[int]) -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            saved_path, size = self.image_processor.save_frame(image, hash_value)
+        except Exception as e:
+            log(f"Error saving screenshot: {e}", QUIET)
+            return None
+        self.timers["save"].record(time.perf_counter() - start)
+
+        self._count_saved(saved_path, size)
+        return saved_path
+
+    def save_encoded(self, data: bytes, hash_value: Optional[int] = None) -> Optional[str]:
+        """
+        Save a frame already encoded with the stream's encoder under a unique filename
+
+        Args:
+            data: Encoded file contents
+            hash_value: Hash of the frame, recorded in the frame index (optional)
+
+        Returns:
+            Path to saved image or None if failed
+        """
+        start = time.perf_counter()
+        try:
+            filename = self.image_processor.create_unique_filename()
+            saved_path = self.image_processor.save_encoded(data, filename, hash_value)
+        except Exception as e:
+            log(f"Error saving screenshot: {e}", QUIET)
+            return None
+        self.timers["save"].record(time.perf_counter() - start)
+
+        self._count_saved(saved_path, len(data))
+        return saved_path
+
+    def _count_saved(self, saved_path: str, size: int):
+        log(f"Screenshot saved: {saved_path}", FRAMES)
+        self._last_saved_size = size
+        self.frames_saved += 1
+        self.bytes_written += self._last_saved_size
+
+    def register_metrics(self, registry: MetricsRegistry, labels: dict):
+        """
+        Register the counters, index size and stage latencies of this stream
+
+        Args:
+            registry: Registry to add the metrics to
+            labels: Labels of this stream, e.g. {"region": name}
+        """
+        registry.counter("autoshot_frames_saved_total", "Frames saved", labels, lambda: self.frames_saved)
+        registry.counter("autoshot_frames_skipped_total", "Frames skipped as duplicates", labels,
+                         lambda: self.frames_skipped)
+        registry.counter("autoshot_bytes_written_total", "Bytes of saved frames", labels, lambda: self.bytes_written)
+        registry.gauge("autoshot_index_frames", "Frames in the output directory's index", labels,
+                       lambda: len(self.image_processor.index) if self.image_processor.index is not None else 0)
+        for name, timer in self.timers.items():
+            registry.histogram("autoshot_stage_seconds", "Latency of each capture stage",
+                               {**labels, "stage": name}, timer)
+        detector = self.similarity_detector
+        for tier in TIERS:
+            tier_labels = {**labels, "tier": tier}
+            registry.counter("autoshot_dedupe_checks_total", "Frames that reached each dedupe tier", tier_labels,
+                             lambda tier=tier: detector.tier_checks[tier])
+            registry.counter("autoshot_dedupe_hits_total", "Duplicates found by each dedupe tier", tier_labels,
+                             lambda tier=tier: detector.tier_hits[tier])
+            registry.histogram("autoshot_dedupe_tier_seconds", "Latency of each dedupe tier", tier_labels,
+                               detector.tier_timers[tier])
+        if self.retention is not None:
+            registry.counter("autoshot_frames_evicted_total", "Frames removed by the retention policy", labels,
+                             lambda: self.retention.frames_evicted)
+            registry.gauge("autoshot_stored_bytes", "Bytes of the frames in the output directory", labels,
+                           lambda: self.retention.index.total_bytes)
+
+    def stats(self) -> dict:
+        """
+        Get dedupe and write counters of this stream
+
+        Returns:
+            Dictionary of counter name to value
+        """
+        transcript = self.image_processor.transcript
+        return {
+            "frames_saved": self.frames_saved,
+            "frames_skipped": self.frames_skipped,
+            "bytes_written": self.bytes_written,
+            "bytes_not_written": self.bytes_not_written,
+            "history_matches": self.similarity_detector.history_matches,
+            "gate_checks": self.change_gate.checks if self.change_gate else 0,
+            "gate_unchanged": self.change_gate.unchanged if self.change_gate else 0,
+            "gate_ms": self.change_gate.seconds * 1000 if self.change_gate else 0.0,
+            "transcript_rows": transcript.rows_appended if transcript else 0,
+            "transcript_breaks": transcript.breaks if transcript else 0,
+            "scroll_ms": transcript.detector.seconds * 1000 if transcript else 0.0,
+            "frames_evicted": self.retention.frames_evicted if self.retention else 0,
+            "bytes_evicted": self.retention.bytes_evicted if self.retention else 0,
+            "hashes_discarded": self.similarity_detector.hashes_discarded,
+            **self.similarity_detector.tier_stats(),
+        }
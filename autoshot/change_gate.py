@@ -0,0 +1,139 @@
+"""
+Change Gate Module
+Cheap frame-to-frame change detection in front of hashing
+"""
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .roi import Box
+
+
+class ChangeResult:
+    def __init__(self, changed: bool, dirty_tiles: List[Box], grid: Tuple[int, int]):
+        """
+        Outcome of one change-gate check
+
+        Args:
+            changed: False if the frame is unchanged since the previous check
+            dirty_tiles: Boxes (left, top, right, bottom) of the tiles that
+                changed, in frame pixels; all tiles when there was no reference
+            grid: Tile grid size as (columns, rows)
+        """
+        self.changed = changed
+        self.dirty_tiles = dirty_tiles
+        self.grid = grid
+
+    @property
+    def dirty_fraction(self) -> float:
+        """Fraction of the tiles that changed"""
+        total = self.grid[0] * self.grid[1]
+        return len(self.dirty_tiles) / total if total else 0.0
+
+    def __repr__(self) -> str:
+        return f"ChangeResult(changed={self.changed}, dirty_tiles={len(self.dirty_tiles)}/{self.grid[0] * self.grid[1]})"
+
+
+class ChangeGate:
+    def __init__(self, tile_size: int = 64):
+        """
+        Detect whether a frame changed since the previous one, per tile
+
+        The unchanged check is a single comparison of the raw pixel buffers,
+        so an unchanged frame costs about one memcpy and skips grayscale
+        conversion and hashing. Only changed frames pay for locating the
+        dirty tiles, which compares the buffers eight bytes at a time.
+
+        Args:
+            tile_size: Tile edge in pixels; changes are reported per tile
+
+        Raises:
+            ValueError: If tile_size is not positive
+        """
+        if tile_size <= 0:
+            raise ValueError("tile_size must be positive")
+        self.tile_size = tile_size
+        self._reference: Optional[bytes] = None
+        self._reference_key: Optional[tuple] = None
+
+        self.checks = 0
+        self.unchanged = 0
+        self.seconds = 0.0
+
+    def check(self, image: Image.Image) -> ChangeResult:
+        """
+        Compare a frame with the previous checked frame and make it the new reference
+
+        Args:
+            image: Frame to check
+
+        Returns:
+            ChangeResult with the dirty tiles
+        """
+        start = time.perf_counter()
+        data = image.tobytes()
+        key = (image.mode, image.size)
+        width, height = image.size
+        columns = -(-width // self.tile_size)
+        rows = -(-height // self.tile_size)
+
+        # Read once: reset() may be called from a saving thread
+        reference = self._reference
+        if data == reference and key == self._reference_key:
+            result = ChangeResult(False, [], (columns, rows))
+        else:
+            if reference is None or key != self._reference_key or not data:
+                dirty = np.ones((rows, columns), dtype=bool)
+            else:
+                dirty = self._dirty_tiles(reference, data, width, height)
+            tile_rows, tile_columns = np.nonzero(dirty)
+            size = self.tile_size
+            dirty_tiles = [(int(c) * size, int(r) * size,
+                            min((int(c) + 1) * size, width), min((int(r) + 1) * size, height))
+                           for r, c in zip(tile_rows, tile_columns)]
+            result = ChangeResult(True, dirty_tiles, (columns, rows))
+            self._reference = data
+            self._reference_key = key
+
+        self.checks += 1
+        if not result.changed:
+            self.unchanged += 1
+        self.seconds += time.perf_counter() - start
+        return result
+
+    def _dirty_tiles(self, old: bytes, new: bytes, width: int, height: int) -> np.ndarray:
+        # Boolean (rows, columns) grid of tiles whose bytes differ
+        row_bytes = len(new) // height
+        tile_bytes = max(row_bytes * self.tile_size // width, 1)
+        itemsize = 8 if row_bytes % 8 == 0 and tile_bytes % 8 == 0 else 1
+        dtype = np.uint64 if itemsize == 8 else np.uint8
+        diff = (np.frombuffer(old, dtype).reshape(height, -1) !=
+                np.frombuffer(new, dtype).reshape(height, -1))
+        row_starts = np.arange(0, height, self.tile_size)
+        column_starts = np.arange(0, row_bytes // itemsize, tile_bytes // itemsize)
+        diff = np.logical_or.reduceat(diff, row_starts, axis=0)
+        columns = -(-width // self.tile_size)
+        return np.logical_or.reduceat(diff, column_starts, axis=1)[:, :columns]
+
+    def reset(self):
+        """
+        Forget the reference frame, so the next frame is reported changed
+        """
+        self._reference = None
+        self._reference_key = None
+
+    def stats(self) -> dict:
+        """
+        Get the gate's hit rate and cost
+
+        Returns:
+            Dictionary with checks, unchanged (hits), hit_rate and mean_ms
+        """
+        return {
+            "checks": self.checks,
+            "unchanged": self.unchanged,
+            "hit_rate": self.unchanged / self.checks if self.checks else 0.0,
+            "mean_ms": self.seconds / self.checks * 1000 if self.checks else 0.0,
+        }
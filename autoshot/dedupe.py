@@ -0,0 +1,433 @@
+"""
+Dedupe Module
+Offline near-duplicate clustering and removal for existing frame directories
+"""
+import argparse
+import fnmatch
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .batch_hash import ALGORITHMS
+from .frame_index import _to_signed, _to_unsigned
+from .hash_search import HashSearchIndex, popcount64
+from .similarity_detector import SimilarityDetector
+
+CHECKPOINT_FILENAME = ".autoshot_dedupe.sqlite"
+KEEP_POLICIES = ("newest", "oldest", "largest")
+
+_detectors = {}
+
+
+def hash_files(paths: List[str], algorithm: str = "ahash") -> List[Optional[int]]:
+    """
+    Decode and hash image files; runs in a worker process
+
+    Args:
+        paths: Image files
+        algorithm: "ahash", "dhash" or "phash"
+
+    Returns:
+        64-bit hash per file, None if it can't be read as an image
+    """
+    if algorithm not in _detectors:
+        _detectors[algorithm] = SimilarityDetector(search_history=False, hash_algorithm=algorithm)
+    detector = _detectors[algorithm]
+    hashes = []
+    for path in paths:
+        try:
+            with Image.open(path) as image:
+                hashes.append(detector.hash_image(image))
+        except Exception:
+            hashes.append(None)
+    return hashes
+
+
+class DedupeCheckpoint:
+    def __init__(self, path: str, algorithm: str):
+        """
+        Hashes computed so far, so an interrupted run picks up where it stopped
+
+        A file is rehashed only if its size or mtime changed. Switching the
+        hash algorithm discards the stored hashes.
+
+        Args:
+            path: SQLite file of the checkpoint
+            algorithm: Hash algorithm of the stored hashes
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash INTEGER,
+                hashed INTEGER NOT NULL DEFAULT 0,
+                seen INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'algorithm'").fetchone()
+        with self._conn:
+            if row is not None and row[0] != algorithm:
+                self._conn.execute("UPDATE files SET hash = NULL, hashed = 0")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('algorithm', ?)", (algorithm,))
+
+    def mark_seen(self, entries: List[Tuple[str, int, float]], run: int) -> List[Tuple[str, int, float]]:
+        """
+        Record files found by a scan
+
+        Args:
+            entries: (path, size, mtime) of each file
+            run: Id of the current run
+
+        Returns:
+            The entries that still need hashing (new or changed)
+        """
+        placeholders = ",".join("?" * len(entries))
+        known = {path: (size, mtime, hashed) for path, size, mtime, hashed in self._conn.execute(
+            f"SELECT path, size, mtime, hashed FROM files WHERE path IN ({placeholders})",
+            [entry[0] for entry in entries])}
+        pending = [entry for entry in entries
+                   if entry[0] not in known or known[entry[0]] != (entry[1], entry[2], 1)]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO files (path, size, mtime, seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET seen = excluded.seen, "
+                "hashed = CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN hashed ELSE 0 END, "
+                "size = excluded.size, mtime = excluded.mtime",
+                [(path, size, mtime, run) for path, size, mtime in entries])
+        return pending
+
+    def record(self, paths: List[str], hashes: List[Optional[int]]):
+        """
+        Store the hashes of files
+
+        Args:
+            paths: Files
+            hashes: Hash of each file, None if it isn't an image
+        """
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE files SET hash = ?, hashed = 1 WHERE path = ?",
+                [(None if h is None else _to_signed(h), path) for path, h in zip(paths, hashes)])
+
+    def prune(self, run: int) -> int:
+        """
+        Forget files that the scan of this run didn't find
+
+        Returns:
+            Number of entries removed
+        """
+        with self._conn:
+            return self._conn.execute("DELETE FROM files WHERE seen != ?", (run,)).rowcount
+
+    def arrays(self, chunk_size: int = 65536) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Load the hashed image files as packed arrays, in rowid order
+
+        Returns:
+            Tuple of (rowids, uint64 hashes, mtimes, sizes)
+        """
+        parts = []
+        cursor = self._conn.execute(
+            "SELECT rowid, hash, mtime, size FROM files WHERE hashed = 1 AND hash IS NOT NULL ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            rowids, hashes, mtimes, sizes = zip(*rows)
+            parts.append((np.array(rowids, dtype=np.int64),
+                          np.array([_to_unsigned(h) for h in hashes], dtype=np.uint64),
+                          np.array(mtimes, dtype=np.float64), np.array(sizes, dtype=np.int64)))
+        if not parts:
+            return (np.empty(0, np.int64), np.empty(0, np.uint64), np.empty(0, np.float64), np.empty(0, np.int64))
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def paths(self, chunk_size: int = 65536) -> Iterator[Tuple[int, str, int]]:
+        """
+        Stream (rowid, path, size) of the hashed image files in rowid order
+        """
+        cursor = self._conn.execute(
+            "SELECT rowid, path, size FROM files WHERE hashed = 1 AND hash IS NOT NULL ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class DirectoryDeduper:
+    def __init__(self, directory: str, radius: int = 0, keep: str = "newest", algorithm: str = "ahash",
+                 workers: Optional[int] = None, batch_size: int = 64, pattern: str = "*.png",
+                 checkpoint: Optional[str] = None):
+        """
+        Find and remove near-duplicate frames in an existing directory
+
+        The directory is streamed with os.scandir and the files are decoded
+        and hashed in a process pool, a batch at a time with a bounded number
+        of batches in flight. Hashes go to a SQLite checkpoint as they
+        arrive, so an interrupted run only hashes the remaining files when
+        restarted. Clustering works on packed arrays (about 32 bytes per
+        file) rather than Python objects, and paths are streamed back from
+        the checkpoint when the plan is applied.
+
+        Clusters are formed greedily around the files to keep: in order of
+        the keep policy, each file not yet in a cluster takes every other
+        unclustered file within the Hamming radius. Every removed file is
+        therefore within the radius of the file kept in its place; unlike
+        connected components, a slowly scrolling chat can't chain distinct
+        screens into one cluster.
+
+        Args:
+            directory: Directory of frames
+            radius: Largest Hamming distance between 64-bit hashes of duplicates
+            keep: File kept per cluster: "newest" or "oldest" (mtime), or "largest"
+            algorithm: Hash algorithm, "ahash" (as used by the capture loop), "dhash" or "phash"
+            workers: Hashing processes (default: number of CPUs)
+            batch_size: Files per hashing task
+            pattern: Glob pattern of the frame files
+            checkpoint: Checkpoint file (default: .autoshot_dedupe.sqlite in the directory)
+
+        Raises:
+            ValueError: If keep or algorithm is unknown
+        """
+        if keep not in KEEP_POLICIES:
+            raise ValueError(f"Unknown keep policy '{keep}', expected one of {KEEP_POLICIES}")
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown hash algorithm '{algorithm}', expected one of {ALGORITHMS}")
+        self.directory = Path(directory)
+        self.radius = radius
+        self.keep = keep
+        self.algorithm = algorithm
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.pattern = pattern
+        self.checkpoint = DedupeCheckpoint(checkpoint or str(self.directory / CHECKPOINT_FILENAME), algorithm)
+
+        self.files_scanned = 0
+        self.files_hashed = 0
+
+    def _scan_batches(self, run: int) -> Iterator[List[Tuple[str, int, float]]]:
+        batch = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not fnmatch.fnmatch(entry.name, self.pattern) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                batch.append((entry.path, stat.st_size, stat.st_mtime))
+                if len(batch) >= self.batch_size:
+                    self.files_scanned += len(batch)
+                    yield self.checkpoint.mark_seen(batch, run)
+                    batch = []
+        if batch:
+            self.files_scanned += len(batch)
+            yield self.checkpoint.mark_seen(batch, run)
+
+    def scan(self) -> int:
+        """
+        Hash the files that are new or changed since the checkpoint
+
+        Returns:
+            Number of files hashed
+        """
+        run = time.time_ns()
+        hashed_before = self.files_hashed
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = deque()
+            for pending in self._scan_batches(run):
+                if not pending:
+                    continue
+                paths = [entry[0] for entry in pending]
+                in_flight.append((paths, pool.submit(hash_files, paths, self.algorithm)))
+                # Bound the memory held by queued batches, however big the directory
+                while len(in_flight) > 2 * self.workers:
+                    self._collect(*in_flight.popleft())
+            while in_flight:
+                self._collect(*in_flight.popleft())
+        self.checkpoint.prune(run)
+        return self.files_hashed - hashed_before
+
+    def _collect(self, paths: List[str], future):
+        self.checkpoint.record(paths, future.result())
+        self.files_hashed += len(paths)
+
+    def cluster(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Group the hashed files into clusters of near-duplicates
+
+        Returns:
+            Tuple of (rowids, cluster leader position per file, distance to
+            the leader per file, sizes), in rowid order; a file with itself
+            as leader is kept
+        """
+        rowids, hashes, mtimes, sizes = self.checkpoint.arrays()
+        if len(rowids) == 0:
+            return rowids, np.empty(0, np.int64), np.empty(0, np.uint8), sizes
+
+        # Preference order of the keep policy; ties go to the first file found
+        if self.keep == "newest":
+            order = np.lexsort((np.arange(len(rowids)), -mtimes))
+        elif self.keep == "oldest":
+            order = np.lexsort((np.arange(len(rowids)), mtimes))
+        else:
+            order = np.lexsort((np.arange(len(rowids)), -sizes))
+
+        # Files with equal hashes are settled together: the best of them
+        # stands for all, so big exact-duplicate groups cost one query
+        unique, first, inverse = np.unique(hashes[order], return_index=True, return_inverse=True)
+        best_file = order[first]
+        leader_of_unique = np.full(len(unique), -1, dtype=np.int64)
+        index = HashSearchIndex(len(unique))
+        index.extend(unique)
+        index.build()
+        for u in np.argsort(first, kind="stable"):
+            if leader_of_unique[u] >= 0:
+                continue
+            positions, _ = index.query(int(unique[u]), self.radius)
+            leader_of_unique[positions] = best_file[u]
+            index.remove(positions)
+
+        leaders = np.empty(len(rowids), dtype=np.int64)
+        leaders[order] = leader_of_unique[inverse]
+        distances = popcount64(hashes ^ hashes[leaders])
+        return rowids, leaders, distances, sizes
+
+    def apply(self, dry_run: bool = True, report: Optional[str] = None) -> dict:
+        """
+        Remove the duplicates found by cluster(), or only report them
+
+        Args:
+            dry_run: Report without deleting anything
+            report: File to write one JSON line per duplicate to: its path,
+                the path kept in its place, their distance and its size (optional)
+
+        Returns:
+            Dictionary with files, clusters, duplicates, bytes (of the
+            duplicates) and removed
+        """
+        rowids, leaders, distances, sizes = self.cluster()
+        is_leader = leaders == np.arange(len(leaders))
+        duplicated = np.zeros(len(leaders), dtype=bool)
+        duplicated[leaders[~is_leader]] = True
+        summary = {
+            "files": int(len(rowids)),
+            "clusters": int(is_leader.sum()),
+            "duplicates": int((~is_leader).sum()),
+            "bytes": int(sizes[~is_leader].sum()),
+            "removed": 0,
+        }
+
+        # Paths are streamed from the checkpoint twice: the kept file of each
+        # cluster with duplicates first, then the duplicates themselves
+        kept = {}
+        for position, (_, path, _) in enumerate(self.checkpoint.paths()):
+            if duplicated[position]:
+                kept[position] = path
+
+        out = open(report, "w", encoding="utf-8") if report else None
+        try:
+            # Counted, not collected: a large archive can have millions of duplicates
+            removed = 0
+            for position, (_, path, size) in enumerate(self.checkpoint.paths()):
+                if is_leader[position]:
+                    continue
+                leader = int(leaders[position])
+                if out is not None:
+                    out.write(json.dumps({"path": path, "keep": kept[leader],
+                                          "distance": int(distances[position]), "size": size}) + "\n")
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            summary["removed"] = removed
+        finally:
+            if out is not None:
+                out.close()
+        return summary
+
+    def run(self, dry_run: bool = True, report: Optional[str] = None) -> dict:
+        """
+        Scan, cluster and apply in one go
+
+        Returns:
+            Summary of apply() plus scanned and hashed file counts
+        """
+        self.scan()
+        summary = self.apply(dry_run, report)
+        summary.update(scanned=self.files_scanned, hashed=self.files_hashed)
+        return summary
+
+    def close(self):
+        """
+        Close the checkpoint
+        """
+        self.checkpoint.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the parser of the dedupe command
+
+    Returns:
+        argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog="autoshot dedupe",
+                                     description="Remove near-duplicate frames from an existing directory")
+    parser.add_argument("directory", help="Directory of frames")
+    parser.add_argument("--radius", type=int, default=0,
+                        help="Largest Hamming distance between the 64-bit hashes of duplicates (default: 0)")
+    parser.add_argument("--keep", choices=KEEP_POLICIES, default="newest",
+                        help="File kept per cluster (default: newest)")
+    parser.add_argument("--hash", choices=ALGORITHMS, default="ahash", dest="algorithm",
+                        help="Hash algorithm (default: ahash, as used by the capture loop)")
+    parser.add_argument("--workers", type=int, help="Hashing processes (default: number of CPUs)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Files per hashing task (default: 64)")
+    parser.add_argument("--pattern", default="*.png", help="Glob pattern of the frame files (default: *.png)")
+    parser.add_argument("--checkpoint", help=f"Checkpoint file (default: DIRECTORY/{CHECKPOINT_FILENAME})")
+    parser.add_argument("--dry-run", action="store_true", help="Report the duplicates without deleting them")
+    parser.add_argument("--report", metavar="PATH", help="Write one JSON line per duplicate to PATH")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: autoshot dedupe DIR
+    """
+    args = build_parser().parse_args(argv)
+    deduper = DirectoryDeduper(args.directory, args.radius, args.keep, args.algorithm, args.workers,
+                               args.batch_size, args.pattern, args.checkpoint)
+    try:
+        start = time.monotonic()
+        summary = deduper.run(dry_run=args.dry_run, report=args.report)
+    finally:
+        deduper.close()
+    action = "would remove" if args.dry_run else "removed"
+    count = summary["duplicates"] if args.dry_run else summary["removed"]
+    print(f"{summary['scanned']} files scanned, {summary['hashed']} hashed, {summary['clusters']} clusters; "
+          f"{action} {count} duplicates ({summary['bytes']:,} bytes) in {time.monotonic() - start:.1f}s")
+    if args.report:
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
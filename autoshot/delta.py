@@ -0,0 +1,133 @@
+"""
+Delta Module
+Keyframe + changed-tile encoding of consecutive frames
+"""
+import struct
+import zlib
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .change_gate import ChangeGate
+from .encoder import ImageEncoder
+
+# Delta payload: header, then per changed tile a box, its compressed size
+# and its pixels XORed with the previous frame's, zlib-compressed
+DELTA_MAGIC = b"ASHDLT1\0"
+DELTA_HEADER = struct.Struct("<8s8sHHI")
+DELTA_TILE = struct.Struct("<HHHHI")
+
+
+class DeltaEncoder:
+    def __init__(self, encoder: ImageEncoder, keyframe_interval: int = 30, tile_size: int = 64,
+                 max_dirty_fraction: float = 0.5, zlib_level: int = 1):
+        """
+        Encode consecutive frames as keyframes and changed-tile deltas
+
+        Every keyframe_interval-th frame is a keyframe, encoded with the
+        regular encoder. In between, only the tiles that differ from the
+        previous frame are stored, XORed with the previous pixels (so the
+        unchanged pixels of a tile become zeros) and zlib-compressed. A frame
+        whose size or mode changed, or where more than max_dirty_fraction of
+        the tiles changed (e.g. the chat scrolled), becomes a keyframe too,
+        since its delta would not be smaller.
+
+        Frames must be encoded in the order they are stored: each delta is
+        relative to the frame encoded just before it.
+
+        Args:
+            encoder: Encoder for keyframes
+            keyframe_interval: Frames per keyframe; 1 makes every frame a keyframe
+            tile_size: Tile edge in pixels
+            max_dirty_fraction: Changed-tile fraction above which a keyframe is written
+            zlib_level: Compression level of the delta tiles
+
+        Raises:
+            ValueError: If keyframe_interval is less than 1
+        """
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be at least 1")
+        self.encoder = encoder
+        self.keyframe_interval = keyframe_interval
+        self.max_dirty_fraction = max_dirty_fraction
+        self.zlib_level = zlib_level
+        self._gate = ChangeGate(tile_size)
+        self._previous: Optional[Image.Image] = None
+        self._since_keyframe = 0
+
+        self.keyframes = 0
+        self.deltas = 0
+
+    def encode(self, image: Image.Image, force_keyframe: bool = False) -> Tuple[bytes, bool]:
+        """
+        Encode the next frame
+
+        Args:
+            image: Frame to encode
+            force_keyframe: Write a keyframe regardless of the interval, e.g.
+                at the start of a new archive segment
+
+        Returns:
+            Tuple of (encoded data, True if it is a delta)
+        """
+        change = self._gate.check(image)
+        previous, self._previous = self._previous, image
+        if (force_keyframe or self._since_keyframe + 1 >= self.keyframe_interval
+                or change.dirty_fraction > self.max_dirty_fraction):
+            self._since_keyframe = 0
+            self.keyframes += 1
+            return self.encoder.encode(image), False
+
+        self._since_keyframe += 1
+        self.deltas += 1
+        parts = [DELTA_HEADER.pack(DELTA_MAGIC, image.mode.encode("ascii"), *image.size, len(change.dirty_tiles))]
+        for box in change.dirty_tiles:
+            pixels = zlib.compress(_xor(image.crop(box).tobytes(), previous.crop(box).tobytes()), self.zlib_level)
+            parts.append(DELTA_TILE.pack(*box, len(pixels)))
+            parts.append(pixels)
+        return b"".join(parts), True
+
+    def reset(self):
+        """
+        Forget the previous frame, so the next one is a keyframe
+        """
+        self._gate.reset()
+        self._previous = None
+        self._since_keyframe = 0
+
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    return np.bitwise_xor(np.frombuffer(a, np.uint8), np.frombuffer(b, np.uint8)).tobytes()
+
+
+def apply_delta(base: Image.Image, payload: bytes) -> Image.Image:
+    """
+    Reconstruct a frame from the previous frame and its delta
+
+    Args:
+        base: The previous frame, exactly as reconstructed
+        payload: Delta produced by DeltaEncoder.encode()
+
+    Returns:
+        The reconstructed frame (a new image; base is not modified)
+
+    Raises:
+        ValueError: If the payload is not a delta or doesn't fit the base frame
+    """
+    magic, mode, width, height, count = DELTA_HEADER.unpack_from(payload, 0)
+    mode = mode.rstrip(b"\0").decode("ascii")
+    if magic != DELTA_MAGIC:
+        raise ValueError("Not a delta frame")
+    if (mode, (width, height)) != (base.mode, base.size):
+        raise ValueError(f"Delta for a {mode} {width}x{height} frame doesn't fit {base.mode} {base.size}")
+
+    image = base.copy()
+    offset = DELTA_HEADER.size
+    for _ in range(count):
+        left, top, right, bottom, length = DELTA_TILE.unpack_from(payload, offset)
+        offset += DELTA_TILE.size
+        pixels = _xor(zlib.decompress(payload[offset:offset + length]), base.crop((left, top, right, bottom)).tobytes())
+        offset += length
+        image.paste(Image.frombytes(mode, (right - left, bottom - top), pixels), (left, top))
+    return image
@@ -0,0 +1,106 @@
+"""
+Encoder Module
+Output formats and encoder settings for saved frames
+"""
+import io
+
+from PIL import Image
+
+
+# Format name -> (Pillow format, file extension)
+ENCODER_FORMATS = {
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    # QOI is a cheap codec in C implementations, but Pillow's writer is pure
+    # Python and slow; BMP is the fast mode, not compressed at all
+    "qoi": ("QOI", ".qoi"),
+    "bmp": ("BMP", ".bmp"),
+}
+
+
+class ImageEncoder:
+    def __init__(self, format: str = "png", compress_level: int = 6, optimize: bool = False,
+                 webp_method: int = 4):
+        """
+        Lossless encoder for saved frames
+
+        Pillow's PNG defaults (zlib level 6) are a poor fit for frames saved
+        on a tight interval: level 1 or lossless WebP at method 0 take about
+        half the time, and uncompressed BMP trades size for near-zero encode
+        time. See benchmarks/bench_encode.py for numbers on chat crops.
+
+        Args:
+            format: "png", "webp" (lossless), "qoi" or "bmp"
+            compress_level: PNG zlib level, 0 (none) to 9 (smallest)
+            optimize: Let PNG search for the smallest encoding (slow)
+            webp_method: Lossless WebP effort, 0 (fastest) to 6 (smallest)
+
+        Raises:
+            ValueError: If the format is unknown or the installed Pillow can't write it
+        """
+        if format not in ENCODER_FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {tuple(ENCODER_FORMATS)}")
+        Image.init()
+        if ENCODER_FORMATS[format][0] not in Image.SAVE:
+            raise ValueError(f"This version of Pillow can't write {format.upper()} files")
+        if not 0 <= compress_level <= 9:
+            raise ValueError("compress_level must be between 0 and 9")
+        if not 0 <= webp_method <= 6:
+            raise ValueError("webp_method must be between 0 and 6")
+        self.format = format
+        self.compress_level = compress_level
+        self.optimize = optimize
+        self.webp_method = webp_method
+
+    @property
+    def extension(self) -> str:
+        """File extension of the encoded frames, with the dot"""
+        return ENCODER_FORMATS[self.format][1]
+
+    def save_params(self) -> dict:
+        """
+        Get the keyword arguments for Image.save()
+
+        Returns:
+            Dictionary of save parameters, including the format
+        """
+        params = {"format": ENCODER_FORMATS[self.format][0]}
+        if self.format == "png":
+            params.update(compress_level=self.compress_level, optimize=self.optimize)
+        elif self.format == "webp":
+            params.update(lossless=True, method=self.webp_method)
+        return params
+
+    def encode(self, image: Image.Image) -> bytes:
+        """
+        Encode an image
+
+        Args:
+            image: PIL Image to encode
+
+        Returns:
+            Encoded file contents
+        """
+        buffer = io.BytesIO()
+        image.save(buffer, **self.save_params())
+        return buffer.getvalue()
+
+    def __repr__(self) -> str:
+        params = ", ".join(f"{k}={v}" for k, v in self.save_params().items() if k != "format")
+        return f"ImageEncoder({self.format}{', ' + params if params else ''})"
+
+
+def encode_frame(encoder: ImageEncoder, mode: str, size: tuple, data: bytes) -> bytes:
+    """
+    Encode raw pixels; runs in a worker process
+
+    Args:
+        encoder: Encoder to use
+        mode: PIL mode of the pixels
+        size: Image size as (width, height)
+        data: Raw pixel data
+
+    Returns:
+        Encoded file contents
+    """
+    return encoder.encode(Image.frombytes(mode, size, data))
@@ -0,0 +1,337 @@
+"""
+Frame Index Module
+Persistent SQLite index of the frames saved in an output directory
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+
+INDEX_FILENAME = ".autoshot_index.sqlite"
+INDEX_VERSION = "1"
+
+# A 64-bit hash is split into four 16-bit chunks, each stored in its own
+# indexed column. Two hashes within Hamming distance 3 share at least one
+# chunk exactly (pigeonhole), so near lookups are a few B-tree probes.
+CHUNK_COUNT = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# (path, timestamp, size, hash)
+FrameEntry = Tuple[str, float, int, Optional[int]]
+
+
+def _to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit, so store the hash bits as such"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: Optional[int]) -> Optional[int]:
+    if value is None:
+        return None
+    return value + (1 << 64) if value < 0 else value
+
+
+def _chunks(hash_value: Optional[int]) -> List[Optional[int]]:
+    if hash_value is None:
+        return [None] * CHUNK_COUNT
+    return [(hash_value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNK_COUNT)]
+
+
+class FrameIndex:
+    def __init__(self, directory: str, hash_func: Optional[Callable[[Image.Image], int]] = None,
+                 pattern: str = "*.png"):
+        """
+        Open (or build) the index of a frame directory
+
+        The index lives inside the directory. It remembers the directory
+        mtime it last saw; if the directory changed behind its back, or the
+        index file is missing or unreadable, it resyncs from the directory.
+
+        Args:
+            directory: Directory holding the saved frames
+            hash_func: Function returning the 64-bit hash of an image, used
+                when indexing files found on disk (optional)
+            pattern: Glob pattern of frame files
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.path = self.directory / INDEX_FILENAME
+        self.hash_func = hash_func
+        self.pattern = pattern
+        self._lock = threading.Lock()
+        self._conn = None
+        # Running totals, so retention checks don't have to scan the table
+        self.frame_count = 0
+        self.total_bytes = 0
+
+        try:
+            self._connect()
+            needs_rebuild = self._get_meta("version") != INDEX_VERSION
+        except sqlite3.DatabaseError:
+            # Corrupt index file: start over
+            self.close()
+            self.path.unlink()
+            self._connect()
+            needs_rebuild = True
+
+        if needs_rebuild:
+            self.rebuild()
+        else:
+            # sync() adjusts the totals, so they must be loaded first
+            with self._lock:
+                self._load_totals()
+            if self.is_stale():
+                self.sync()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        # TRUNCATE keeps the journal file around, so our own commits don't
+        # keep changing the directory mtime used for staleness checks
+        self._conn.execute("PRAGMA journal_mode=TRUNCATE")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS frames (
+                path TEXT PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                size INTEGER NOT NULL,
+                hash INTEGER,
+                h0 INTEGER, h1 INTEGER, h2 INTEGER, h3 INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS frames_timestamp ON frames (timestamp);
+            CREATE INDEX IF NOT EXISTS frames_h0 ON frames (h0);
+            CREATE INDEX IF NOT EXISTS frames_h1 ON frames (h1);
+            CREATE INDEX IF NOT EXISTS frames_h2 ON frames (h2);
+            CREATE INDEX IF NOT EXISTS frames_h3 ON frames (h3);
+        """)
+
+    def close(self):
+        """
+        Close the underlying database connection
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _directory_mtime(self) -> str:
+        return str(os.stat(self.directory).st_mtime_ns)
+
+    def _mark_fresh(self):
+        self._set_meta("dir_mtime", self._directory_mtime())
+
+    def is_stale(self) -> bool:
+        """
+        Check whether the directory changed since the index last saw it
+
+        Returns:
+            True if files were added or removed without going through the index
+        """
+        with self._lock:
+            return self._get_meta("dir_mtime") != self._directory_mtime()
+
+    def _hash_file(self, path: Path) -> Optional[int]:
+        if self.hash_func is None:
+            return None
+        try:
+            with Image.open(path) as image:
+                return self.hash_func(image)
+        except Exception:
+            # Skip hashing if the file can't be opened as an image
+            return None
+
+    def _load_totals(self):
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM frames").fetchone()
+        self.frame_count, self.total_bytes = count, total
+
+    def _delete(self, path: str):
+        # No DELETE ... RETURNING: it needs SQLite 3.35, older than many Python 3.8/3.9 builds link
+        row = self._conn.execute("SELECT size FROM frames WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM frames WHERE path = ?", (path,))
+            self.frame_count -= 1
+            self.total_bytes -= row[0]
+
+    def _insert(self, path: str, timestamp: float, size: int, hash_value: Optional[int]):
+        # A replaced entry must come off the totals first
+        self._delete(path)
+        self.frame_count += 1
+        self.total_bytes += size
+        self._conn.execute(
+            "INSERT OR REPLACE INTO frames (path, timestamp, size, hash, h0, h1, h2, h3) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, timestamp, size,
+             None if hash_value is None else _to_signed(hash_value),
+             *_chunks(hash_value))
+        )
+
+    def rebuild(self):
+        """
+        Drop all entries and re-index every frame file in the directory
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM frames")
+            self._set_meta("version", INDEX_VERSION)
+            self._load_totals()
+        self.sync()
+
+    def sync(self) -> Tuple[int, int]:
+        """
+        Bring the index in line with the directory contents
+
+        Returns:
+            Tuple of (entries added, entries removed)
+        """
+        on_disk = {str(p): p for p in self.directory.glob(self.pattern)}
+        with self._lock:
+            indexed = {row[0] for row in self._conn.execute("SELECT path FROM frames")}
+
+        missing = indexed - on_disk.keys()
+        added = 0
+        with self._lock, self._conn:
+            for path_str in missing:
+                self._delete(path_str)
+        for path_str in on_disk.keys() - indexed:
+            path = on_disk[path_str]
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            hash_value = self._hash_file(path)
+            with self._lock:
+                self._insert(path_str, stat.st_mtime, stat.st_size, hash_value)
+            added += 1
+        with self._lock, self._conn:
+            self._mark_fresh()
+        return added, len(missing)
+
+    def add(self, path: str, size: int, hash_value: Optional[int] = None,
+            timestamp: Optional[float] = None):
+        """
+        Record a frame that was just saved
+
+        Args:
+            path: Path of the saved frame
+            size: File size in bytes
+            hash_value: 64-bit hash of the frame (optional)
+            timestamp: Capture time, defaults to the file mtime
+        """
+        if timestamp is None:
+            timestamp = os.stat(path).st_mtime
+        with self._lock, self._conn:
+            self._insert(str(path), timestamp, size, hash_value)
+            self._mark_fresh()
+
+    def remove(self, path: str):
+        """
+        Forget a frame that was deleted
+
+        Args:
+            path: Path of the deleted frame
+        """
+        with self._lock, self._conn:
+            self._delete(str(path))
+            self._mark_fresh()
+
+    def latest(self, exclude: Optional[str] = None) -> Optional[FrameEntry]:
+        """
+        Get the most recent frame
+
+        Args:
+            exclude: Path to skip, e.g. the frame being compared (optional)
+
+        Returns:
+            Tuple of (path, timestamp, size, hash) or None if the index is empty
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, timestamp, size, hash FROM frames WHERE path != ? "
+                "ORDER BY timestamp DESC LIMIT 1",
+                ("" if exclude is None else str(exclude),)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], row[2], _to_unsigned(row[3])
+
+    def find_near(self, hash_value: int, max_distance: int = 0) -> List[Tuple[FrameEntry, int]]:
+        """
+        Find frames whose hash is within a Hamming distance of the given hash
+
+        Distances up to 3 are answered from the chunk indexes; larger ones
+        fall back to a scan of all hashes.
+
+        Args:
+            hash_value: 64-bit query hash
+            max_distance: Maximum Hamming distance (inclusive)
+
+        Returns:
+            List of ((path, timestamp, size, hash), distance), nearest first
+        """
+        with self._lock:
+            if max_distance < CHUNK_COUNT:
+                clauses = " OR ".join(f"h{i} = ?" for i in range(CHUNK_COUNT))
+                rows = self._conn.execute(
+                    f"SELECT path, timestamp, size, hash FROM frames WHERE {clauses}",
+                    _chunks(hash_value)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT path, timestamp, size, hash FROM frames WHERE hash IS NOT NULL"
+                ).fetchall()
+
+        matches = []
+        for path, timestamp, size, stored in rows:
+            stored = _to_unsigned(stored)
+            distance = bin(stored ^ hash_value).count("1")
+            if distance <= max_distance:
+                matches.append(((path, timestamp, size, stored), distance))
+        matches.sort(key=lambda m: (m[1], -m[0][1]))
+        return matches
+
+    def oldest(self, limit: int, after: Optional[float] = None) -> List[FrameEntry]:
+        """
+        Get the oldest frames, optionally those newer than a timestamp
+
+        Args:
+            limit: Maximum number of frames
+            after: Only frames with a later timestamp (optional)
+
+        Returns:
+            List of (path, timestamp, size, hash), oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, timestamp, size, hash FROM frames WHERE timestamp > ? "
+                "ORDER BY timestamp LIMIT ?",
+                (float("-inf") if after is None else after, limit)
+            ).fetchall()
+        return [(path, timestamp, size, _to_unsigned(hash_value)) for path, timestamp, size, hash_value in rows]
+
+    def entries(self) -> Iterator[FrameEntry]:
+        """
+        Iterate over all frames, oldest first
+
+        Returns:
+            Iterator of (path, timestamp, size, hash)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, timestamp, size, hash FROM frames ORDER BY timestamp"
+            ).fetchall()
+        for path, timestamp, size, hash_value in rows:
+            yield path, timestamp, size, _to_unsigned(hash_value)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
@@ -0,0 +1,368 @@
+"""
+Frame Ring Module
+Shared-memory frame slots for hashing and encoding frames in worker processes
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .encoder import ImageEncoder, encode_frame
+from .similarity_detector import HASH_FUNCTIONS, Verifier, hash_to_int, pixel_digest
+
+# Modes stored in slots as raw bytes, by bytes per pixel
+CHANNELS = {"L": 1, "RGB": 3, "RGBA": 4}
+
+# Hash, digest and verifier signature of a frame, as returned by hash_slot()
+FrameFeatures = Tuple[int, Optional[bytes], Optional[np.ndarray]]
+
+# Segment of the current ring, as attached by this worker process, by name
+_segments: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def frame_bytes(image: Image.Image) -> Optional[int]:
+    """
+    Size of an image's raw pixels in a slot
+
+    Returns:
+        Number of bytes, or None if the mode can't be stored in a slot
+    """
+    channels = CHANNELS.get(image.mode)
+    if channels is None:
+        return None
+    return image.width * image.height * channels
+
+
+def _view(name: str, offset: int, mode: str, size: Tuple[int, int]) -> np.ndarray:
+    """NumPy view of a slot's pixels, attaching the segment on first use"""
+    segment = _segments.get(name)
+    if segment is None:
+        # A new name means the pool replaced its ring (see reserve()), which it
+        # only does with every slot free: no task still reads the old segments
+        for stale in _segments.values():
+            try:
+                stale.close()
+            except BufferError:
+                pass  # Still viewed by a finished task's leftovers; unmapped once they are collected
+        _segments.clear()
+        segment = _segments[name] = shared_memory.SharedMemory(name=name)
+    width, height = size
+    shape = (height, width) if mode == "L" else (height, width, CHANNELS[mode])
+    return np.ndarray(shape, dtype=np.uint8, buffer=segment.buf, offset=offset)
+
+
+def frame_features(image: Image.Image, algorithm: str, exact: bool,
+                   verifier: Optional[Verifier]) -> FrameFeatures:
+    """
+    Compute what the dedupe cascade needs to know about a frame
+
+    Args:
+        image: Input PIL Image
+        algorithm: Hash algorithm, a key of HASH_FUNCTIONS
+        exact: Also compute the pixel digest
+        verifier: Verifier whose signature to compute (optional)
+
+    Returns:
+        Tuple of (64-bit hash, digest or None, signature or None)
+    """
+    digest = pixel_digest(image.mode, image.size, image.tobytes()) if exact else None
+    gray = image.convert("L")
+    signature = verifier.signature(gray) if verifier is not None else None
+    return hash_to_int(HASH_FUNCTIONS[algorithm](gray)), digest, signature
+
+
+def hash_slot(name: str, offset: int, mode: str, size: Tuple[int, int], algorithm: str, exact: bool,
+              verifier: Optional[Verifier]) -> FrameFeatures:
+    """
+    frame_features() of a frame in a slot; runs in a worker process
+
+    Only the slot's location goes in and the hash, digest and signature come
+    back, so a frame never crosses the process boundary.
+
+    Args:
+        name: Name of the shared memory segment
+        offset: Offset of the slot in the segment
+        mode: PIL mode of the pixels
+        size: Image size as (width, height)
+        algorithm: Hash algorithm, a key of HASH_FUNCTIONS
+        exact: Also compute the pixel digest
+        verifier: Verifier whose signature to compute (optional)
+
+    Returns:
+        Tuple of (64-bit hash, digest or None, signature or None)
+    """
+    pixels = _view(name, offset, mode, size)
+    digest = pixel_digest(mode, size, pixels) if exact else None
+    # frombuffer copies RGB (PIL stores it padded to 4 bytes), then the slot may be reused
+    image = Image.frombuffer(mode, size, pixels, "raw", mode, 0, 1)
+    gray = image.convert("L")
+    signature = verifier.signature(gray) if verifier is not None else None
+    return hash_to_int(HASH_FUNCTIONS[algorithm](gray)), digest, signature
+
+
+def encode_slot(name: str, offset: int, mode: str, size: Tuple[int, int], encoder: ImageEncoder) -> bytes:
+    """
+    Encode a frame in a slot; runs in a worker process
+
+    Args:
+        name: Name of the shared memory segment
+        offset: Offset of the slot in the segment
+        mode: PIL mode of the pixels
+        size: Image size as (width, height)
+        encoder: Encoder to use
+
+    Returns:
+        Encoded file contents
+    """
+    pixels = _view(name, offset, mode, size)
+    return encoder.encode(Image.frombuffer(mode, size, pixels, "raw", mode, 0, 1))
+
+
+class FrameRing:
+    def __init__(self, slots: int, slot_bytes: int):
+        """
+        Fixed slots of raw pixels in one shared memory segment
+
+        Args:
+            slots: Number of slots
+            slot_bytes: Size of each slot in bytes
+        """
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.segment = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._free = deque(range(slots))
+        self._frames: Dict[int, Tuple[str, Tuple[int, int]]] = {}
+        self._cond = threading.Condition()
+        self.waits = 0
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory segment, for workers to attach"""
+        return self.segment.name
+
+    def fits(self, image: Image.Image) -> bool:
+        """True if an image can be stored in a slot"""
+        size = frame_bytes(image)
+        return size is not None and size <= self.slot_bytes
+
+    def put(self, image: Image.Image, block: bool = True) -> Optional[int]:
+        """
+        Copy an image's pixels into a free slot
+
+        Args:
+            image: Image to store; must fit (see fits())
+            block: Wait for a slot to be released if none is free
+
+        Returns:
+            Slot number, or None if none was free and block is False
+        """
+        with self._cond:
+            if not self._free:
+                if not block:
+                    return None
+                self.waits += 1
+                self._cond.wait_for(lambda: self._free)
+            slot = self._free.popleft()
+        data = image.tobytes()
+        offset = slot * self.slot_bytes
+        self.segment.buf[offset:offset + len(data)] = data
+        self._frames[slot] = (image.mode, image.size)
+        return slot
+
+    def location(self, slot: int) -> Tuple[str, int, str, Tuple[int, int]]:
+        """
+        Where a slot's frame is, for a worker
+
+        Returns:
+            Tuple of (segment name, offset, mode, size)
+        """
+        mode, size = self._frames[slot]
+        return self.name, slot * self.slot_bytes, mode, size
+
+    def image(self, slot: int) -> Image.Image:
+        """Copy of the frame in a slot"""
+        _, offset, mode, size = self.location(slot)
+        width, height = size
+        return Image.frombytes(mode, size, bytes(self.segment.buf[offset:offset + width * height * CHANNELS[mode]]))
+
+    def release(self, slot: int):
+        """Make a slot free for the next frame"""
+        with self._cond:
+            self._frames.pop(slot, None)
+            self._free.append(slot)
+            self._cond.notify()
+
+    @property
+    def free(self) -> int:
+        """Number of free slots"""
+        with self._cond:
+            return len(self._free)
+
+    def close(self):
+        """Free the shared memory"""
+        self.segment.close()
+        self.segment.unlink()
+
+
+class SharedFramePool:
+    def __init__(self, workers: int = 2, slots: int = 8):
+        """
+        Process pool that hashes and encodes frames from a shared-memory ring
+
+        Pickling a multi-megabyte frame to a worker costs about as much as
+        encoding it, so frames are copied once into a FrameRing and the
+        workers read them through NumPy views; only slot locations, hashes
+        and encoded files cross the process boundary. The ring is sized
+        by the first frames (see reserve()); frames that don't fit, or whose
+        mode can't be stored, are handled the old way: hashed here, encoded
+        from pickled bytes.
+
+        Args:
+            workers: Number of worker processes
+            slots: Number of frames that can be in the ring at once
+        """
+        self.workers = workers
+        self.slots = slots
+        self.slot_bytes = 0
+        self.ring: Optional[FrameRing] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Puts on the current ring, possibly waiting for a slot; the ring can't be replaced under them
+        self._putting = 0
+        self.slot_waits = 0
+        self.frames_shared = 0
+        self.frames_pickled = 0
+
+    def start(self):
+        """Start the worker processes"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        """Wait for queued jobs, stop the workers and free the shared memory"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self.ring is not None:
+            self.slot_waits += self.ring.waits
+            self.ring.close()
+            self.ring = None
+
+    def reserve(self, slot_bytes: int):
+        """
+        Make the slots at least slot_bytes large
+
+        The ring is only replaced while no slot is in use or awaited; otherwise larger
+        frames take the fallback path until the next call.
+
+        Args:
+            slot_bytes: Size of the largest frame to store
+        """
+        if slot_bytes <= 0 or (self.ring is not None and slot_bytes <= self.ring.slot_bytes):
+            return
+        with self._lock:
+            ring = self.ring
+            if ring is not None and (ring.slot_bytes >= slot_bytes or ring.free < ring.slots or self._putting):
+                return
+            if ring is not None:
+                self.slot_waits += ring.waits
+                ring.close()
+            self.ring = FrameRing(self.slots, slot_bytes)
+            self.slot_bytes = slot_bytes
+
+    def fits(self, image: Image.Image) -> bool:
+        """True if a frame can go through the ring"""
+        return self.ring is not None and self.ring.fits(image)
+
+    def put(self, image: Image.Image, block: bool = True) -> Optional[int]:
+        """
+        Store a frame in the ring
+
+        Args:
+            image: Frame to store
+            block: Wait for a free slot
+
+        Returns:
+            Slot number, or None if the frame doesn't fit or no slot was free
+        """
+        with self._lock:
+            if not self.fits(image):
+                return None
+            ring = self.ring
+            self._putting += 1
+        # Wait for a slot outside the lock, so other threads can still reserve(), fit and put
+        try:
+            return ring.put(image, block)
+        finally:
+            with self._lock:
+                self._putting -= 1
+
+    def hash(self, slot: int, algorithm: str, exact: bool = True,
+             verifier: Optional[Verifier] = None) -> "Future[FrameFeatures]":
+        """
+        Compute the dedupe features of a frame in a slot in a worker
+
+        The slot stays in use until released.
+
+        Returns:
+            Future of (64-bit hash, digest or None, signature or None)
+        """
+        self.frames_shared += 1
+        return self._executor.submit(hash_slot, *self.ring.location(slot), algorithm, exact, verifier)
+
+    def encode_slot(self, slot: int, encoder: ImageEncoder) -> "Future[bytes]":
+        """
+        Encode a frame in a slot in a worker and release the slot when done
+
+        Returns:
+            Future of the encoded file contents
+        """
+        ring = self.ring
+        future = self._executor.submit(encode_slot, *ring.location(slot), encoder)
+        future.add_done_callback(lambda _: ring.release(slot))
+        return future
+
+    def encode(self, image: Image.Image, encoder: ImageEncoder) -> "Future[bytes]":
+        """
+        Encode a frame in a worker, through the ring if it fits
+
+        Returns:
+            Future of the encoded file contents
+        """
+        self.reserve(frame_bytes(image) or 0)
+        slot = self.put(image)
+        if slot is None:
+            self.frames_pickled += 1
+            return self._executor.submit(encode_frame, encoder, image.mode, image.size, image.tobytes())
+        self.frames_shared += 1
+        return self.encode_slot(slot, encoder)
+
+    def image(self, slot: int) -> Image.Image:
+        """Copy of the frame in a slot"""
+        return self.ring.image(slot)
+
+    def release(self, slot: int):
+        """Free a slot that isn't handed to encode_slot()"""
+        self.ring.release(slot)
+
+    def stats(self) -> dict:
+        """
+        Get ring usage counters
+
+        Returns:
+            Dictionary with slots, slot_bytes, slots_free, frames_shared,
+            frames_pickled and slot_waits
+        """
+        ring = self.ring
+        return {
+            "slots": self.slots,
+            "slot_bytes": self.slot_bytes,
+            "slots_free": ring.free if ring else self.slots,
+            "frames_shared": self.frames_shared,
+            "frames_pickled": self.frames_pickled,
+            "slot_waits": self.slot_waits + (ring.waits if ring else 0),
+        }
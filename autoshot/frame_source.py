@@ -0,0 +1,352 @@
+"""
+Frame Source Module
+Where AutoShot gets its frames from: a live window, a recording or a generator
+"""
+import abc
+import random
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from .roi import Region, union_box
+from .window_session import WindowSession
+
+
+REPLAY_EXTENSIONS = (".png", ".bmp", ".jpg", ".jpeg", ".webp", ".qoi", ".tif", ".tiff")
+
+
+class FrameSource(abc.ABC):
+    """
+    Base class for frame sources
+
+    A source behaves like a screen: grab() returns what is visible right now,
+    so the capture loop's own interval decides how often it is sampled.
+    Subclasses must implement grab().
+    """
+
+    # WindowManager of the source, if it captures a real window
+    window_manager = None
+
+    def open(self) -> bool:
+        """
+        Prepare the source (find the window, open the recording, ...)
+
+        Returns:
+            True if frames can be grabbed, False otherwise
+        """
+        return True
+
+    @abc.abstractmethod
+    def grab(self) -> Optional[Image.Image]:
+        """
+        Grab the current frame
+
+        Returns:
+            PIL Image or None if no frame is available
+        """
+
+    def grab_regions(self, regions: Sequence[Region]) -> Optional[List[Image.Image]]:
+        """
+        Grab the current frame, cut into the given regions
+
+        The base implementation grabs the whole frame and crops it; sources
+        that can capture only part of a frame override this.
+
+        Args:
+            regions: Regions to capture, in client coordinates
+
+        Returns:
+            One PIL Image per region, or None if no frame is available
+        """
+        frame = self.grab()
+        if frame is None:
+            return None
+        return [frame.crop(region.resolve(*frame.size)) for region in regions]
+
+    def probe(self, regions: Sequence[Region]) -> Optional[List[bytes]]:
+        """
+        Read the current pixels of a few small regions, without a full grab
+
+        Args:
+            regions: Probe regions, in client coordinates
+
+        Returns:
+            Raw pixel bytes of each region, or None if the source can't be
+            probed (the base implementation), in which case every tick captures
+        """
+        return None
+
+    def close(self):
+        """
+        Release any resources held by the source
+        """
+        pass
+
+
+class Win32FrameSource(FrameSource):
+    def __init__(self, window_title: str, window_manager=None):
+        """
+        Capture the client area of a window with the Windows API and ImageGrab
+
+        Args:
+            window_title: Title of the window to capture
+            window_manager: WindowManager to use (optional, created if not given)
+        """
+        if window_manager is None:
+            from .window_manager import WindowManager
+            window_manager = WindowManager()
+        # Imported once here rather than on every grab
+        from PIL import ImageGrab
+        self._image_grab = ImageGrab.grab
+        self.window_title = window_title
+        self.window_manager = window_manager
+        self.session = WindowSession(window_manager, window_title)
+
+    @property
+    def hwnd(self) -> Optional[int]:
+        """Handle of the captured window, once found"""
+        return self.session.hwnd
+
+    def open(self) -> bool:
+        return self.session.client_rect() is not None
+
+    def grab(self, hwnd: Optional[int] = None) -> Optional[Image.Image]:
+        """
+        Grab the client area of the window
+
+        Args:
+            hwnd: Window handle to capture (optional, looked up by title if not given)
+
+        Returns:
+            PIL Image or None if failed
+        """
+        rect = self._capture_rect(hwnd)
+        if rect is None:
+            return None
+
+        # Take screenshot of the client area
+        left, top, right, bottom = rect
+        bbox = (left, top, right, bottom)
+        try:
+            return self._image_grab(bbox=bbox)
+        except Exception:
+            self.session.invalidate()
+            raise
+
+    def grab_regions(self, regions: Sequence[Region],
+                     hwnd: Optional[int] = None) -> Optional[List[Image.Image]]:
+        """
+        Grab only the pixels covered by the regions
+
+        The regions are resolved against the client size and a single grab of
+        their bounding box is taken, so pixels outside every region are never
+        copied out of the screen.
+
+        Args:
+            regions: Regions to capture, in client coordinates
+            hwnd: Window handle to capture (optional, looked up by title if not given)
+
+        Returns:
+            One PIL Image per region, or None if failed
+        """
+        rect = self._capture_rect(hwnd)
+        if rect is None:
+            return None
+
+        left, top, right, bottom = rect
+        boxes = [region.resolve(right - left, bottom - top) for region in regions]
+        union = union_box(boxes)
+        if union[2] <= union[0] or union[3] <= union[1]:
+            return None
+        try:
+            screenshot = self._image_grab(bbox=(left + union[0], top + union[1],
+                                              left + union[2], top + union[3]))
+        except Exception:
+            self.session.invalidate()
+            raise
+        if len(boxes) == 1:
+            return [screenshot]
+        return [screenshot.crop((b[0] - union[0], b[1] - union[1], b[2] - union[0], b[3] - union[1]))
+                for b in boxes]
+
+    def probe(self, regions: Sequence[Region]) -> Optional[List[bytes]]:
+        """
+        Read the probe regions straight from the screen: one device context
+        and one BitBlt per region, no ImageGrab
+
+        Args:
+            regions: Probe regions, in client coordinates
+
+        Returns:
+            BGRA bytes of each region, or None if the window or screen can't be read
+        """
+        rect = self._capture_rect()
+        if rect is None:
+            return None
+        left, top, right, bottom = rect
+        boxes = []
+        for region in regions:
+            l, t, r, b = region.resolve(right - left, bottom - top)
+            boxes.append((left + l, top + t, left + r, top + b))
+        try:
+            return self.window_manager.read_screen_boxes(boxes)
+        except Exception:
+            self.session.invalidate()
+            raise
+
+    def _capture_rect(self, hwnd: Optional[int] = None) -> Optional[tuple]:
+        """Screen rectangle of the client area, from the window session's cache"""
+        return self.session.client_rect(hwnd)
+
+
+class ReplayFrameSource(FrameSource):
+    def __init__(self, path: str, fps: Optional[float] = None, loop: bool = False):
+        """
+        Play back recorded frames from a directory of images or a video file
+
+        Args:
+            path: Directory of images (played in filename order) or a video file
+            fps: Playback rate. If given, grab() returns the frame that would be
+                on screen at the elapsed time since open(); if None, every grab()
+                advances by one frame
+            loop: Start over at the end instead of running out of frames
+        """
+        self.path = Path(path)
+        self.fps = fps
+        self.loop = loop
+        self._files: List[Path] = []
+        self._video = None
+        self._frame_count = 0
+        self._position = 0
+        self._start: Optional[float] = None
+
+    def open(self) -> bool:
+        if self.path.is_dir():
+            self._files = sorted(p for p in self.path.iterdir()
+                                 if p.suffix.lower() in REPLAY_EXTENSIONS)
+            self._frame_count = len(self._files)
+        elif self.path.is_file():
+            try:
+                import imageio
+            except ImportError:
+                raise ImportError("Video replay requires imageio: pip install 'imageio[ffmpeg]'")
+            self._video = imageio.get_reader(str(self.path))
+            self._frame_count = self._video.count_frames()
+        else:
+            return False
+        self._position = 0
+        self._start = time.monotonic()
+        return self._frame_count > 0
+
+    def _next_position(self) -> Optional[int]:
+        if self._start is None and not self.open():
+            return None
+        if self.fps:
+            position = int((time.monotonic() - self._start) * self.fps)
+        else:
+            position = self._position
+            self._position += 1
+        if position >= self._frame_count:
+            if not self.loop:
+                return None
+            position %= self._frame_count
+        return position
+
+    def grab(self) -> Optional[Image.Image]:
+        position = self._next_position()
+        if position is None:
+            return None
+        if self._video is not None:
+            return Image.fromarray(self._video.get_data(position))
+        with Image.open(self._files[position]) as image:
+            image.load()
+            return image
+
+    def close(self):
+        if self._video is not None:
+            self._video.close()
+            self._video = None
+        self._start = None
+
+
+class SyntheticFrameSource(FrameSource):
+    def __init__(self, width: int = 800, height: int = 600, change_rate: float = 0.2,
+                 line_height: int = 18, seed: Optional[int] = 0, scroll_rate: float = 1.0):
+        """
+        Generate chat-like frames of scrolling text
+
+        Each grab() changes the frame with probability change_rate; otherwise
+        the frame is identical to the last. A change appends a new text line,
+        scrolling the older ones up, or with probability 1 - scroll_rate
+        rewrites one visible line in place (an edit, a reaction, a status).
+
+        Args:
+            width: Frame width
+            height: Frame height
+            change_rate: Probability in [0, 1] that a frame differs from the previous one
+            line_height: Height of one text line in pixels
+            seed: Random seed, for reproducible sequences (None for random)
+            scroll_rate: Probability in [0, 1] that a change scrolls instead
+                of editing a line in place
+        """
+        self.width = width
+        self.height = height
+        self.change_rate = change_rate
+        self.line_height = line_height
+        self.scroll_rate = scroll_rate
+        self._rng = random.Random(seed)
+        self._lines = [self._make_line() for _ in range(height // line_height + 1)]
+        # Frame rendered by probe(), shown to the next grab of the same tick
+        self._probed: Optional[np.ndarray] = None
+        self.frames_generated = 0
+        self.frames_changed = 0
+
+    def _make_line(self) -> np.ndarray:
+        # A line of "words": dark glyph blocks on a light background
+        line = np.full((self.line_height, self.width, 3), 245, dtype=np.uint8)
+        x = self._rng.randint(8, 40)
+        ink = self._rng.randint(0, 90)
+        end = self._rng.randint(self.width // 4, self.width - 8)
+        top, bottom = 3, self.line_height - 4
+        while x < end:
+            word = self._rng.randint(12, 70)
+            for glyph_x in range(x, min(x + word, end), 7):
+                glyph_top = top + self._rng.randint(0, 3)
+                line[glyph_top:bottom, glyph_x:glyph_x + 5] = ink
+            x += word + self._rng.randint(6, 12)
+        return line
+
+    def _render(self) -> np.ndarray:
+        if self._probed is not None:
+            pixels, self._probed = self._probed, None
+            return pixels
+        if self.frames_generated > 0 and self._rng.random() < self.change_rate:
+            if self.scroll_rate >= 1 or self._rng.random() < self.scroll_rate:
+                self._lines.pop(0)
+                self._lines.append(self._make_line())
+            else:
+                # Only fully visible lines, so the edit always shows
+                self._lines[self._rng.randrange(1, len(self._lines))] = self._make_line()
+            self.frames_changed += 1
+        self.frames_generated += 1
+        # Bottom-aligned like a chat view; the top line is partially visible
+        return np.concatenate(self._lines)[-self.height:]
+
+    def grab(self) -> Optional[Image.Image]:
+        return Image.fromarray(self._render())
+
+    def probe(self, regions: Sequence[Region]) -> Optional[List[bytes]]:
+        # Probing advances the screen by a tick; a grab right after sees the same frame
+        self._probed = None
+        self._probed = pixels = self._render()
+        boxes = [region.resolve(self.width, self.height) for region in regions]
+        return [pixels[t:b, l:r].tobytes() for l, t, r, b in boxes]
+
+    def grab_regions(self, regions: Sequence[Region]) -> Optional[List[Image.Image]]:
+        # Slice before building images so only region pixels are copied
+        pixels = self._render()
+        boxes = [region.resolve(self.width, self.height) for region in regions]
+        return [Image.fromarray(np.ascontiguousarray(pixels[t:b, l:r])) for l, t, r, b in boxes]
@@ -0,0 +1,239 @@
+"""
+Hash Search Module
+History-wide near-duplicate search over packed 64-bit image hashes
+"""
+from itertools import combinations
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+CHUNK_COUNT = 4
+CHUNK_BITS = 16
+CHUNK_VALUES = 1 << CHUNK_BITS
+CHUNK_MASK = np.uint64(CHUNK_VALUES - 1)
+
+# Past this per-chunk radius the key enumeration costs more than a scan
+MAX_CHUNK_RADIUS = 2
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits of each element of a uint64 array
+
+    Args:
+        values: Array of uint64
+
+    Returns:
+        Array of bit counts with the same shape
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    as_bytes = np.ascontiguousarray(values).view(np.uint8).reshape(values.shape + (8,))
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def _chunk_neighbours(radius: int) -> np.ndarray:
+    """All 16-bit masks with at most `radius` bits set"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            masks.append(sum(1 << b for b in bits))
+    return np.array(masks, dtype=np.uint32)
+
+
+class HashSearchIndex:
+    def __init__(self, capacity: int = 1024):
+        """
+        Multi-index hashing over 64-bit hashes
+
+        Hashes live in one packed uint64 array. Each of the four 16-bit
+        chunks has a bucket table (CSR offsets plus a permutation), so all
+        entries with a given chunk value are found in O(1). Two hashes within
+        distance r share at least one chunk within distance r // 4, which
+        bounds the buckets a query has to visit. Entries added since the
+        tables were last built sit in a short tail that is scanned directly.
+
+        Args:
+            capacity: Initial number of hash slots
+        """
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._labels = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        # Entries [0, _built) are covered by the bucket tables
+        self._built = 0
+        self._offsets = None
+        self._order = None
+        self._neighbours = {}
+
+    def __len__(self) -> int:
+        return int(self._alive[:self._size].sum())
+
+    @property
+    def hashes(self) -> np.ndarray:
+        """Packed hashes of all entries, including removed ones"""
+        return self._hashes[:self._size]
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Caller-supplied label of each entry (e.g. capture time in ms)"""
+        return self._labels[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the arrays of this index"""
+        total = self._hashes.nbytes + self._labels.nbytes + self._alive.nbytes
+        if self._offsets is not None:
+            total += self._offsets.nbytes + self._order.nbytes
+        return total
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed <= len(self._hashes):
+            return
+        capacity = max(needed, 2 * len(self._hashes))
+        for name in ("_hashes", "_labels", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, hash_value: int, label: int = 0) -> int:
+        """
+        Add one hash
+
+        Args:
+            hash_value: 64-bit hash
+            label: Caller-supplied label stored alongside the hash
+
+        Returns:
+            Position of the new entry
+        """
+        return int(self.extend(np.array([hash_value], dtype=np.uint64),
+                               np.array([label], dtype=np.int64))[0])
+
+    def extend(self, hashes: np.ndarray, labels: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Add many hashes at once
+
+        Args:
+            hashes: Array of uint64 hashes
+            labels: Array of int64 labels (optional)
+
+        Returns:
+            Positions of the new entries
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64).ravel()
+        count = len(hashes)
+        self._reserve(count)
+        start = self._size
+        self._hashes[start:start + count] = hashes
+        self._labels[start:start + count] = 0 if labels is None else labels
+        self._alive[start:start + count] = True
+        self._size += count
+        # Keep the unindexed tail short relative to the indexed part
+        if self._size - self._built > max(4096, self._built // 8):
+            self.build()
+        return np.arange(start, start + count)
+
+    def remove(self, positions: np.ndarray):
+        """
+        Remove entries so they no longer match queries
+
+        Args:
+            positions: Positions returned by add/extend
+        """
+        self._alive[np.asarray(positions)] = False
+
+    def build(self):
+        """
+        Rebuild the bucket tables over all entries
+        """
+        hashes = self._hashes[:self._size]
+        offsets = np.empty((CHUNK_COUNT, CHUNK_VALUES + 1), dtype=np.int64)
+        order = np.empty((CHUNK_COUNT, self._size), dtype=np.uint32)
+        for i in range(CHUNK_COUNT):
+            chunk = ((hashes >> np.uint64(i * CHUNK_BITS)) & CHUNK_MASK).astype(np.int64)
+            offsets[i, 0] = 0
+            np.cumsum(np.bincount(chunk, minlength=CHUNK_VALUES), out=offsets[i, 1:])
+            order[i] = np.argsort(chunk, kind="stable")
+        self._offsets = offsets
+        self._order = order
+        self._built = self._size
+
+    def _candidates(self, hash_value: int, radius: int) -> np.ndarray:
+        chunk_radius = radius // CHUNK_COUNT
+        if chunk_radius not in self._neighbours:
+            self._neighbours[chunk_radius] = _chunk_neighbours(chunk_radius)
+        masks = self._neighbours[chunk_radius]
+
+        parts = []
+        for i in range(CHUNK_COUNT):
+            key = (hash_value >> (i * CHUNK_BITS)) & (CHUNK_VALUES - 1)
+            keys = masks ^ key
+            starts = self._offsets[i, keys]
+            ends = self._offsets[i, keys + 1]
+            for start, end in zip(starts[ends > starts], ends[ends > starts]):
+                parts.append(self._order[i, start:end])
+        parts.append(np.arange(self._built, self._size, dtype=np.uint32))
+        return np.unique(np.concatenate(parts)).astype(np.int64)
+
+    def query(self, hash_value: int, radius: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find all entries within a Hamming radius of a hash
+
+        Args:
+            hash_value: 64-bit query hash
+            radius: Maximum Hamming distance (inclusive)
+
+        Returns:
+            Tuple of (positions, distances), sorted by distance
+        """
+        if self._size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        if self._offsets is None or radius // CHUNK_COUNT > MAX_CHUNK_RADIUS:
+            return self.query_linear(hash_value, radius)
+
+        positions = self._candidates(int(hash_value), radius)
+        positions = positions[self._alive[positions]]
+        distances = popcount64(self._hashes[positions] ^ np.uint64(hash_value))
+        keep = distances <= radius
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return positions[order], distances[order]
+
+    def query_linear(self, hash_value: int, radius: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reference implementation of query() that scans every entry
+
+        Args:
+            hash_value: 64-bit query hash
+            radius: Maximum Hamming distance (inclusive)
+
+        Returns:
+            Tuple of (positions, distances), sorted by distance
+        """
+        distances = popcount64(self._hashes[:self._size] ^ np.uint64(hash_value))
+        positions = np.flatnonzero((distances <= radius) & self._alive[:self._size])
+        distances = distances[positions]
+        order = np.argsort(distances, kind="stable")
+        return positions[order], distances[order]
+
+    def nearest(self, hash_value: int, radius: int = 0) -> Optional[Tuple[int, int]]:
+        """
+        Find the closest entry within a Hamming radius
+
+        Args:
+            hash_value: 64-bit query hash
+            radius: Maximum Hamming distance (inclusive)
+
+        Returns:
+            Tuple of (position, distance) or None if nothing is close enough
+        """
+        positions, distances = self.query(hash_value, radius)
+        if len(positions) == 0:
+            return None
+        return int(positions[0]), int(distances[0])
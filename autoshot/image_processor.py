@@ -5,14 +5,87 @@ Handles image operations like cropping and saving
 from PIL import Image
 import os
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Optional, Tuple
+import threading
 import time
 
+from .archive import DEFAULT_SEGMENT_SIZE, ArchiveWriter
+from .delta import DeltaEncoder
+from .encoder import ImageEncoder
+from .frame_index import FrameIndex
+from .transcript import TranscriptStitcher
+
+STORAGE_BACKENDS = ("files", "archive", "transcript")
+
 
 class ImageProcessor:
-    def __init__(self, output_dir: str = "chat_shot"):
+    def __init__(self, output_dir: str = "chat_shot", encoder: Optional[ImageEncoder] = None,
+                 storage: str = "files", segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 keyframe_interval: int = 1):
+        """
+        Crop and save frames to an output directory
+
+        Args:
+            output_dir: Directory to save frames to
+            encoder: Output format and settings (optional, defaults to PNG)
+            storage: "files" saves one image file per frame, "archive"
+                appends frames to rolling segment files, "transcript"
+                stitches scrolling frames into tall tiles in a "transcript"
+                subdirectory, keeping only the newly revealed rows
+            segment_size: Size in bytes at which an archive segment is closed
+            keyframe_interval: With archive storage, store only every n-th
+                frame in full and the changed tiles of the frames in between
+                (default 1, every frame in full)
+        """
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage '{storage}', expected one of {STORAGE_BACKENDS}")
+        if keyframe_interval > 1 and storage != "archive":
+            raise ValueError("Delta frames (keyframe_interval > 1) need archive storage")
         self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
+        self.encoder = encoder if encoder is not None else ImageEncoder()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.archive: Optional[ArchiveWriter] = None
+        if storage == "archive":
+            self.archive = ArchiveWriter(str(self.output_dir), self.encoder.format, segment_size)
+        self.transcript: Optional[TranscriptStitcher] = None
+        if storage == "transcript":
+            self.transcript = TranscriptStitcher(str(self.output_dir / "transcript"), self.encoder)
+        self.delta: Optional[DeltaEncoder] = None
+        if keyframe_interval > 1:
+            self.delta = DeltaEncoder(self.encoder, keyframe_interval)
+        # Deltas are relative to the previously stored frame, so encoding and
+        # appending happen as one step
+        self._delta_lock = threading.Lock()
+        self.index: Optional[FrameIndex] = None
+        self._filename_lock = threading.Lock()
+        self._last_timestamp = 0
+
+    @property
+    def needs_raw_frames(self) -> bool:
+        """True if frames must go through save_frame() in order instead of
+        being encoded elsewhere (delta frames, transcript storage)"""
+        return self.delta is not None or self.transcript is not None
+
+    def open_index(self, hash_func: Optional[Callable[[Image.Image], int]] = None) -> FrameIndex:
+        """
+        Open the persistent frame index of the output directory
+        
+        Once open, every saved or deleted image is recorded in it. The index
+        rebuilds itself from the directory if it is missing or stale. With
+        archive storage, the archive itself serves as the index.
+        
+        Args:
+            hash_func: Function returning the 64-bit hash of an image, used
+                to index files found on disk (optional)
+            
+        Returns:
+            The opened FrameIndex
+        """
+        if self.index is None and self.archive is not None:
+            self.index = self.archive
+        elif self.index is None:
+            self.index = FrameIndex(str(self.output_dir), hash_func, pattern="*" + self.encoder.extension)
+        return self.index
 
     def crop_top_half(self, image: Image.Image) -> Image.Image:
         """
@@ -33,31 +106,128 @@ class ImageProcessor:
         
         return image.crop((left, top, right, bottom))
 
-    def save_image(self, image: Image.Image, filename: str) -> str:
+    def save_image(self, image: Image.Image, filename: str, hash_value: Optional[int] = None) -> str:
         """
-        Save an image to the output directory
+        Encode an image with the processor's encoder and save it to the output directory
         
         Args:
             image: PIL Image to save
             filename: Name of the file to save as
+            hash_value: 64-bit hash of the image, recorded in the index (optional)
             
         Returns:
             Full path of saved image
         """
+        return self.save_encoded(self.encoder.encode(image), filename, hash_value)
+
+    def save_frame(self, image: Image.Image, hash_value: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Encode and store a frame under a unique name, as a delta when configured
+        
+        Args:
+            image: PIL Image to save
+            hash_value: 64-bit hash of the image, recorded in the index (optional)
+            
+        Returns:
+            Tuple of (saved path or archive location, bytes written)
+        """
+        if self.transcript is not None:
+            return self.transcript.add(image)
+        if self.delta is not None:
+            with self._delta_lock:
+                data, is_delta = self.delta.encode(image, force_keyframe=self.archive.segment_frames == 0)
+                try:
+                    return self.archive.append(data, hash_value, delta=is_delta), len(data)
+                except Exception:
+                    # The next delta must not refer to a frame that was never stored
+                    self.delta.reset()
+                    raise
+        data = self.encoder.encode(image)
+        return self.save_encoded(data, self.create_unique_filename(), hash_value), len(data)
+
+    def save_encoded(self, data: bytes, filename: str, hash_value: Optional[int] = None) -> str:
+        """
+        Write an already encoded image to the output directory
+        
+        The data goes to a hidden temporary file that is then renamed into
+        place, so readers never see a partially written frame. With archive
+        storage the frame is appended to the current segment instead and the
+        filename is not used.
+        
+        Args:
+            data: Encoded file contents
+            filename: Name of the file to save as
+            hash_value: 64-bit hash of the image, recorded in the index (optional)
+            
+        Returns:
+            Full path of saved image, or "segment path@timestamp" in an archive
+        """
+        if self.transcript is not None:
+            raise ValueError("Transcript storage stitches raw frames, use save_frame()")
+        if self.archive is not None:
+            return self.archive.append(data, hash_value)
+
         filepath = self.output_dir / filename
-        image.save(filepath)
+        temp_path = filepath.with_name(f".{filename}.tmp")
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, filepath)
+        except OSError:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
+        self._record(filepath, hash_value)
         return str(filepath)
 
-    def create_unique_filename(self, prefix: str = "screenshot", extension: str = ".png") -> str:
+    def _record(self, filepath: Path, hash_value: Optional[int]):
+        if self.index is not None:
+            stat = filepath.stat()
+            self.index.add(str(filepath), stat.st_size, hash_value, stat.st_mtime)
+
+    def delete_image(self, filepath: str):
+        """
+        Delete a saved image and drop it from the index
+        
+        Args:
+            filepath: Path of the image to delete
+            
+        Raises:
+            OSError: If the file can't be removed, or it is in an archive or transcript
+        """
+        if self.archive is not None or self.transcript is not None:
+            raise OSError("Frames in an archive or transcript can't be deleted one by one")
+        os.remove(filepath)
+        if self.index is not None:
+            self.index.remove(filepath)
+
+    def flush(self):
+        """
+        Close the current archive segment so it gets its footer index;
+        the next frame starts a new segment. Writes the partial last tile of
+        a transcript. Does nothing for file storage.
+        """
+        if self.archive is not None:
+            self.archive.close()
+        if self.transcript is not None:
+            self.transcript.flush()
+
+    def create_unique_filename(self, prefix: str = "screenshot", extension: Optional[str] = None) -> str:
         """
         Create a unique filename based on timestamp
         
         Args:
             prefix: Filename prefix
-            extension: File extension
+            extension: File extension (optional, defaults to the encoder's)
             
         Returns:
             Unique filename
         """
         timestamp = int(time.time() * 1000)  # Millisecond precision
+        with self._filename_lock:
+            # Frames saved within the same millisecond (e.g. by parallel
+            # encode workers) get the next free millisecond instead
+            timestamp = max(timestamp, self._last_timestamp + 1)
+            self._last_timestamp = timestamp
+        if extension is None:
+            extension = self.encoder.extension
         return f"{prefix}_{timestamp}{extension}"
\ No newline at end of file
@@ -2,19 +2,46 @@
 Main Module
 Orchestrates the entire screenshot and similarity detection workflow
 """
+from __future__ import annotations
+
 import time
 import os
+import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional, Tuple
 import threading
 
-from .window_manager import WindowManager
-from .image_processor import ImageProcessor
-from .similarity_detector import SimilarityDetector
+from .metrics import EVENTS, FRAMES, QUIET, Histogram, MetricsDumper, MetricsRegistry, MetricsServer, log, set_verbosity
+from .probe import ProbeTrigger, parse_probe
+from .retention import RetentionPolicy, parse_duration, parse_size, parse_thinning
+from .roi import Region, TOP_HALF, parse_region
+from .scheduler import OVERRUN_POLICIES, AdaptiveScheduler, FixedRateScheduler
+
+# PIL, numpy and imagehash are only needed to capture; the modules that use
+# them are imported where a capture is set up, so --query-pixel and --help
+# start without loading them
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from .encoder import ImageEncoder
+    from .frame_source import FrameSource
+    from .image_processor import ImageProcessor
+    from .pipeline import CapturePipeline
+    from .similarity_detector import SimilarityDetector, Verifier
 
 
 class AutoShot:
-    def __init__(self, window_title: str, width: int, height: int, interval: int = 2):
+    def __init__(self, window_title: str, width: int, height: int, interval: float = 2,
+                 frame_source: Optional[FrameSource] = None, output_dir: str = "chat_shot",
+                 regions: Optional[List[Region]] = None, pipelined: bool = False,
+                 overload_policy: str = "drop-oldest", queue_size: int = 8, encode_workers: int = 2,
+                 encode_processes: bool = False, overrun_policy: str = "skip", change_gate: bool = True,
+                 encoder: Optional[ImageEncoder] = None, storage: str = "files",
+                 segment_size: int = 64 * 1024 * 1024, keyframe_interval: int = 1,
+                 retention: Optional[RetentionPolicy] = None, probes: Optional[List[Region]] = None,
+                 probe_max_interval: float = 60, exact_match: bool = True,
+                 verifier: Optional[Verifier] = None, max_interval: Optional[float] = None,
+                 backoff: float = 2.0):
         """
         Initialize the AutoShot tool
         
@@ -22,19 +49,117 @@ class AutoShot:
             window_title: Title of the window to capture
             width: Target width for the window
             height: Target height for the window
-            interval: Time interval between screenshots in seconds (default 2)
+            interval: Time interval between screenshots in seconds (default 2);
+                fractions are fine, e.g. 0.05 for 20 captures per second
+            frame_source: Where frames come from (optional, defaults to
+                capturing the window through the Windows API)
+            output_dir: Directory to save screenshots to (default "chat_shot")
+            regions: Regions of the client area to capture (optional, defaults
+                to the top half). With several regions, each one is saved to
+                its own subdirectory of output_dir and deduped separately
+            pipelined: Run the capture loop as concurrent capture, hash and
+                encode stages instead of one serial cycle (default False)
+            overload_policy: What the pipelined loop does with a new frame
+                when the hash stage is behind: "drop-oldest", "drop-newest" or "block"
+            queue_size: Capacity of the pipelined loop's capture queue
+            encode_workers: Number of encode/save workers of the pipelined loop
+            encode_processes: Hash and encode frames in worker processes in the
+                pipelined loop, passing them through shared memory
+            overrun_policy: What the capture loop does when a cycle takes longer
+                than the interval: "skip" the missed ticks or "coalesce" them
+                into one immediate tick (default "skip")
+            change_gate: Compare each region with its previous frame before
+                hashing, so unchanged frames skip hashing (default True)
+            encoder: Output format and encoder settings of saved frames
+                (optional, defaults to PNG at zlib level 6)
+            storage: "files" saves one image file per frame (default),
+                "archive" appends frames to rolling segment files,
+                "transcript" stitches scrolling frames into tall tiles
+            segment_size: Size in bytes at which an archive segment is closed
+            keyframe_interval: With archive storage, store every n-th frame in
+                full and only the changed tiles of the frames in between
+                (default 1, every frame in full)
+            retention: Limits on the saved frames (total bytes, count, age,
+                thinning), applied to each region's directory in the
+                background while the capture loop runs (optional, file storage only)
+            probes: Pixels or small regions in client coordinates, e.g. an
+                unread badge; when given, the capture loop reads only these
+                each tick and runs a full capture only when one changed (optional)
+            probe_max_interval: With probes, the longest time in seconds
+                between full captures, for changes the probes don't cover (default 60)
+            exact_match: Look up a digest of each frame's pixels before
+                hashing, so frames identical to a saved one skip the hash (default True)
+            verifier: Finer check (16x16 hash or SSIM) of frames whose 64-bit
+                hash is close to a saved frame's; the 64-bit hash alone decides if None
+            max_interval: Capture adaptively (optional): while frames are
+                duplicates the interval grows up to max_interval seconds, and
+                the first new frame snaps it back to interval
+            backoff: With max_interval, the factor the interval grows by after
+                each capture without a new frame (default 2)
         """
+        from .capture_stream import CaptureStream
+        from .change_gate import ChangeGate
+        from .frame_source import Win32FrameSource
+
         self.window_title = window_title
         self.width = width
         self.height = height
         self.interval = interval
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy '{overrun_policy}', expected one of {OVERRUN_POLICIES}")
+        self.overrun_policy = overrun_policy
+        self.max_interval = max_interval
+        self.backoff = backoff
+        if max_interval is not None:
+            # Check the bounds now rather than when the loop starts
+            AdaptiveScheduler(interval, max_interval, backoff, overrun_policy)
         
-        self.window_manager = WindowManager()
-        self.image_processor = ImageProcessor()
-        self.similarity_detector = SimilarityDetector
+        if frame_source is None:
+            frame_source = Win32FrameSource(window_title)
+        self.frame_source = frame_source
+        self.window_manager = frame_source.window_manager
+
+        if not regions:
+            regions = [TOP_HALF]
+        names = [region.name for region in regions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Region names must be unique, got {names}")
+        if len(regions) == 1:
+            self.streams = [CaptureStream(regions[0], output_dir, ChangeGate() if change_gate else None,
+                                          encoder, storage, segment_size, keyframe_interval, retention,
+                                          exact_match, verifier)]
+        else:
+            self.streams = [CaptureStream(region, str(Path(output_dir) / region.name),
+                                          ChangeGate() if change_gate else None, encoder, storage, segment_size,
+                                          keyframe_interval, retention, exact_match, verifier)
+                            for region in regions]
+        self.regions = regions
         
         self.running = False
         self.capture_thread = None
+        self.scheduler: Optional[FixedRateScheduler] = None
+        self.frames_captured = 0
+        self.capture_failures = 0
+        self.frames_deleted = 0
+        self.timers = {name: Histogram() for name in ("grab", "cycle", "delete")}
+        self.probe_trigger = ProbeTrigger(probes, probe_max_interval) if probes else None
+        self.pipeline: Optional[CapturePipeline] = None
+        if pipelined:
+            from .pipeline import CapturePipeline
+            self.pipeline = CapturePipeline(self, queue_size=queue_size, overload_policy=overload_policy,
+                                            encode_workers=encode_workers, use_processes=encode_processes)
+        self.metrics = MetricsRegistry()
+        self.register_metrics(self.metrics)
+
+    @property
+    def image_processor(self) -> ImageProcessor:
+        """ImageProcessor of the first (by default the only) region"""
+        return self.streams[0].image_processor
+
+    @property
+    def similarity_detector(self) -> SimilarityDetector:
+        """SimilarityDetector of the first (by default the only) region"""
+        return self.streams[0].similarity_detector
 
     def setup_window(self) -> bool:
         """
@@ -43,65 +168,175 @@ class AutoShot:
         Returns:
             True if successful, False otherwise
         """
+        if self.window_manager is None:
+            # Recorded or generated frames: nothing to resize
+            return self.frame_source.open()
+
         hwnd = self.window_manager.find_window(window_name=self.window_title)
         if hwnd is None:
-            print(f"Window '{self.window_title}' not found.")
+            log(f"Window '{self.window_title}' not found.", QUIET)
             return False
             
-        print(f"Found window: {self.window_title} (Handle: {hwnd})")
+        log(f"Found window: {self.window_title} (Handle: {hwnd})")
         
         # Resize the window
         success = self.window_manager.resize_window(hwnd, self.width, self.height)
         if success:
-            print(f"Resized window to {self.width}x{self.height}")
+            log(f"Resized window to {self.width}x{self.height}")
         else:
-            print("Failed to resize window")
+            log("Failed to resize window", QUIET)
             
         return success
 
-    def capture_screenshot(self, hwnd: int) -> Optional[str]:
+    def should_capture(self) -> bool:
         """
-        Capture a screenshot of the specified window and save it
+        Decide whether this tick of the capture loop runs a full capture
+
+        Returns:
+            True without probes; with probes, True only if a probe changed,
+            the probes couldn't be read, or the probe max interval passed
+        """
+        if self.probe_trigger is None:
+            return True
+        return self.probe_trigger.check(self.frame_source)
+
+    def grab_regions(self, hwnd: Optional[int] = None) -> Optional[List[Image.Image]]:
+        """
+        Grab one image per capture region; only the regions' pixels are captured
         
         Args:
-            hwnd: Window handle to capture
+            hwnd: Window handle to capture (optional, only used by window sources)
             
         Returns:
-            Path to saved image or None if failed
+            List of PIL Images (one per region) or None if failed
         """
+        start = time.perf_counter()
         try:
-            # Import here to avoid circular dependencies
-            from PIL import ImageGrab
-            
-            # Get client rectangle (the actual content area without borders/title bar)
-            rect = self.window_manager.get_client_rect(hwnd)
-            if rect is None:
-                print("Could not get window client rectangle, falling back to window rectangle")
-                # Fallback to window rectangle if client rectangle fails
-                rect = self.window_manager.get_window_rect(hwnd)
-                if rect is None:
-                    print("Could not get window rectangle")
-                    return None
-                
-            # Take screenshot of the client area
-            left, top, right, bottom = rect
-            bbox = (left, top, right, bottom)
-            screenshot = ImageGrab.grab(bbox=bbox)
-            
-            # Crop to top half
-            cropped_image = self.image_processor.crop_top_half(screenshot)
-            
-            # Generate unique filename
-            filename = self.image_processor.create_unique_filename()
+            if hwnd is not None and self.window_manager is not None:
+                images = self.frame_source.grab_regions(self.regions, hwnd)
+            else:
+                images = self.frame_source.grab_regions(self.regions)
+        except Exception as e:
+            log(f"Error capturing screenshot: {e}", QUIET)
+            images = None
+        self.timers["grab"].record(time.perf_counter() - start)
+        if images is None:
+            self.capture_failures += 1
+            if self.probe_trigger is not None:
+                # Unchanged probes must not hide the missed capture
+                self.probe_trigger.reset()
+            return None
+        self.frames_captured += 1
+        return images
+
+    def grab_frame(self, hwnd: Optional[int] = None) -> Optional[Image.Image]:
+        """
+        Grab the first capture region (by default the top half), without saving anything
+        
+        Args:
+            hwnd: Window handle to capture (optional, only used by window sources)
             
-            # Save the cropped image
-            saved_path = self.image_processor.save_image(cropped_image, filename)
-            print(f"Screenshot saved: {saved_path}")
+        Returns:
+            Cropped PIL Image or None if failed
+        """
+        images = self.grab_regions(hwnd)
+        return None if images is None else images[0]
+
+    def capture_screenshot(self, hwnd: Optional[int] = None) -> Optional[str]:
+        """
+        Capture a screenshot of the specified window and save it
+        
+        Args:
+            hwnd: Window handle to capture (optional, only used by window sources)
             
-            return saved_path
-        except Exception as e:
-            print(f"Error capturing screenshot: {e}")
+        Returns:
+            Path to saved image or None if failed
+        """
+        cropped_image = self.grab_frame(hwnd)
+        if cropped_image is None:
             return None
+        return self.streams[0].save(cropped_image)
+
+    def process_frame(self, image: Image.Image) -> Tuple[bool, Optional[str]]:
+        """
+        Dedupe a cropped frame of the first region in memory and save it only if it is new
+        
+        Args:
+            image: Cropped PIL Image
+            
+        Returns:
+            Tuple of (is_duplicate, saved path or None)
+        """
+        return self.streams[0].process(image)
+
+    def stats(self) -> dict:
+        """
+        Get capture and dedupe counters, summed over regions and per region
+        
+        Returns:
+            Dictionary of counter name to value; "regions" maps region names
+            to their own counters
+        """
+        per_region = {stream.region.name: stream.stats() for stream in self.streams}
+        totals = {"frames_captured": self.frames_captured, "capture_failures": self.capture_failures,
+                  "frames_deleted": self.frames_deleted}
+        for region_stats in per_region.values():
+            for key, value in region_stats.items():
+                totals[key] = totals.get(key, 0) + value
+        if totals["gate_checks"]:
+            totals["gate_hit_rate"] = totals["gate_unchanged"] / totals["gate_checks"]
+        for tier in ("exact", "hash", "verify"):
+            if totals[f"{tier}_checks"]:
+                totals[f"{tier}_hit_rate"] = totals[f"{tier}_hits"] / totals[f"{tier}_checks"]
+        totals["latency"] = {name: timer.stats() for name, timer in self.timers.items()}
+        for stream in self.streams:
+            per_region[stream.region.name]["latency"] = {name: timer.stats() for name, timer in stream.timers.items()}
+        totals["regions"] = per_region
+        if self.window_manager is not None:
+            totals["window_session"] = self.frame_source.session.stats()
+        if self.scheduler is not None:
+            totals["scheduler"] = self.scheduler.stats()
+        if self.pipeline is not None:
+            totals["pipeline"] = self.pipeline.stats()
+        if self.probe_trigger is not None:
+            totals["probe"] = self.probe_trigger.stats()
+        return totals
+
+    def register_metrics(self, registry: MetricsRegistry, labels: Optional[dict] = None):
+        """
+        Register the counters, gauges and stage latencies of this instance
+
+        Counters that already exist as attributes are read when the metrics
+        are collected, so registering adds nothing to the capture loop.
+
+        Args:
+            registry: Registry to add the metrics to
+            labels: Labels added to every metric, e.g. {"target": title} when
+                several instances share a registry (optional)
+        """
+        labels = dict(labels or {})
+        registry.counter("autoshot_frames_captured_total", "Frames grabbed from the source", labels,
+                         lambda: self.frames_captured)
+        registry.counter("autoshot_capture_failures_total", "Failed grabs", labels, lambda: self.capture_failures)
+        registry.counter("autoshot_frames_deleted_total", "Saved frames removed as duplicates", labels,
+                         lambda: self.frames_deleted)
+        registry.gauge("autoshot_capture_interval_seconds", "Current interval of the capture loop", labels,
+                       lambda: self.scheduler.interval if self.scheduler is not None else self.interval)
+        for name, timer in self.timers.items():
+            registry.histogram("autoshot_stage_seconds", "Latency of each capture stage",
+                               {**labels, "stage": name}, timer)
+        if self.probe_trigger is not None:
+            trigger = self.probe_trigger
+            registry.counter("autoshot_probe_checks_total", "Ticks on which the probes were read", labels,
+                             lambda: trigger.checks)
+            registry.counter("autoshot_probe_skipped_total", "Ticks skipped because no probe changed", labels,
+                             lambda: trigger.stats()["skipped"])
+            registry.histogram("autoshot_stage_seconds", "Latency of each capture stage",
+                               {**labels, "stage": "probe"}, trigger.timer)
+        for stream in self.streams:
+            stream.register_metrics(registry, {**labels, "region": stream.region.name})
+        if self.pipeline is not None:
+            self.pipeline.register_metrics(registry, labels)
 
     def remove_duplicates(self, new_image_path: str):
         """
@@ -110,20 +345,25 @@ class AutoShot:
         Args:
             new_image_path: Path to the newly captured image
         """
+        start = time.perf_counter()
         # Find similar images
         similar_images = self.similarity_detector.find_similar_images(
             new_image_path, 
-            str(self.image_processor.output_dir)
+            str(self.image_processor.output_dir),
+            self.image_processor.index,
+            "*" + self.image_processor.encoder.extension
         )
         
         # Remove similar images (keeping only the newest one)
         for sim_img in similar_images:
             if sim_img != new_image_path:
                 try:
-                    os.remove(sim_img)
-                    print(f"Removed duplicate image: {sim_img}")
+                    self.image_processor.delete_image(sim_img)
+                    self.frames_deleted += 1
+                    log(f"Removed duplicate image: {sim_img}", FRAMES)
                 except OSError as e:
-                    print(f"Could not remove duplicate image {sim_img}: {e}")
+                    log(f"Could not remove duplicate image {sim_img}: {e}", QUIET)
+        self.timers["delete"].record(time.perf_counter() - start)
 
     def get_pixel_at_screenshot_coords(self, hwnd: int, screenshot_x: int, screenshot_y: int) -> Optional[tuple]:
         """
@@ -137,116 +377,501 @@ class AutoShot:
         Returns:
             Tuple of (R, G, B) values or None if failed
         """
+        from .frame_source import Win32FrameSource
+
+        if isinstance(self.frame_source, Win32FrameSource):
+            # The session's cached client rectangle saves the geometry calls per pixel
+            rect = self.frame_source.session.client_rect(hwnd)
+            if rect is None:
+                return None
+            return self.window_manager.get_pixel_color(rect[0] + screenshot_x, rect[1] + screenshot_y)
+
         # Use client area by default for more accurate results
         return self.window_manager.get_pixel_from_screenshot_coords(
             hwnd, screenshot_x, screenshot_y, use_client_area=True
         )
 
-    def single_capture_cycle(self):
+    def make_scheduler(self) -> FixedRateScheduler:
         """
-        Perform a single capture cycle: capture, process, deduplicate
+        Create the scheduler that paces the capture loop
+
+        Returns:
+            AdaptiveScheduler between interval and max_interval if max_interval
+            is set, otherwise a FixedRateScheduler at interval
         """
-        # Find the window
-        hwnd = self.window_manager.find_window(window_name=self.window_title)
-        if hwnd is None:
-            print(f"Window '{self.window_title}' not found.")
-            return False
+        if self.max_interval is not None:
+            return AdaptiveScheduler(self.interval, self.max_interval, self.backoff, self.overrun_policy)
+        return FixedRateScheduler(self.interval, self.overrun_policy)
 
-        # Capture screenshot
-        image_path = self.capture_screenshot(hwnd)
-        if image_path is None:
-            print("Capture failed")
-            return False
+    def report_change(self, changed: bool):
+        """
+        Tell the capture loop's scheduler whether a tick found a new frame,
+        so an adaptive interval backs off or snaps back
 
-        # Check if there are other images in the directory
-        image_files = list(Path(self.image_processor.output_dir).glob("*.png"))
+        Args:
+            changed: True if any region of the capture was new
+        """
+        if self.scheduler is not None:
+            self.scheduler.report(changed)
 
-        if len(image_files) > 1:  # More than just the newly added one
-            # Remove duplicates
-            self.remove_duplicates(image_path)
+    def single_capture_cycle(self):
+        """
+        Perform a single capture cycle: capture, process, deduplicate
+        """
+        start = time.perf_counter()
+        # Capture only the regions' pixels, in memory
+        images = self.grab_regions()
+        if images is None:
+            log("Capture failed", QUIET)
+            return False
 
-        return True
+        # Hash in memory and only encode/save when a region is new
+        success = True
+        changed = False
+        for stream, image in zip(self.streams, images):
+            is_duplicate, image_path = stream.process(image)
+            if is_duplicate:
+                log(f"Duplicate frame skipped ({stream.region.name})", FRAMES)
+            else:
+                changed = True
+                if image_path is None:
+                    success = False
+        self.report_change(changed)
+        self.timers["cycle"].record(time.perf_counter() - start)
+        return success
 
     def start_capture_loop(self):
         """
         Start the continuous capture loop in a separate thread
         """
         if self.running:
-            print("Capture loop is already running")
+            log("Capture loop is already running")
             return
             
         self.running = True
-        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
-        self.capture_thread.start()
-        print("Started capture loop")
+        self.scheduler = self.make_scheduler()
+        if self.pipeline is not None:
+            self.pipeline.start(self.scheduler)
+        else:
+            self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self.capture_thread.start()
+        self.start_retention()
+        log("Started capture loop")
 
     def stop_capture_loop(self):
         """
         Stop the continuous capture loop
         """
         self.running = False
+        if self.scheduler is not None:
+            # Wakes the loop out of its wait instead of letting it sleep out the interval
+            self.scheduler.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
         if self.capture_thread:
             self.capture_thread.join(timeout=5)  # Wait up to 5 seconds for thread to finish
-        print("Stopped capture loop")
+        self.stop_retention()
+        self.flush()
+        log("Stopped capture loop")
+
+    def start_retention(self):
+        """
+        Start enforcing the retention policy of every region in the background
+        """
+        for stream in self.streams:
+            if stream.retention is not None:
+                stream.retention.start()
+
+    def stop_retention(self):
+        """
+        Stop the background retention threads
+        """
+        for stream in self.streams:
+            if stream.retention is not None:
+                stream.retention.stop()
+
+    def flush(self):
+        """
+        Finish the open archive segments and transcript tiles of all regions
+        (no-op for file storage)
+        """
+        for stream in self.streams:
+            stream.image_processor.flush()
 
     def _capture_loop(self):
         """
         Internal capture loop that runs in a separate thread
         """
-        while self.running:
-            self.single_capture_cycle()
-            time.sleep(self.interval)
+        while self.running and self.scheduler.wait():
+            if self.should_capture():
+                self.single_capture_cycle()
+            else:
+                self.report_change(False)
 
     def run_once(self):
         """
         Run a single capture cycle and exit
         """
-        print(f"Setting up window '{self.window_title}' to {self.width}x{self.height}")
+        log(f"Setting up window '{self.window_title}' to {self.width}x{self.height}")
         if not self.setup_window():
             return
             
-        print("Performing single capture cycle...")
+        log("Performing single capture cycle...")
         self.single_capture_cycle()
+        self.flush()
 
 
-def main():
+def load_targets(path: str, args) -> List[AutoShot]:
     """
-    Main entry point for the application
+    Build the AutoShot targets of a multi-window configuration file
+
+    The file is a JSON list of objects with the keys "title", "width",
+    "height" and optionally "interval", "roi" (list of NAME=L,T,R,B specs),
+    "probe" (list of NAME=X,Y or NAME=L,T,R,B specs), "output_dir",
+    "overrun_policy" and "max_interval"; missing optional keys fall back to
+    the command line options.
+
+    Args:
+        path: Path to the JSON file
+        args: Parsed command line arguments, for the defaults
+
+    Returns:
+        List of AutoShot instances
+    """
+    import json
+
+    from .frame_source import SyntheticFrameSource
+
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    targets = []
+    for entry in config:
+        frame_source = None
+        if args.source == "synthetic":
+            frame_source = SyntheticFrameSource(entry["width"], entry["height"], change_rate=args.change_rate, seed=None)
+        regions = [parse_region(spec) for spec in entry.get("roi", [])] or None
+        probes = [parse_probe(spec) for spec in entry["probe"]] if "probe" in entry else args.probe
+        targets.append(AutoShot(entry["title"], entry["width"], entry["height"],
+                                entry.get("interval", args.interval), frame_source=frame_source,
+                                output_dir=entry.get("output_dir", str(Path(args.output_dir) / entry["title"])),
+                                regions=regions, overrun_policy=entry.get("overrun_policy", args.overrun_policy),
+                                change_gate=not args.no_change_gate, encoder=make_encoder(args),
+                                storage=args.storage, segment_size=args.segment_size * 1024 * 1024,
+                                keyframe_interval=args.keyframe_interval, retention=make_retention(args),
+                                probes=probes, probe_max_interval=args.probe_max_interval,
+                                exact_match=not args.no_exact_match, verifier=make_verifier(args),
+                                max_interval=entry.get("max_interval", args.max_interval), backoff=args.backoff))
+    return targets
+
+
+def make_encoder(args) -> ImageEncoder:
+    """
+    Build the frame encoder from the command line options
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        ImageEncoder
+    """
+    from .encoder import ImageEncoder
+
+    return ImageEncoder(args.format, compress_level=args.compress_level, optimize=args.png_optimize,
+                        webp_method=args.webp_method)
+
+
+def make_verifier(args) -> Optional[Verifier]:
+    """
+    Build the dedupe verifier from the command line options
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Verifier, or None without --verify
+    """
+    if args.verify is None:
+        return None
+    from .similarity_detector import Verifier
+
+    return Verifier(args.verify, args.verify_radius, args.verify_threshold)
+
+
+def make_retention(args) -> Optional[RetentionPolicy]:
+    """
+    Build the retention policy from the command line options
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        RetentionPolicy, or None if no limit was given
+    """
+    policy = RetentionPolicy(args.max_bytes, args.max_frames, args.max_age, args.thin)
+    return policy if policy.enabled else None
+
+
+def build_parser():
+    """
+    Build the command line parser
+
+    Returns:
+        argparse.ArgumentParser
     """
     import argparse
 
+    from .encoder import ENCODER_FORMATS
+    from .image_processor import STORAGE_BACKENDS
+    from .pipeline import OVERLOAD_POLICIES
+    from .similarity_detector import VERIFY_METHODS
+
     parser = argparse.ArgumentParser(description="AutoShot - Automatic Window Screenshot Tool")
-    parser.add_argument("--title", required=True, help="Title of the window to capture")
-    parser.add_argument("--width", type=int, required=True, help="Target width for the window")
-    parser.add_argument("--height", type=int, required=True, help="Target height for the window")
-    parser.add_argument("--interval", type=int, default=2, help="Time interval between screenshots in seconds (default: 2)")
+    parser.add_argument("--title", help="Title of the window to capture (required unless --targets is given)")
+    parser.add_argument("--width", type=int, help="Target width for the window (required unless --targets is given)")
+    parser.add_argument("--height", type=int, help="Target height for the window (required unless --targets is given)")
+    parser.add_argument("--targets", metavar="FILE",
+                        help="JSON file of windows to capture from one process, each with title, width, height "
+                             "and optionally interval, roi, probe, output_dir and overrun_policy")
+    parser.add_argument("--capture-workers", type=int, default=4,
+                        help="Capture/hash workers shared by the targets (with --targets, default: 4)")
+    parser.add_argument("--interval", type=float, default=2,
+                        help="Time interval between screenshots in seconds, fractions allowed (default: 2)")
+    parser.add_argument("--max-interval", type=float,
+                        help="Capture adaptively: back off from --interval up to this many seconds while frames "
+                             "are duplicates, and return to --interval on the first new frame")
+    parser.add_argument("--backoff", type=float, default=2.0,
+                        help="With --max-interval, factor the interval grows by after each capture without "
+                             "a new frame (default: 2)")
+    parser.add_argument("--overrun-policy", choices=OVERRUN_POLICIES, default="skip",
+                        help="What to do when a capture takes longer than the interval: skip the missed "
+                             "captures or coalesce them into one immediate capture (default: skip)")
     parser.add_argument("--once", action="store_true", help="Run only once instead of continuously")
     parser.add_argument("--query-pixel", nargs=2, type=int, metavar=('X', 'Y'),
                         help="Query the RGB color of a pixel at the given screenshot coordinates (X Y)")
+    parser.add_argument("--source", choices=["window", "replay", "synthetic"], default="window",
+                        help="Frame source: the live window (default), a recording, or generated frames")
+    parser.add_argument("--replay-path", help="Directory of images or video file to replay (with --source replay)")
+    parser.add_argument("--replay-fps", type=float, default=None,
+                        help="Replay rate in frames per second (default: one frame per capture)")
+    parser.add_argument("--change-rate", type=float, default=0.2,
+                        help="Probability that a synthetic frame changes (with --source synthetic, default: 0.2)")
+    parser.add_argument("--output-dir", default="chat_shot", help="Directory to save screenshots to (default: chat_shot)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Run capture, hashing and encoding as concurrent stages")
+    parser.add_argument("--overload-policy", choices=OVERLOAD_POLICIES, default="drop-oldest",
+                        help="What to do with new frames when hashing falls behind (default: drop-oldest)")
+    parser.add_argument("--encode-workers", type=int, default=2, help="Encode/save workers when pipelined or with --targets (default: 2)")
+    parser.add_argument("--encode-processes", action="store_true",
+                        help="Hash and encode frames in worker processes, passed through shared memory, "
+                             "when pipelined or with --targets")
+    parser.add_argument("--format", choices=tuple(ENCODER_FORMATS), default="png",
+                        help="Format of saved frames: png, lossless webp, qoi, or uncompressed bmp (fastest) "
+                             "(default: png)")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="PNG zlib compression level; 1 is about twice as fast (default: 6)")
+    parser.add_argument("--png-optimize", action="store_true", help="Search for the smallest PNG encoding (slow)")
+    parser.add_argument("--webp-method", type=int, default=4, choices=range(7), metavar="0-6",
+                        help="Lossless WebP effort, 0 fastest to 6 smallest (default: 4)")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default="files",
+                        help="Save one file per frame, append frames to rolling segment files "
+                             "(read them with python -m autoshot.archive), or stitch scrolling frames "
+                             "into a tall transcript keeping only the newly revealed rows (default: files)")
+    parser.add_argument("--segment-size", type=int, default=64, metavar="MB",
+                        help="Size at which an archive segment is closed (default: 64)")
+    parser.add_argument("--keyframe-interval", type=int, default=1, metavar="N",
+                        help="With --storage archive, store every N-th frame in full and only the changed "
+                             "tiles of the frames in between (default: 1, every frame in full)")
+    parser.add_argument("--max-bytes", type=parse_size, metavar="SIZE",
+                        help="Remove the oldest frames once the saved frames of a region exceed SIZE, e.g. 20G")
+    parser.add_argument("--max-frames", type=int, metavar="N",
+                        help="Remove the oldest frames once a region has more than N saved frames")
+    parser.add_argument("--max-age", type=parse_duration, metavar="AGE",
+                        help="Remove frames older than AGE, e.g. 30d")
+    parser.add_argument("--thin", type=parse_thinning, metavar="AGE:SPACING,...",
+                        help="Keep frames older than AGE at most one per SPACING, e.g. 1h:10s,1d:5m,7d:1h")
+    parser.add_argument("--no-change-gate", action="store_true",
+                        help="Hash every frame instead of skipping frames identical to the previous one")
+    parser.add_argument("--no-exact-match", action="store_true",
+                        help="Hash every frame instead of first looking up a digest of its pixels")
+    parser.add_argument("--verify", choices=VERIFY_METHODS,
+                        help="Check frames whose hash is within --verify-radius bits of a saved frame with a "
+                             "16x16 hash (fine) or an SSIM of 128x128 thumbnails (ssim) before calling them duplicates")
+    parser.add_argument("--verify-radius", type=int, default=4, metavar="BITS",
+                        help="Hamming distance of the 64-bit hash up to which --verify checks a frame (default: 4)")
+    parser.add_argument("--verify-threshold", type=float, metavar="VALUE",
+                        help="Most differing bits of the 16x16 hash (default: 2) or least SSIM of any window "
+                             "(default: 0.8) for a duplicate")
+    parser.add_argument("--roi", action="append", type=parse_region, metavar="NAME=L,T,R,B",
+                        help="Capture region in client coordinates; fractions if any value has a decimal point "
+                             "(repeatable, default: top half)")
+    parser.add_argument("--probe", action="append", type=parse_probe, metavar="NAME=X,Y",
+                        help="Pixel (NAME=X,Y) or small region (NAME=L,T,R,B) in client coordinates to watch; "
+                             "each tick reads only the probes and captures only when one changed (repeatable)")
+    parser.add_argument("--probe-max-interval", type=float, default=60, metavar="SECONDS",
+                        help="With --probe, capture at least this often even if no probe changed (default: 60)")
+    parser.add_argument("--verbosity", type=int, choices=(QUIET, EVENTS, FRAMES), default=FRAMES,
+                        help="0: errors only, 1: also capture loop events, 2: also every frame (default: 2)")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="Append a JSON line with all counters, gauges and latency histograms periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10,
+                        help="Seconds between lines of --metrics-file (default: 10)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve metrics in the Prometheus text format on localhost:PORT/metrics")
 
-    args = parser.parse_args()
+    return parser
 
-    autoshot = AutoShot(args.title, args.width, args.height, args.interval)
 
-    if args.query_pixel:
-        # Query pixel functionality
-        hwnd = autoshot.window_manager.find_window(window_name=args.title)
-        if hwnd is None:
-            print(f"Window '{args.title}' not found.")
-            return
-            
-        x, y = args.query_pixel
-        rgb_color = autoshot.get_pixel_at_screenshot_coords(hwnd, x, y)
-        
-        if rgb_color:
-            r, g, b = rgb_color
-            print(f"Pixel at ({x}, {y}) in screenshot corresponds to screen pixel with RGB({r}, {g}, {b})")
-        else:
-            print(f"Could not get pixel color at ({x}, {y}) in screenshot")
-    elif args.once:
+def start_metrics(registry: MetricsRegistry, args) -> list:
+    """
+    Start the metrics exporters requested on the command line
+
+    Args:
+        registry: Metrics to export
+        args: Parsed command line arguments
+
+    Returns:
+        Started exporters; call stop() on each when done
+    """
+    exporters = []
+    if args.metrics_file:
+        exporters.append(MetricsDumper(registry, args.metrics_file, args.metrics_interval))
+    if args.metrics_port is not None:
+        exporters.append(MetricsServer(registry, args.metrics_port))
+        log(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+    for exporter in exporters:
+        exporter.start()
+    return exporters
+
+
+def query_pixel(argv: List[str]) -> int:
+    """
+    Print the color of a pixel of a window: the --query-pixel path
+
+    Only the Windows API wrapper is loaded, none of the imaging libraries,
+    so scripts can launch pixel probes many times a minute. Capture options
+    on the same command line are accepted and ignored.
+
+    Args:
+        argv: Command line arguments, without the program name
+
+    Returns:
+        Exit status: 0 if the pixel was read, 1 otherwise
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="autoshot", description="Query a pixel of a window")
+    parser.add_argument("--title", required=True, help="Title of the window")
+    parser.add_argument("--query-pixel", nargs=2, type=int, required=True, metavar=("X", "Y"),
+                        help="Screenshot coordinates of the pixel")
+    parser.add_argument("--source", default="window")
+    args, _ = parser.parse_known_args(argv)
+    if args.source != "window":
+        parser.error("--query-pixel needs a window source")
+
+    from .window_manager import WindowManager
+
+    try:
+        window_manager = WindowManager()
+    except OSError as e:
+        print(e)
+        return 1
+    hwnd = window_manager.find_window(window_name=args.title)
+    if hwnd is None:
+        print(f"Window '{args.title}' not found.")
+        return 1
+
+    x, y = args.query_pixel
+    rgb_color = window_manager.get_pixel_from_screenshot_coords(hwnd, x, y, use_client_area=True)
+    if rgb_color:
+        r, g, b = rgb_color
+        print(f"Pixel at ({x}, {y}) in screenshot corresponds to screen pixel with RGB({r}, {g}, {b})")
+        return 0
+    print(f"Could not get pixel color at ({x}, {y}) in screenshot")
+    return 1
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Main entry point for the application
+
+    Args:
+        argv: Command line arguments, without the program name (optional,
+            defaults to sys.argv[1:])
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["dedupe"]:
+        from .dedupe import main as dedupe_main
+        dedupe_main(argv[1:])
+        return
+    if "--query-pixel" in argv and "-h" not in argv and "--help" not in argv:
+        sys.exit(query_pixel(argv))
+
+    from .frame_source import ReplayFrameSource, SyntheticFrameSource
+    from .multi_capture import MultiCapture
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    set_verbosity(args.verbosity)
+    if args.storage != "files" and make_retention(args) is not None:
+        parser.error("--max-bytes, --max-frames, --max-age and --thin need --storage files")
+    if args.max_interval is not None and not 0 < args.interval <= args.max_interval:
+        parser.error("--max-interval needs a positive --interval no larger than it")
+    if args.backoff < 1:
+        parser.error("--backoff must be at least 1")
+
+    if args.targets:
+        if args.source == "replay":
+            parser.error("--targets supports the window and synthetic sources")
+        manager = MultiCapture(load_targets(args.targets, args), capture_workers=args.capture_workers,
+                               encode_workers=args.encode_workers, encode_processes=args.encode_processes)
+        for target in manager.targets:
+            target.setup_window()
+        print(f"Starting capture of {len(manager.targets)} windows...")
+        exporters = start_metrics(manager.metrics, args)
+        manager.start()
+        try:
+            while manager.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\nStopping...")
+            manager.stop()
+        finally:
+            for exporter in exporters:
+                exporter.stop()
+        return
+
+    if args.title is None or args.width is None or args.height is None:
+        parser.error("--title, --width and --height are required unless --targets is given")
+
+    frame_source = None
+    if args.source == "replay":
+        if not args.replay_path:
+            parser.error("--source replay requires --replay-path")
+        frame_source = ReplayFrameSource(args.replay_path, fps=args.replay_fps)
+    elif args.source == "synthetic":
+        frame_source = SyntheticFrameSource(args.width, args.height, change_rate=args.change_rate)
+
+    autoshot = AutoShot(args.title, args.width, args.height, args.interval,
+                        frame_source=frame_source, output_dir=args.output_dir, regions=args.roi,
+                        pipelined=args.pipelined, overload_policy=args.overload_policy,
+                        encode_workers=args.encode_workers, encode_processes=args.encode_processes,
+                        overrun_policy=args.overrun_policy, change_gate=not args.no_change_gate,
+                        encoder=make_encoder(args), storage=args.storage,
+                        segment_size=args.segment_size * 1024 * 1024, keyframe_interval=args.keyframe_interval,
+                        retention=make_retention(args), probes=args.probe,
+                        probe_max_interval=args.probe_max_interval, exact_match=not args.no_exact_match,
+                        verifier=make_verifier(args), max_interval=args.max_interval, backoff=args.backoff)
+
+    if args.once:
+        exporters = start_metrics(autoshot.metrics, args)
         autoshot.run_once()
+        for exporter in exporters:
+            exporter.stop()
     else:
         print(f"Starting continuous capture of '{args.title}' every {args.interval}s...")
+        exporters = start_metrics(autoshot.metrics, args)
         autoshot.start_capture_loop()
 
         try:
@@ -256,6 +881,9 @@ def main():
         except KeyboardInterrupt:
             print("\nStopping...")
             autoshot.stop_capture_loop()
+        finally:
+            for exporter in exporters:
+                exporter.stop()
 
 
 if __name__ == "__main__":
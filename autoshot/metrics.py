@@ -0,0 +1,381 @@
+"""
+Metrics Module
+Counters, gauges and latency histograms, with JSON-lines and Prometheus export
+"""
+import bisect
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Verbosity levels of log(): errors are always printed, capture loop events
+# (window found, loop started) from EVENTS on, every frame from FRAMES on
+QUIET = 0
+EVENTS = 1
+FRAMES = 2
+
+_verbosity = FRAMES
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def set_verbosity(level: int):
+    """
+    Set how much log() prints
+
+    Args:
+        level: QUIET (errors only), EVENTS or FRAMES (default, every frame)
+    """
+    global _verbosity
+    _verbosity = level
+
+
+def get_verbosity() -> int:
+    """Current verbosity level"""
+    return _verbosity
+
+
+def log(message: str, level: int = EVENTS):
+    """
+    Print a message if the verbosity level includes it
+
+    Args:
+        message: Message to print
+        level: QUIET for errors, EVENTS or FRAMES
+    """
+    if level <= _verbosity:
+        print(message)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Latency histogram with fixed buckets
+
+        Recording is a bisect and a few additions under a lock, cheap
+        enough for every frame. Percentiles are estimated from the buckets
+        (as the upper bound of the bucket they fall in, capped at the max).
+
+        Args:
+            buckets: Increasing upper bounds of the buckets in seconds; an
+                overflow bucket is added
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds: float):
+        """
+        Record one stage execution
+
+        Args:
+            seconds: Time the stage took
+        """
+        position = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[position] += 1
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate a percentile in seconds
+
+        Args:
+            fraction: Percentile as a fraction, e.g. 0.95
+
+        Returns:
+            Upper bound of the bucket holding the percentile, at most the max
+        """
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = fraction * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def stats(self) -> dict:
+        """
+        Get the latency statistics in milliseconds
+
+        Returns:
+            Dictionary with count, mean_ms, max_ms, last_ms, p50_ms, p95_ms and p99_ms
+        """
+        with self._lock:
+            mean = self.total / self.count if self.count else 0.0
+            stats = {"count": self.count, "mean_ms": mean * 1000,
+                     "max_ms": self.max * 1000, "last_ms": self.last * 1000}
+        for name, fraction in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            stats[name] = self.percentile(fraction) * 1000
+        return stats
+
+
+class Counter:
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        """
+        Monotonic counter
+
+        Args:
+            func: Function returning the current value, for counts that are
+                already kept elsewhere (optional; otherwise use inc())
+        """
+        self.func = func
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount: float = 1):
+        """Add to the counter"""
+        with self._lock:
+            self._value += amount
+
+    def value(self) -> float:
+        """Current value"""
+        return self.func() if self.func is not None else self._value
+
+
+class Gauge:
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        """
+        Value that goes up and down, like a queue depth
+
+        Args:
+            func: Function returning the current value, read when the metrics
+                are collected (optional; otherwise use set())
+        """
+        self.func = func
+        self._value = 0
+
+    def set(self, value: float):
+        """Set the value"""
+        self._value = value
+
+    def value(self) -> float:
+        """Current value"""
+        return self.func() if self.func is not None else self._value
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Named metrics with optional labels, readable as a dict or in the
+        Prometheus text format
+        """
+        self._lock = threading.Lock()
+        # name -> (type, description, {labels: metric})
+        self._metrics: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+
+    def _add(self, kind: str, name: str, description: str, labels: Optional[dict], factory: Callable[[], object]):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            entry = self._metrics.setdefault(name, (kind, description, {}))
+            if entry[0] != kind:
+                raise ValueError(f"Metric '{name}' is already registered as a {entry[0]}")
+            if key not in entry[2]:
+                entry[2][key] = factory()
+            return entry[2][key]
+
+    def counter(self, name: str, description: str, labels: Optional[dict] = None,
+                func: Optional[Callable[[], float]] = None) -> Counter:
+        """
+        Get or create a counter
+
+        Args:
+            name: Metric name, e.g. "autoshot_frames_saved_total"
+            description: One-line description (the Prometheus HELP text)
+            labels: Label names and values (optional)
+            func: Function returning the value (optional, see Counter)
+
+        Returns:
+            The counter registered under the name and labels
+        """
+        return self._add("counter", name, description, labels, lambda: Counter(func))
+
+    def gauge(self, name: str, description: str, labels: Optional[dict] = None,
+              func: Optional[Callable[[], float]] = None) -> Gauge:
+        """
+        Get or create a gauge; see counter()
+        """
+        return self._add("gauge", name, description, labels, lambda: Gauge(func))
+
+    def histogram(self, name: str, description: str, labels: Optional[dict] = None,
+                  histogram: Optional[Histogram] = None) -> Histogram:
+        """
+        Get or create a latency histogram in seconds
+
+        Args:
+            name: Metric name, e.g. "autoshot_stage_seconds"
+            description: One-line description (the Prometheus HELP text)
+            labels: Label names and values (optional)
+            histogram: Existing Histogram to register (optional)
+
+        Returns:
+            The histogram registered under the name and labels
+        """
+        return self._add("histogram", name, description, labels, lambda: histogram or Histogram())
+
+    def _items(self) -> List[Tuple[str, str, str, List[Tuple[Labels, object]]]]:
+        with self._lock:
+            return [(name, kind, description, list(metrics.items()))
+                    for name, (kind, description, metrics) in self._metrics.items()]
+
+    def stats(self) -> dict:
+        """
+        Get the current value of every metric
+
+        Returns:
+            Dictionary with "counters", "gauges" and "histograms", each
+            mapping 'name{label="value"}' to a value (histograms: their stats())
+        """
+        result = {"counters": {}, "gauges": {}, "histograms": {}}
+        for name, kind, _, metrics in self._items():
+            for labels, metric in metrics:
+                key = name + _format_labels(labels)
+                result[kind + "s"][key] = metric.stats() if kind == "histogram" else metric.value()
+        return result
+
+    def prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+
+        Returns:
+            Exposition text
+        """
+        lines = []
+        for name, kind, description, metrics in self._items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value()}")
+                    continue
+                with metric._lock:
+                    counts, count, total = list(metric.counts), metric.count, metric.total
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_label = f'le="{le}"'
+                    lines.append(f"{name}_bucket{_format_labels(labels, bucket_label)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsDumper:
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 10):
+        """
+        Append a snapshot of the metrics to a JSON-lines file periodically
+
+        Each line is the registry's stats() plus a "time" field (Unix
+        seconds). A last line is written on stop().
+
+        Args:
+            registry: Metrics to dump
+            path: File to append to
+            interval: Seconds between snapshots
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def dump(self):
+        """
+        Append one snapshot now
+        """
+        line = json.dumps({"time": time.time(), **self.registry.stats()})
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def start(self):
+        """Start dumping in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="autoshot-metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        """Stop dumping and write a last snapshot"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(5)
+            self._thread = None
+            self.dump()
+
+
+class MetricsServer:
+    def __init__(self, registry: MetricsRegistry, port: int = 9464, host: str = "127.0.0.1"):
+        """
+        Serve the metrics in the Prometheus text format at /metrics
+
+        Args:
+            registry: Metrics to serve
+            port: TCP port; 0 picks a free one (see the port attribute)
+            host: Address to listen on (default localhost only)
+        """
+        # Not needed unless metrics are served, and slow to import
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry_.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes would otherwise print a line each
+                pass
+
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="autoshot-metrics-http",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
@@ -0,0 +1,247 @@
+"""
+Multi Capture Module
+Capture many windows from one process on shared worker pools
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .frame_ring import SharedFramePool
+from .metrics import QUIET, Histogram, MetricsRegistry, log
+from .pipeline import BoundedQueue, QueueClosed
+from .similarity_detector import hash_to_int
+
+
+class MultiCapture:
+    def __init__(self, targets: Optional[list] = None, capture_workers: int = 4, encode_workers: int = 2,
+                 encode_queue_size: int = 64, encode_processes: bool = False):
+        """
+        Capture several targets from one process
+
+        Each target is an AutoShot with its own window, interval, regions,
+        output directory, dedupe state and counters. A single dispatcher
+        thread keeps every target on its fixed-rate schedule and hands due
+        targets to a shared pool of capture workers, which grab and dedupe;
+        new frames go to a shared pool of encode workers. A target never
+        has two cycles in flight, so its frames are deduped in order, and a
+        cycle that outlasts the target's interval is handled by the target's
+        overrun policy.
+
+        Args:
+            targets: AutoShot instances to capture (optional, see add_target)
+            capture_workers: Number of capture/hash worker threads
+            encode_workers: Number of encode/save worker threads
+            encode_queue_size: Capacity of the shared encode queue
+            encode_processes: Encode frames in a process pool instead of the
+                worker threads, handing them over through shared memory
+                (writing stays in the threads)
+        """
+        self.targets = []
+        self.capture_workers = capture_workers
+        self.encode_workers = encode_workers
+        self.encode_queue_size = encode_queue_size
+        self.encode_queue = BoundedQueue(encode_queue_size, "block")
+        self.encode_processes = encode_processes
+
+        self.timers = {name: Histogram() for name in ("cycle", "encode", "end_to_end")}
+        self.capture_failures = 0
+        # Capture workers count failures concurrently
+        self._failures_lock = threading.Lock()
+        self.metrics = MetricsRegistry()
+        # Read through self, as start() replaces the queue
+        self.metrics.gauge("autoshot_queue_depth", "Items waiting in a pipeline queue", {"queue": "encode"},
+                           lambda: len(self.encode_queue))
+        for name, timer in self.timers.items():
+            self.metrics.histogram("autoshot_pipeline_stage_seconds", "Latency of each pipeline stage",
+                                   {"stage": name}, timer)
+
+        self._running = False
+        self._cond = threading.Condition()
+        self._ready: list = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._capture_pool: Optional[ThreadPoolExecutor] = None
+        self._frame_pool: Optional[SharedFramePool] = None
+        self._encode_threads: List[threading.Thread] = []
+
+        for target in targets or []:
+            self.add_target(target)
+
+    def add_target(self, target):
+        """
+        Add a target; targets added while running start on the next dispatch
+
+        Args:
+            target: AutoShot instance
+
+        Raises:
+            ValueError: If a target with the same window title already exists
+        """
+        if any(existing.window_title == target.window_title for existing in self.targets):
+            raise ValueError(f"Target '{target.window_title}' already exists")
+        self.targets.append(target)
+        target.register_metrics(self.metrics, {"target": target.window_title})
+        if self._running:
+            self._schedule(target)
+
+    def start(self):
+        """
+        Start the dispatcher and the worker pools
+        """
+        if self._running:
+            return
+        self._running = True
+        # stop() closes the queue; a restart needs an open one
+        self.encode_queue = BoundedQueue(self.encode_queue_size, "block")
+        self._capture_pool = ThreadPoolExecutor(self.capture_workers, thread_name_prefix="autoshot-capture")
+        if self.encode_processes:
+            self._frame_pool = SharedFramePool(self.encode_workers, 2 * self.encode_workers)
+            self._frame_pool.start()
+        self._encode_threads = [threading.Thread(target=self._encode_loop, name=f"autoshot-encode-{i}", daemon=True)
+                                for i in range(self.encode_workers)]
+        for thread in self._encode_threads:
+            thread.start()
+        for target in self.targets:
+            self._schedule(target)
+            target.start_retention()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="autoshot-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self, timeout: float = 5):
+        """
+        Stop dispatching and let the cycles in flight and queued frames finish
+
+        Args:
+            timeout: Seconds to wait for each thread
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout)
+            self._dispatcher = None
+        if self._capture_pool is not None:
+            self._capture_pool.shutdown(wait=True)
+            self._capture_pool = None
+        self.encode_queue.close()
+        for thread in self._encode_threads:
+            thread.join(timeout)
+        self._encode_threads = []
+        if self._frame_pool is not None:
+            self._frame_pool.shutdown()
+        for target in self.targets:
+            if target.scheduler is not None:
+                target.scheduler.stop()
+            target.stop_retention()
+            target.flush()
+        self._ready = []
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _schedule(self, target):
+        # Queue the target's next tick; called when it has no cycle in flight
+        if target.scheduler is None or target.scheduler.stopped:
+            target.scheduler = target.make_scheduler()
+        with self._cond:
+            if not self._running:
+                return
+            heapq.heappush(self._ready, (target.scheduler.next_deadline(), next(self._seq), target))
+            self._cond.notify_all()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while self._running:
+                if not self._ready:
+                    self._cond.wait()
+                    continue
+                deadline, _, target = self._ready[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    # Also wakes up for stop() and for targets due earlier
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._ready)
+                target.scheduler.mark_tick(deadline)
+                self._capture_pool.submit(self._run_cycle, target)
+
+    def _run_cycle(self, target):
+        start = time.monotonic()
+        try:
+            if not target.should_capture():
+                target.report_change(False)
+                return
+            images = target.grab_regions()
+            if images is None:
+                with self._failures_lock:
+                    self.capture_failures += 1
+                return
+            changed = False
+            for stream, image in zip(target.streams, images):
+                is_duplicate, phash = stream.check(image)
+                if not is_duplicate:
+                    # Accept now so the target's next frame is compared against this one
+                    stream.accept(phash)
+                    changed = True
+                    turn = stream.take_turn()
+                    if not self.encode_queue.put((start, stream, image, hash_to_int(phash), turn)):
+                        # Closed by stop(): the frame will never be saved
+                        stream.cancel_turn(turn)
+                        stream.reject(hash_to_int(phash))
+            target.report_change(changed)
+        except Exception as e:
+            log(f"Error in capture cycle of '{target.window_title}': {e}", QUIET)
+        finally:
+            self.timers["cycle"].record(time.monotonic() - start)
+            self._schedule(target)
+
+    def _encode_loop(self):
+        while True:
+            try:
+                captured_at, stream, image, hash_value, turn = self.encode_queue.get()
+            except QueueClosed:
+                return
+            start = time.monotonic()
+            if self._frame_pool is not None and not stream.image_processor.needs_raw_frames:
+                try:
+                    data = self._frame_pool.encode(image, stream.image_processor.encoder).result()
+                except Exception as e:
+                    # A failed or lost worker process must not take this thread down
+                    log(f"Error encoding screenshot: {e}", QUIET)
+                    saved_path = None
+                else:
+                    saved_path = stream.save_encoded(data, hash_value)
+            else:
+                # Deltas and transcripts depend on the previous frame: the turn keeps the workers in capture order
+                saved_path = stream.save(image, hash_value, turn)
+            if saved_path is None:
+                # The capture worker accepted the frame before it reached the disk
+                stream.reject(hash_value)
+            finished = time.monotonic()
+            self.timers["encode"].record(finished - start)
+            self.timers["end_to_end"].record(finished - captured_at)
+
+    def stats(self) -> dict:
+        """
+        Get counters summed over all targets, per target and per shared stage
+
+        Returns:
+            Dictionary of statistics; "targets" maps window titles to each
+            target's own stats()
+        """
+        per_target = {target.window_title: target.stats() for target in self.targets}
+        totals = {}
+        for target_stats in per_target.values():
+            for key in ("frames_captured", "frames_saved", "frames_skipped", "bytes_written"):
+                totals[key] = totals.get(key, 0) + target_stats[key]
+        totals["capture_failures"] = self.capture_failures
+        totals["encode_queue_depth"] = len(self.encode_queue)
+        totals["encode_queue_max_depth"] = self.encode_queue.max_depth
+        totals["latency"] = {name: timer.stats() for name, timer in self.timers.items()}
+        totals["shared_memory"] = self._frame_pool.stats() if self._frame_pool is not None else None
+        totals["targets"] = per_target
+        return totals
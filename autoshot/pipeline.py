@@ -0,0 +1,390 @@
+"""
+Pipeline Module
+Staged capture: a capture thread, a hash/dedupe worker and an encode/save pool
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, List, Optional
+
+from .frame_ring import SharedFramePool, frame_bytes, frame_features
+from .metrics import QUIET, Histogram, log
+from .scheduler import FixedRateScheduler
+from .similarity_detector import hash_to_int, int_to_hash
+
+
+OVERLOAD_POLICIES = ("drop-oldest", "drop-newest", "block")
+
+
+class QueueClosed(Exception):
+    """Raised by BoundedQueue.get() once the queue is closed and drained"""
+
+
+class BoundedQueue:
+    def __init__(self, maxsize: int, policy: str = "block"):
+        """
+        FIFO queue with a fixed capacity and a policy for when it is full
+
+        Args:
+            maxsize: Maximum number of queued items
+            policy: "drop-oldest" evicts the oldest item, "drop-newest" rejects
+                the new item, "block" waits for room
+
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy '{policy}', expected one of {OVERLOAD_POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item: Any) -> bool:
+        """
+        Add an item, applying the overload policy if the queue is full
+
+        Args:
+            item: Item to add
+
+        Returns:
+            True if the item was queued, False if it was dropped
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop-newest":
+                    self.dropped += 1
+                    return False
+                if self.policy == "drop-oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return False
+            self._items.append(item)
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Remove and return the oldest item, waiting for one if needed
+
+        Args:
+            timeout: Seconds to wait (optional, waits forever if None)
+
+        Returns:
+            The oldest item
+
+        Raises:
+            QueueClosed: If the queue is closed and empty
+            TimeoutError: If no item arrived within the timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                raise TimeoutError
+            if not self._items:
+                raise QueueClosed
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """
+        Stop accepting items; get() keeps returning queued items, then raises QueueClosed
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+
+class CapturePipeline:
+    def __init__(self, autoshot, queue_size: int = 8, overload_policy: str = "drop-oldest",
+                 encode_workers: int = 2, encode_queue_size: int = 16, use_processes: bool = False):
+        """
+        Run AutoShot's capture cycle as concurrent stages
+
+        The capture thread grabs the regions on a fixed-rate schedule and puts them on a
+        bounded queue; overload_policy decides what happens when the hash
+        worker falls behind. The hash worker dedupes in memory and hands new
+        frames to the encode workers through a second queue, which blocks, so
+        a slow disk pushes back on the hash worker and, through the capture
+        queue's policy, never on the capture cadence.
+
+        Args:
+            autoshot: AutoShot instance whose frame source and streams are used
+            queue_size: Capacity of the capture queue
+            overload_policy: "drop-oldest", "drop-newest" or "block"
+            encode_workers: Number of encode/save worker threads
+            encode_queue_size: Capacity of the encode queue
+            use_processes: Hash and encode frames in encode_workers worker
+                processes, which read them from a shared-memory ring instead
+                of receiving pickled copies; the dedupe decisions stay in the
+                hash thread and writing in the encode threads
+        """
+        self.autoshot = autoshot
+        self.queue_size = queue_size
+        self.overload_policy = overload_policy
+        self.encode_queue_size = encode_queue_size
+        self.capture_queue = BoundedQueue(queue_size, overload_policy)
+        self.encode_queue = BoundedQueue(encode_queue_size, "block")
+        self.encode_workers = encode_workers
+        self.use_processes = use_processes
+
+        self.timers = {name: Histogram() for name in ("capture", "hash", "encode", "end_to_end")}
+        self.capture_failures = 0
+
+        self._running = False
+        self.scheduler: Optional[FixedRateScheduler] = None
+        self._threads: List[threading.Thread] = []
+        self.frame_pool: Optional[SharedFramePool] = None
+        # Frames the hash thread has handed to the workers and not decided yet
+        self.hash_window = 2 * encode_workers
+
+    def start(self, scheduler: Optional[FixedRateScheduler] = None):
+        """
+        Start the capture thread, the hash worker and the encode workers
+
+        Args:
+            scheduler: Scheduler that paces the capture thread (optional,
+                created by the AutoShot's make_scheduler())
+        """
+        if self._running:
+            return
+        self._running = True
+        # stop() closes the queues; a restart needs open ones
+        self.capture_queue = BoundedQueue(self.queue_size, self.overload_policy)
+        self.encode_queue = BoundedQueue(self.encode_queue_size, "block")
+        if scheduler is None:
+            scheduler = self.autoshot.make_scheduler()
+        self.scheduler = scheduler
+        hash_loop = self._hash_loop
+        if self.use_processes:
+            # Room for the frames being hashed, being encoded and one more capture
+            regions = len(self.autoshot.streams)
+            self.frame_pool = SharedFramePool(self.encode_workers,
+                                              (self.hash_window + self.encode_workers + 1) * regions)
+            self.frame_pool.start()
+            hash_loop = self._shared_hash_loop
+        self._threads = [threading.Thread(target=self._capture_loop, name="autoshot-capture", daemon=True),
+                         threading.Thread(target=hash_loop, name="autoshot-hash", daemon=True)]
+        self._threads += [threading.Thread(target=self._encode_loop, name=f"autoshot-encode-{i}", daemon=True)
+                          for i in range(self.encode_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5):
+        """
+        Stop capturing and let the queued frames drain through hash and encode
+
+        Args:
+            timeout: Seconds to wait for each thread
+        """
+        self._running = False
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        capture_thread, hash_thread, *encode_threads = self._threads or [None, None]
+        if capture_thread is not None:
+            capture_thread.join(timeout)
+            self.capture_queue.close()
+            hash_thread.join(timeout)
+            self.encode_queue.close()
+            for thread in encode_threads:
+                thread.join(timeout)
+        if self.frame_pool is not None:
+            self.frame_pool.shutdown()
+        self._threads = []
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _capture_loop(self):
+        while self._running and self.scheduler.wait():
+            if not self.autoshot.should_capture():
+                self.scheduler.report(False)
+                continue
+            start = time.monotonic()
+            images = self.autoshot.grab_regions()
+            captured = time.monotonic()
+            self.timers["capture"].record(captured - start)
+            if images is None:
+                self.capture_failures += 1
+            else:
+                self.capture_queue.put((start, images))
+
+    def _hash_loop(self):
+        while True:
+            try:
+                captured_at, images = self.capture_queue.get()
+            except QueueClosed:
+                return
+            start = time.monotonic()
+            changed = False
+            for stream, image in zip(self.autoshot.streams, images):
+                is_duplicate, phash = stream.check(image)
+                if not is_duplicate:
+                    # Accept now so the next frames are compared against this one
+                    # even before it reaches the disk
+                    stream.accept(phash)
+                    changed = True
+                    turn = stream.take_turn()
+                    if not self.encode_queue.put((captured_at, stream, image, hash_to_int(phash),
+                                                  stream.last_change, None, turn)):
+                        # Closed by stop(): the frame will never be saved
+                        stream.cancel_turn(turn)
+                        stream.reject(hash_to_int(phash))
+            self.scheduler.report(changed)
+            self.timers["hash"].record(time.monotonic() - start)
+
+    def _shared_hash_loop(self):
+        # Keeps up to hash_window captures in the workers and decides them in
+        # capture order, so the dedupe state sees frames as the serial loop would
+        pending = deque()
+        closed = False
+        while True:
+            if not closed and len(pending) < self.hash_window:
+                try:
+                    item = self.capture_queue.get(timeout=0 if pending else None)
+                except QueueClosed:
+                    closed = True
+                except TimeoutError:
+                    pass
+                else:
+                    pending.append(self._dispatch(item, pending))
+                    continue
+            if not pending:
+                return
+            self._resolve(pending.popleft())
+
+    def _dispatch(self, item: tuple, pending: deque) -> tuple:
+        """Gate the frames of a capture and hand the changed ones to the workers"""
+        captured_at, images = item
+        start = time.monotonic()
+        pool = self.frame_pool
+        pool.reserve(max((frame_bytes(image) or 0 for image in images), default=0))
+        frames = []
+        for stream, image in zip(self.autoshot.streams, images):
+            if stream.gate(image):
+                continue
+            detector = stream.similarity_detector
+            slot = pool.put(image, block=False)
+            while slot is None and pending and pool.fits(image):
+                # Older captures hold the slots: deciding them frees the duplicates'
+                self._resolve(pending.popleft())
+                slot = pool.put(image, block=False)
+            if slot is None and pool.fits(image):
+                # The rest are being encoded and come back without our help
+                slot = pool.put(image)
+            if slot is not None:
+                features = pool.hash(slot, detector.hash_algorithm, detector.exact_match, detector.verifier)
+            else:
+                features = Future()
+                features.set_result(frame_features(image, detector.hash_algorithm, detector.exact_match,
+                                                   detector.verifier))
+            frames.append((stream, image, slot, features, stream.last_change))
+        return captured_at, start, frames
+
+    def _resolve(self, dispatched: tuple):
+        """Decide the frames of a dispatched capture and queue the new ones for saving"""
+        captured_at, start, frames = dispatched
+        pool = self.frame_pool
+        changed = False
+        for stream, image, slot, features, change in frames:
+            hash_value, digest, signature = features.result()
+            is_duplicate, phash = stream.check_hashed(int_to_hash(hash_value), digest, signature)
+            encoded = None
+            if not is_duplicate and not stream.image_processor.needs_raw_frames:
+                if slot is not None:
+                    encoded = pool.encode_slot(slot, stream.image_processor.encoder)
+                    slot = None
+                else:
+                    encoded = pool.encode(image, stream.image_processor.encoder)
+            if slot is not None:
+                pool.release(slot)
+            if not is_duplicate:
+                stream.accept(phash)
+                changed = True
+                turn = stream.take_turn()
+                if not self.encode_queue.put((captured_at, stream, image, hash_value, change, encoded, turn)):
+                    # Closed by stop(): the frame will never be saved
+                    stream.cancel_turn(turn)
+                    stream.reject(hash_value)
+        self.scheduler.report(changed)
+        self.timers["hash"].record(time.monotonic() - start)
+
+    def _encode_loop(self):
+        while True:
+            try:
+                captured_at, stream, image, hash_value, change, encoded, turn = self.encode_queue.get()
+            except QueueClosed:
+                return
+            start = time.monotonic()
+            if encoded is not None:
+                try:
+                    data = encoded.result()
+                except Exception as e:
+                    # A failed or lost worker process must not take this thread down
+                    log(f"Error encoding screenshot: {e}", QUIET)
+                    saved_path = None
+                else:
+                    saved_path = stream.save_encoded(data, hash_value)
+            else:
+                # Deltas and transcripts depend on the previous frame: the turn keeps the workers in capture order
+                saved_path = stream.save(image, hash_value, turn)
+            if saved_path is None:
+                # The hash thread accepted the frame before it reached the disk
+                stream.reject(hash_value)
+            finished = time.monotonic()
+            self.timers["encode"].record(finished - start)
+            self.timers["end_to_end"].record(finished - captured_at)
+
+    def register_metrics(self, registry, labels: dict):
+        """
+        Register the queue depths, drop count and stage latencies
+
+        Args:
+            registry: MetricsRegistry to add the metrics to
+            labels: Labels added to every metric
+        """
+        # Read through self, as start() replaces the queues
+        registry.gauge("autoshot_queue_depth", "Items waiting in a pipeline queue",
+                       {**labels, "queue": "capture"}, lambda: len(self.capture_queue))
+        registry.gauge("autoshot_queue_depth", "Items waiting in a pipeline queue",
+                       {**labels, "queue": "encode"}, lambda: len(self.encode_queue))
+        registry.counter("autoshot_frames_dropped_total", "Frames dropped by the capture queue's overload policy",
+                         labels, lambda: self.capture_queue.dropped)
+        for name, timer in self.timers.items():
+            registry.histogram("autoshot_pipeline_stage_seconds", "Latency of each pipeline stage",
+                               {**labels, "stage": name}, timer)
+
+    def stats(self) -> dict:
+        """
+        Get queue depths, drop counts and per-stage latency
+
+        Returns:
+            Dictionary of pipeline statistics
+        """
+        return {
+            "capture_failures": self.capture_failures,
+            "capture_queue_depth": len(self.capture_queue),
+            "capture_queue_max_depth": self.capture_queue.max_depth,
+            "capture_queue_dropped": self.capture_queue.dropped,
+            "encode_queue_depth": len(self.encode_queue),
+            "encode_queue_max_depth": self.encode_queue.max_depth,
+            "latency": {name: timer.stats() for name, timer in self.timers.items()},
+            "shared_memory": self.frame_pool.stats() if self.frame_pool is not None else None,
+        }
+
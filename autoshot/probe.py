@@ -0,0 +1,123 @@
+"""
+Probe Module
+Pixel probes that decide whether a capture tick needs a full grab
+"""
+import time
+from typing import List, Optional, Sequence
+
+from .metrics import FRAMES, Histogram, log
+from .roi import Region, parse_region
+
+
+def parse_probe(spec: str) -> Region:
+    """
+    Parse a probe specification
+
+    Args:
+        spec: "NAME=X,Y" for a single pixel or "NAME=L,T,R,B" for a small
+            region, in client coordinates (fractions if any value has a
+            decimal point, as for --roi)
+
+    Returns:
+        Region to probe
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    name, sep, coords = spec.partition("=")
+    values = coords.split(",") if sep else []
+    if len(values) == 2 and all(value.strip().lstrip("-").isdigit() for value in values):
+        x, y = (int(value) for value in values)
+        return Region(x, y, x + 1, y + 1, name=name.strip())
+    return parse_region(spec)
+
+
+class ProbeTrigger:
+    def __init__(self, probes: Sequence[Region], max_interval: float = 60.0):
+        """
+        Fire a capture only when a probed pixel changes
+
+        Every tick the source reads the probe regions (a handful of pixels,
+        e.g. an unread badge or the last chat line) in one batched call and
+        compares them with the previous tick. The full grab, hash and save
+        only run when something changed, when max_interval passed without a
+        capture, or when the probes can't be read (sources without probe
+        support capture every tick).
+
+        Args:
+            probes: Small regions in client coordinates
+            max_interval: Longest time in seconds between captures, so
+                changes the probes don't cover are still picked up
+
+        Raises:
+            ValueError: If no probe is given
+        """
+        if not probes:
+            raise ValueError("ProbeTrigger needs at least one probe")
+        self.probes: List[Region] = list(probes)
+        self.max_interval = max_interval
+        self._values: Optional[List[bytes]] = None
+        self._last_fire: Optional[float] = None
+        self.timer = Histogram()
+
+        self.checks = 0
+        self.changes = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+
+    def check(self, source, now: Optional[float] = None) -> bool:
+        """
+        Probe the source and decide whether this tick captures
+
+        Args:
+            source: FrameSource to probe
+            now: Current monotonic time (optional, for tests)
+
+        Returns:
+            True if a full capture should run
+        """
+        start = time.perf_counter()
+        now = time.monotonic() if now is None else now
+        try:
+            values = source.probe(self.probes)
+        except Exception as e:
+            log(f"Probe failed: {e}", FRAMES)
+            values = None
+        self.checks += 1
+        fire = True
+        if values is None:
+            self.fallbacks += 1
+        elif values != self._values:
+            self.changes += 1
+        elif self._last_fire is not None and now - self._last_fire >= self.max_interval:
+            self.timeouts += 1
+        else:
+            fire = False
+        self._values = values
+        if fire:
+            self._last_fire = now
+        self.timer.record(time.perf_counter() - start)
+        return fire
+
+    def reset(self):
+        """
+        Forget the last probe values, so the next check fires; called when
+        a capture that was fired didn't go through
+        """
+        self._values = None
+
+    def stats(self) -> dict:
+        """
+        Get the trigger counters
+
+        Returns:
+            Dictionary with checks, changes, timeouts, fallbacks, skipped and ms
+        """
+        return {
+            "checks": self.checks,
+            "changes": self.changes,
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+            "skipped": self.checks - self.changes - self.timeouts - self.fallbacks,
+            "ms": self.timer.total * 1000,
+        }
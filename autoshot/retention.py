@@ -0,0 +1,275 @@
+"""
+Retention Module
+Disk budget, frame count, age and thinning policies for saved frames
+"""
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+from .metrics import QUIET, log
+
+if TYPE_CHECKING:
+    from .frame_index import FrameEntry, FrameIndex
+
+_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+_DURATIONS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a byte size such as "500M" or "20G" (binary units, a plain number is bytes)
+
+    Raises:
+        ValueError: If the value isn't a size
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*", value.lower())
+    if match is None:
+        raise ValueError(f"Invalid size '{value}'")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a duration such as "90s", "15m", "12h", "7d" or "2w" (a plain number is seconds)
+
+    Raises:
+        ValueError: If the value isn't a duration
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", value.lower())
+    if match is None:
+        raise ValueError(f"Invalid duration '{value}'")
+    return float(match.group(1)) * _DURATIONS[match.group(2)]
+
+
+def parse_thinning(value: str) -> List[Tuple[float, float]]:
+    """
+    Parse a thinning schedule "AGE:SPACING,..." such as "1h:10s,1d:5m,7d:1h"
+
+    Returns:
+        List of (age, spacing) in seconds
+
+    Raises:
+        ValueError: If a tier isn't AGE:SPACING
+    """
+    tiers = []
+    for tier in value.split(","):
+        age, sep, spacing = tier.partition(":")
+        if not sep:
+            raise ValueError(f"Invalid thinning tier '{tier}', expected AGE:SPACING")
+        tiers.append((parse_duration(age), parse_duration(spacing)))
+    return tiers
+
+
+class RetentionPolicy:
+    def __init__(self, max_bytes: Optional[int] = None, max_frames: Optional[int] = None,
+                 max_age: Optional[float] = None, thinning: Optional[Sequence[Tuple[float, float]]] = None):
+        """
+        Limits on the frames kept in an output directory
+
+        Args:
+            max_bytes: Largest total size of the saved frames (optional)
+            max_frames: Largest number of saved frames (optional)
+            max_age: Seconds after which a frame is removed (optional)
+            thinning: (age, spacing) tiers in seconds: frames older than age
+                are kept at most one per spacing, e.g. [(3600, 10), (86400, 300)]
+                keeps the last hour in full, then one frame per 10 seconds up
+                to a day, then one per 5 minutes (optional)
+        """
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.max_age = max_age
+        self.thinning = sorted(thinning or [])
+
+    @property
+    def enabled(self) -> bool:
+        """True if any limit is set"""
+        return any(limit is not None for limit in (self.max_bytes, self.max_frames, self.max_age)) \
+            or bool(self.thinning)
+
+    def spacing(self, age: float) -> Optional[float]:
+        """
+        Spacing the thinning schedule asks for at an age
+
+        Args:
+            age: Age of a frame in seconds
+
+        Returns:
+            Smallest allowed gap in seconds to the previous kept frame, or
+            None if frames of this age are kept in full
+        """
+        spacing = None
+        for tier_age, tier_spacing in self.thinning:
+            if age < tier_age:
+                break
+            spacing = tier_spacing
+        return spacing
+
+    def __repr__(self) -> str:
+        return (f"RetentionPolicy(max_bytes={self.max_bytes}, max_frames={self.max_frames}, "
+                f"max_age={self.max_age}, thinning={self.thinning})")
+
+
+class RetentionManager:
+    def __init__(self, processor, detector, policy: RetentionPolicy, interval: float = 5.0,
+                 batch_size: int = 256):
+        """
+        Enforce a retention policy on the frames of an ImageProcessor
+
+        Work is driven by the frame index: the totals it keeps as frames are
+        saved and deleted say whether a budget is exceeded, and the oldest
+        frames come from its timestamp index, so a pass never lists or
+        stats the directory. Each pass removes at most batch_size frames.
+        Thinning walks the history oldest first with a cursor that carries
+        over between passes. The newest frame is never removed.
+
+        Removed frames are dropped from the dedupe history of the detector
+        (unless another frame with the same hash is still on disk), so a
+        screen that comes back after its frames were evicted is saved again.
+
+        Args:
+            processor: ImageProcessor whose frames to manage
+            detector: SimilarityDetector holding the dedupe history
+            policy: Limits to enforce
+            interval: Seconds between passes of the background thread
+            batch_size: Most frames removed per pass
+
+        Raises:
+            ValueError: If the processor doesn't store one file per frame
+        """
+        if processor.archive is not None or processor.transcript is not None:
+            raise ValueError("Retention needs file storage")
+        self.processor = processor
+        self.detector = detector
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        self.index: "FrameIndex" = processor.open_index(detector.hash_image)
+        # Thinning sweep position: timestamp of the last frame looked at and
+        # of the last frame kept
+        self._thin_cursor: Optional[float] = None
+        self._thin_kept: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.frames_evicted = 0
+        self.bytes_evicted = 0
+        self.passes = 0
+        self.seconds = 0.0
+
+    def _over_budget(self) -> bool:
+        policy = self.policy
+        return ((policy.max_frames is not None and self.index.frame_count > policy.max_frames)
+                or (policy.max_bytes is not None and self.index.total_bytes > policy.max_bytes))
+
+    def _evict(self, entry: "FrameEntry") -> bool:
+        path, _, size, hash_value = entry
+        try:
+            self.processor.delete_image(path)
+        except FileNotFoundError:
+            # Removed behind our back: only the index entry is left
+            self.index.remove(path)
+        except OSError as e:
+            log(f"Could not evict {path}: {e}", QUIET)
+            return False
+        self.frames_evicted += 1
+        self.bytes_evicted += size
+        if hash_value is not None and not self.index.find_near(hash_value, 0):
+            self.detector.discard(hash_value)
+        return True
+
+    def _enforce_limits(self, now: float, newest: Optional[str], budget: int) -> int:
+        cutoff = None if self.policy.max_age is None else now - self.policy.max_age
+        evicted = 0
+        while evicted < budget:
+            entries = self.index.oldest(budget - evicted)
+            if not entries:
+                break
+            for entry in entries:
+                expired = cutoff is not None and entry[1] < cutoff
+                if entry[0] == newest or not (expired or self._over_budget()):
+                    return evicted
+                if not self._evict(entry):
+                    return evicted
+                evicted += 1
+        return evicted
+
+    def _thin(self, now: float, newest: Optional[str], budget: int) -> int:
+        entries = self.index.oldest(self.batch_size, after=self._thin_cursor)
+        evicted = 0
+        for path, timestamp, size, hash_value in entries:
+            spacing = self.policy.spacing(now - timestamp)
+            if spacing is None or path == newest:
+                # Reached the history kept in full: start over next time
+                self._thin_cursor = self._thin_kept = None
+                return evicted
+            if self._thin_kept is not None and timestamp - self._thin_kept < spacing:
+                if evicted >= budget or not self._evict((path, timestamp, size, hash_value)):
+                    return evicted
+                evicted += 1
+            else:
+                self._thin_kept = timestamp
+            self._thin_cursor = timestamp
+        if len(entries) < self.batch_size:
+            self._thin_cursor = self._thin_kept = None
+        return evicted
+
+    def enforce(self, now: Optional[float] = None) -> int:
+        """
+        Run one pass: remove expired frames and the oldest frames over the
+        count or byte budget, then thin the next stretch of history
+
+        Args:
+            now: Current time (optional, for tests)
+
+        Returns:
+            Number of frames removed, at most batch_size
+        """
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        latest = self.index.latest()
+        newest = latest[0] if latest is not None else None
+        evicted = self._enforce_limits(now, newest, self.batch_size)
+        if self.policy.thinning and evicted < self.batch_size:
+            evicted += self._thin(now, newest, self.batch_size - evicted)
+        self.passes += 1
+        self.seconds += time.perf_counter() - start
+        return evicted
+
+    def start(self):
+        """Start enforcing in a background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="autoshot-retention", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # A full batch means there may be more to do: keep going without waiting
+            while self.enforce() >= self.batch_size and not self._stop.is_set():
+                pass
+
+    def stop(self):
+        """Stop the background thread"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        """
+        Get eviction counters
+
+        Returns:
+            Dictionary with frames_evicted, bytes_evicted, passes, ms,
+            frames_stored and bytes_stored
+        """
+        return {
+            "frames_evicted": self.frames_evicted,
+            "bytes_evicted": self.bytes_evicted,
+            "passes": self.passes,
+            "ms": self.seconds * 1000,
+            "frames_stored": self.index.frame_count,
+            "bytes_stored": self.index.total_bytes,
+        }
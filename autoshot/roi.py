@@ -0,0 +1,100 @@
+"""
+Region Of Interest Module
+Declarative capture regions in client coordinates
+"""
+from typing import Iterable, Tuple
+
+Box = Tuple[int, int, int, int]
+
+
+class Region:
+    def __init__(self, left: float, top: float, right: float, bottom: float,
+                 name: str = "roi", fractional: bool = False):
+        """
+        A rectangle to capture, relative to the window's client area
+
+        Args:
+            left: Left edge
+            top: Top edge
+            right: Right edge (exclusive)
+            bottom: Bottom edge (exclusive)
+            name: Name of the region, used for its output directory
+            fractional: If True, coordinates are fractions (0-1) of the client
+                width/height; otherwise they are pixels
+        """
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+        self.name = name
+        self.fractional = fractional
+
+    def resolve(self, width: int, height: int) -> Box:
+        """
+        Convert the region to a pixel box inside a client area of the given size
+
+        Args:
+            width: Client area width
+            height: Client area height
+
+        Returns:
+            Tuple of (left, top, right, bottom) in pixels, clamped to the client area
+        """
+        if self.fractional:
+            box = (int(self.left * width), int(self.top * height),
+                   int(self.right * width), int(self.bottom * height))
+        else:
+            box = (int(self.left), int(self.top), int(self.right), int(self.bottom))
+        left = min(max(box[0], 0), width)
+        top = min(max(box[1], 0), height)
+        return (left, top, min(max(box[2], left), width), min(max(box[3], top), height))
+
+    def __repr__(self) -> str:
+        kind = "fractional" if self.fractional else "pixels"
+        return f"Region({self.name!r}, {self.left}, {self.top}, {self.right}, {self.bottom}, {kind})"
+
+
+# The original behaviour: keep the top half of the client area
+TOP_HALF = Region(0.0, 0.0, 1.0, 0.5, name="top_half", fractional=True)
+FULL = Region(0.0, 0.0, 1.0, 1.0, name="full", fractional=True)
+
+
+def parse_region(spec: str) -> Region:
+    """
+    Parse a region from the command line
+
+    The format is "NAME=LEFT,TOP,RIGHT,BOTTOM". If any coordinate has a
+    decimal point the region is fractional, otherwise it is in pixels, so
+    "top_half=0,0,1.0,0.5" and "badge=760,10,790,30" both work.
+
+    Args:
+        spec: Region specification
+
+    Returns:
+        Parsed Region
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    name, _, coords = spec.rpartition("=")
+    parts = coords.split(",")
+    if len(parts) != 4:
+        raise ValueError(f"Region '{spec}' must be NAME=LEFT,TOP,RIGHT,BOTTOM")
+    fractional = any("." in part for part in parts)
+    values = [float(part) if fractional else int(part) for part in parts]
+    return Region(*values, name=name or "roi", fractional=fractional)
+
+
+def union_box(boxes: Iterable[Box]) -> Box:
+    """
+    Smallest box containing all the given boxes
+
+    Args:
+        boxes: Boxes as (left, top, right, bottom)
+
+    Returns:
+        Union box as (left, top, right, bottom)
+    """
+    boxes = list(boxes)
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
@@ -0,0 +1,279 @@
+"""
+Scheduler Module
+Fixed-rate and adaptive tick scheduling on the monotonic clock with deadline tracking
+"""
+import math
+import sys
+import threading
+import time
+from typing import Optional
+
+
+OVERRUN_POLICIES = ("skip", "coalesce")
+
+# Below this interval, ask Windows for 1 ms timer resolution; the default
+# 15.6 ms tick makes sub-50 ms periods visibly uneven
+FINE_TIMER_INTERVAL = 0.05
+
+
+class FixedRateScheduler:
+    def __init__(self, interval: float, overrun_policy: str = "skip"):
+        """
+        Schedule ticks on a fixed grid: start + k * interval
+
+        Unlike sleeping for the interval after each cycle, the period does not
+        stretch by the cycle's processing time. When a cycle overruns one or
+        more ticks, the scheduler never tries to catch up with a burst:
+
+        - "skip": the missed ticks are dropped and the next tick is the next
+          grid point in the future
+        - "coalesce": the missed ticks are merged into one tick that fires
+          immediately; later ticks stay on the grid
+
+        Args:
+            interval: Period in seconds; fractions are fine (down to ~20 ms).
+                0 runs ticks back to back
+            overrun_policy: "skip" or "coalesce"
+
+        Raises:
+            ValueError: If the interval is negative or the policy is unknown
+        """
+        if interval < 0:
+            raise ValueError("Interval must not be negative")
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy '{overrun_policy}', expected one of {OVERRUN_POLICIES}")
+        self.interval = interval
+        self.overrun_policy = overrun_policy
+        self._stop_event = threading.Event()
+        self._next_deadline: Optional[float] = None
+        self._fine_timer = False
+
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.skipped_ticks = 0
+        # Lateness of each tick relative to its deadline (Welford running stats)
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+        self.jitter_max = 0.0
+
+    def wait(self) -> bool:
+        """
+        Block until the next tick
+
+        The first call ticks immediately.
+
+        Returns:
+            True at the tick, False if the scheduler was stopped
+        """
+        if self._stop_event.is_set():
+            return False
+        deadline = self.next_deadline()
+        delay = deadline - time.monotonic()
+        if delay > 0 and self._stop_event.wait(delay):
+            return False
+        self.mark_tick(deadline)
+        return True
+
+    def next_deadline(self) -> float:
+        """
+        Get the deadline of the next tick, applying the overrun policy
+
+        For callers that do their own waiting (e.g. one thread serving many
+        schedulers): call this once when ready for the next tick, wait until
+        the deadline, then call mark_tick().
+
+        Returns:
+            Deadline on the time.monotonic() clock
+        """
+        now = time.monotonic()
+        if self._next_deadline is None:
+            self._begin()
+            self._next_deadline = now
+
+        deadline = self._next_deadline
+        if self.interval > 0 and now >= deadline + self.interval:
+            # The last cycle overran: grid points deadline .. deadline + missed * interval
+            # have all passed
+            missed = math.floor((now - deadline) / self.interval)
+            self.missed_deadlines += 1
+            if self.overrun_policy == "skip":
+                self.skipped_ticks += missed + 1
+                deadline += (missed + 1) * self.interval
+            else:
+                # One immediate tick stands in for all of them
+                self.skipped_ticks += missed
+                deadline += missed * self.interval
+            self._next_deadline = deadline
+        return deadline
+
+    def mark_tick(self, deadline: float):
+        """
+        Record that the tick with the given deadline fired
+
+        Args:
+            deadline: Deadline returned by next_deadline()
+        """
+        self._record_jitter(max(time.monotonic() - deadline, 0.0))
+        self.ticks += 1
+        self._next_deadline = deadline + self.interval
+
+    def _begin(self):
+        if sys.platform == "win32" and 0 < self.interval < FINE_TIMER_INTERVAL:
+            import ctypes
+            self._fine_timer = ctypes.windll.winmm.timeBeginPeriod(1) == 0
+
+    def _record_jitter(self, lateness: float):
+        # Welford's online mean/variance keeps this O(1) per tick
+        count = self.ticks + 1
+        delta = lateness - self._jitter_mean
+        self._jitter_mean += delta / count
+        self._jitter_m2 += delta * (lateness - self._jitter_mean)
+        self.jitter_max = max(self.jitter_max, lateness)
+
+    def stop(self):
+        """
+        Stop the scheduler; a wait() in progress returns False immediately
+        """
+        self._stop_event.set()
+        if self._fine_timer:
+            import ctypes
+            ctypes.windll.winmm.timeEndPeriod(1)
+            self._fine_timer = False
+
+    def report(self, changed: bool):
+        """
+        Tell the scheduler whether the last tick found new content; the
+        fixed-rate scheduler ignores it (see AdaptiveScheduler)
+
+        Args:
+            changed: True if any region of the capture was new
+        """
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def stats(self) -> dict:
+        """
+        Get tick, deadline and jitter statistics
+
+        Returns:
+            Dictionary of scheduler statistics; jitter is the lateness of
+            ticks relative to their deadline
+        """
+        variance = self._jitter_m2 / self.ticks if self.ticks else 0.0
+        return {
+            "interval_ms": self.interval * 1000,
+            "overrun_policy": self.overrun_policy,
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed_deadlines,
+            "skipped_ticks": self.skipped_ticks,
+            "jitter_mean_ms": self._jitter_mean * 1000,
+            "jitter_std_ms": math.sqrt(variance) * 1000,
+            "jitter_max_ms": self.jitter_max * 1000,
+        }
+
+
+class AdaptiveScheduler(FixedRateScheduler):
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0,
+                 overrun_policy: str = "skip"):
+        """
+        Schedule ticks whose interval follows how often the content changes
+
+        Each tick reports whether its capture found new content. While
+        captures are duplicates the interval grows by the backoff factor up
+        to max_interval, so an idle window costs a capture every
+        max_interval; the first change snaps it back to min_interval and
+        moves the pending tick forward, so a burst of messages is captured
+        at the fast rate. Between reports, ticks follow the fixed-rate grid
+        and overrun policy of the current interval.
+
+        Args:
+            min_interval: Interval in seconds while the content changes
+            max_interval: Longest interval in seconds while it doesn't
+            backoff: Factor the interval grows by after each unchanged tick
+            overrun_policy: "skip" or "coalesce"
+
+        Raises:
+            ValueError: If min_interval is not positive, the bounds are out of
+                order or backoff is below 1
+        """
+        if min_interval <= 0:
+            raise ValueError("min_interval must be positive")
+        if max_interval < min_interval:
+            raise ValueError("max_interval must not be below min_interval")
+        if backoff < 1:
+            raise ValueError("backoff must be at least 1")
+        super().__init__(min_interval, overrun_policy)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._last_deadline: Optional[float] = None
+        # Wakes a wait() when a change moves the next tick forward
+        self._cond = threading.Condition()
+
+        self.changes = 0
+        self.unchanged = 0
+
+    def wait(self) -> bool:
+        """
+        Block until the next tick; returns early when report() moves the tick forward
+
+        Returns:
+            True at the tick, False if the scheduler was stopped
+        """
+        with self._cond:
+            while not self._stop_event.is_set():
+                deadline = self.next_deadline()
+                delay = deadline - time.monotonic()
+                if delay <= 0:
+                    self.mark_tick(deadline)
+                    return True
+                self._cond.wait(delay)
+            return False
+
+    def mark_tick(self, deadline: float):
+        self._last_deadline = deadline
+        super().mark_tick(deadline)
+
+    def report(self, changed: bool):
+        """
+        Snap to min_interval on a change, back off otherwise
+
+        Args:
+            changed: True if any region of the capture was new
+        """
+        with self._cond:
+            if changed:
+                self.changes += 1
+                interval = self.min_interval
+            else:
+                self.unchanged += 1
+                interval = min(self.interval * self.backoff, self.max_interval)
+            self.interval = interval
+            if self._last_deadline is not None:
+                self._next_deadline = self._last_deadline + interval
+            self._cond.notify_all()
+
+    def stop(self):
+        super().stop()
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Get the fixed-rate statistics plus the adaptive state
+
+        Returns:
+            Dictionary of scheduler statistics; interval_ms and rate_hz are
+            the current effective interval and capture rate
+        """
+        return {
+            **super().stats(),
+            "rate_hz": 1 / self.interval,
+            "min_interval_ms": self.min_interval * 1000,
+            "max_interval_ms": self.max_interval * 1000,
+            "backoff": self.backoff,
+            "changes": self.changes,
+            "unchanged": self.unchanged,
+        }
@@ -4,30 +4,306 @@ Handles perceptual hash calculation and image similarity detection
 """
 from PIL import Image
 import imagehash
+from imagehash import ImageHash
+import numpy as np
+import hashlib
 import os
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
+
+from .batch_hash import ALGORITHMS, Frames, batch_hash
+from .frame_index import FrameIndex
+from .hash_search import HashSearchIndex
+from .metrics import Histogram
+
+
+HASH_FUNCTIONS = {
+    "ahash": imagehash.average_hash,
+    "dhash": imagehash.dhash,
+    "phash": imagehash.phash,
+}
+
+
+VERIFY_METHODS = ("fine", "ssim")
+# Tiers of the dedupe cascade, cheapest first
+TIERS = ("exact", "hash", "verify")
+
+# Side of the grayscale thumbnail compared by the "ssim" verifier, and of its SSIM windows
+SSIM_SIZE = 128
+SSIM_BLOCK = 8
+
+
+def frame_digest(image: Image.Image) -> bytes:
+    """
+    Digest of the raw pixel buffer of an image
+
+    Equal digests mean identical frames, so they are duplicates under any
+    hash and threshold. SHA-1 is used for speed, not security: it runs in
+    hardware on current CPUs and costs less than the 64-bit hash it skips.
+
+    Args:
+        image: Input PIL Image
+
+    Returns:
+        20-byte digest covering the mode, size and pixels
+    """
+    return pixel_digest(image.mode, image.size, image.tobytes())
+
+
+def pixel_digest(mode: str, size: Tuple[int, int], data) -> bytes:
+    """
+    frame_digest() of raw pixels, e.g. a NumPy view of shared memory
+
+    Args:
+        mode: PIL mode of the pixels
+        size: Image size as (width, height)
+        data: Raw pixel data (bytes or any contiguous buffer)
+
+    Returns:
+        20-byte digest
+    """
+    digest = hashlib.sha1(f"{mode}{tuple(size)}".encode())
+    digest.update(data)
+    return digest.digest()
+
+
+class Verifier:
+    def __init__(self, method: str = "fine", radius: int = 4, threshold: Optional[float] = None):
+        """
+        Last tier of the dedupe cascade: a finer comparison for frames whose
+        64-bit hash is close to an accepted frame's but not identical pixels
+
+        A 64-bit hash both merges distinct frames (a new short chat line may
+        not flip a bit) and splits near-identical ones (a blinking cursor
+        may). With a verifier, every accepted frame within radius bits is an
+        ambiguous candidate, and the finer signature decides.
+
+        Args:
+            method: "fine" compares 16x16 average hashes (256 bits), "ssim"
+                compares 128x128 grayscale thumbnails by structural similarity
+            radius: Largest 64-bit Hamming distance of a candidate
+            threshold: Most differing bits of the fine hash (default 2), or
+                least SSIM of any window (default 0.8), for a candidate to be
+                a duplicate
+
+        Raises:
+            ValueError: If the method is unknown
+        """
+        if method not in VERIFY_METHODS:
+            raise ValueError(f"Unknown verify method '{method}', expected one of {VERIFY_METHODS}")
+        self.method = method
+        self.radius = radius
+        if threshold is None:
+            threshold = 2 if method == "fine" else 0.8
+        self.threshold = threshold
+
+    def signature(self, image: Image.Image) -> np.ndarray:
+        """
+        Compute the signature of a frame
+
+        Args:
+            image: Input PIL Image
+
+        Returns:
+            Bit array for "fine", uint8 thumbnail for "ssim"
+        """
+        gray = image if image.mode == "L" else image.convert("L")
+        if self.method == "fine":
+            return imagehash.average_hash(gray, hash_size=16).hash.ravel()
+        return np.asarray(gray.resize((SSIM_SIZE, SSIM_SIZE), Image.BOX))
+
+    def matches(self, signature: np.ndarray, reference: np.ndarray) -> bool:
+        """
+        Check whether two signatures are close enough to be duplicates
+
+        Args:
+            signature: Signature of the new frame
+            reference: Signature of the accepted frame
+
+        Returns:
+            True if the frames are duplicates
+        """
+        if self.method == "fine":
+            return int(np.count_nonzero(signature != reference)) <= self.threshold
+        return ssim(signature, reference) >= self.threshold
+
+    def __repr__(self) -> str:
+        return f"Verifier(method={self.method!r}, radius={self.radius}, threshold={self.threshold})"
+
+
+def ssim(a: np.ndarray, b: np.ndarray, block: int = SSIM_BLOCK) -> float:
+    """
+    Structural similarity of the least similar window of two grayscale images
+
+    The windows don't overlap. Taking the worst window instead of the mean
+    keeps a local change, such as a new line of text, from being averaged
+    away over the frame; a blinking cursor barely lowers its window's SSIM.
+
+    Args:
+        a: First image, 2-D array
+        b: Second image of the same shape
+        block: Side of the windows
+
+    Returns:
+        SSIM between -1 and 1 (1 for identical images)
+    """
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    rows, cols = a.shape[0] // block, a.shape[1] // block
+    a = a[:rows * block, :cols * block].reshape(rows, block, cols, block)
+    b = b[:rows * block, :cols * block].reshape(rows, block, cols, block)
+    mean_a, mean_b = a.mean(axis=(1, 3)), b.mean(axis=(1, 3))
+    var_a, var_b = a.var(axis=(1, 3)), b.var(axis=(1, 3))
+    cov = (a * b).mean(axis=(1, 3)) - mean_a * mean_b
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    values = ((2 * mean_a * mean_b + c1) * (2 * cov + c2)) / ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(values.min())
+
+
+def hash_to_int(phash: ImageHash) -> int:
+    """
+    Pack an ImageHash into an integer (row-major bits, most significant first)
+
+    Args:
+        phash: Image hash
+
+    Returns:
+        Integer value of the hash bits
+    """
+    return int(str(phash), 16)
+
+
+def int_to_hash(value: int, hash_size: int = 8) -> ImageHash:
+    """
+    Unpack an integer produced by hash_to_int back into an ImageHash
+
+    Args:
+        value: Integer value of the hash bits
+        hash_size: Side length of the hash bit matrix
+
+    Returns:
+        Image hash
+    """
+    return imagehash.hex_to_hash(f"{value:0{hash_size * hash_size // 4}x}")
 
 
 class SimilarityDetector:
-    def __init__(self, threshold: float = 0.999):
+    # Recent accepted frames whose digests and verifier signatures are kept
+    CACHE_SIZE = 4096
+    # Most history candidates checked by the verifier per frame
+    MAX_CANDIDATES = 8
+
+    def __init__(self, threshold: float = 0.999, search_history: bool = True,
+                 hash_algorithm: str = "ahash", exact_match: bool = True,
+                 verifier: Optional[Verifier] = None):
+        """
+        Dedupe frames against the accepted ones with a cascade of checks
+
+        is_duplicate() runs the cheapest tier first and stops at the first
+        decision: an exact digest of the pixels (identical to an accepted
+        frame), then the 64-bit hash against the threshold, then optionally
+        the verifier for frames the hash can't tell apart with confidence.
+        Each tier counts the frames it sees, the duplicates it finds and its time.
+
+        Args:
+            threshold: Similarity of the 64-bit hashes (1 - distance / 64)
+                from which frames are duplicates (default 0.999, i.e. equal hashes)
+            search_history: Also compare with every accepted frame, not only the last
+            hash_algorithm: "ahash" (default), "dhash" or "phash"
+            exact_match: Look up the pixel digest before hashing (default True)
+            verifier: Finer check of ambiguous candidates (optional); with a
+                verifier, hash matches are only duplicates once verified
+        """
+        if hash_algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash algorithm '{hash_algorithm}', expected one of {ALGORITHMS}")
         self.threshold = threshold  # Similarity threshold (0.9 = 90%)
+        self.hash_algorithm = hash_algorithm
+        # Hash of the last frame that was accepted (i.e. saved), kept in memory
+        # so new frames can be checked without touching the disk
+        self.last_hash: Optional[ImageHash] = None
+        # Hashes of every accepted frame, so revisited screens are caught too
+        self.history: Optional[HashSearchIndex] = HashSearchIndex() if search_history else None
+        self.history_matches = 0
+        # Hashes of frames removed from disk, dropped from the history by the
+        # thread that uses it (the history itself isn't thread-safe)
+        self._discarded = deque()
+        self.hashes_discarded = 0
 
-    def calculate_phash(self, image: Image.Image) -> imagehash.ImageHash:
+        self.exact_match = exact_match
+        self.verifier = verifier
+        # Digest -> hash of recent accepted frames, and verifier signatures
+        # of the last accepted frame and of recent history positions
+        self._digests: "OrderedDict[bytes, int]" = OrderedDict()
+        self._last_digest: Optional[bytes] = None
+        self._signatures: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._last_signature: Optional[np.ndarray] = None
+        self._last_position: Optional[int] = None
+        # (hash, digest, signature) of the last new frame, for accept()
+        self._pending: Optional[Tuple[ImageHash, Optional[bytes], Optional[np.ndarray]]] = None
+        self.tier_checks = {tier: 0 for tier in TIERS}
+        self.tier_hits = {tier: 0 for tier in TIERS}
+        self.tier_timers = {tier: Histogram() for tier in TIERS}
+
+    @property
+    def max_distance(self) -> int:
+        """Largest Hamming distance that still meets the similarity threshold"""
+        return int((1 - self.threshold) * 64 + 1e-9)
+
+    def calculate_hash(self, image: Image.Image) -> imagehash.ImageHash:
         """
-        Calculate the perceptual hash of an image
+        Calculate the hash of an image with the configured algorithm
         
         Args:
             image: Input PIL Image
             
         Returns:
-            Perceptual hash of the image
+            Hash of the image
         """
         # Convert to grayscale for more consistent hashing
         gray_image = image.convert('L')
-        # Calculate perceptual hash
-        phash = imagehash.average_hash(gray_image)
-        return phash
+        return HASH_FUNCTIONS[self.hash_algorithm](gray_image)
+
+    def calculate_phash(self, image: Image.Image) -> imagehash.ImageHash:
+        """
+        Calculate the hash of an image
+        
+        Kept for compatibility: despite the name this uses the configured
+        algorithm, which is the average hash (aHash) by default. Use
+        calculate_hash() in new code.
+        
+        Args:
+            image: Input PIL Image
+            
+        Returns:
+            Hash of the image
+        """
+        return self.calculate_hash(image)
+
+    def hash_batch(self, frames: Frames) -> np.ndarray:
+        """
+        Hash many frames at once with the configured algorithm
+        
+        Args:
+            frames: Sequence of same-sized PIL Images, or an array of shape
+                (N, H, W) or (N, H, W, 3|4)
+            
+        Returns:
+            Array of uint64 hashes, equal to hash_image() of each frame
+        """
+        return batch_hash(frames, self.hash_algorithm)
+
+    def hash_image(self, image: Image.Image) -> int:
+        """
+        Calculate the hash of an image as a 64-bit integer
+        
+        Args:
+            image: Input PIL Image
+            
+        Returns:
+            Integer value of the hash
+        """
+        return hash_to_int(self.calculate_hash(image))
 
     def compare_images(self, hash1: ImageHash, hash2: ImageHash) -> float:
         """
@@ -47,7 +323,277 @@ class SimilarityDetector:
         similarity = 1 - (distance / 64.0)
         return max(similarity, 0)  # Ensure non-negative value
 
-    def find_similar_images(self, image_path: str, comparison_dir: str) -> List[str]:
+    def is_duplicate(self, image: Image.Image) -> Tuple[bool, ImageHash]:
+        """
+        Check an in-memory image against the last accepted frame and the history
+
+        Args:
+            image: Input PIL Image
+
+        Returns:
+            Tuple of (is_duplicate, hash of the image)
+        """
+        gray = None
+
+        def grayscale() -> Image.Image:
+            # One grayscale conversion for the hash and the verifier signature
+            nonlocal gray
+            if gray is None:
+                gray = image.convert('L')
+            return gray
+
+        return self._decide(lambda: frame_digest(image),
+                            lambda: HASH_FUNCTIONS[self.hash_algorithm](grayscale()),
+                            lambda: self.verifier.signature(grayscale()))
+
+    def is_duplicate_hashed(self, phash: ImageHash, digest: Optional[bytes] = None,
+                            signature: Optional[np.ndarray] = None) -> Tuple[bool, ImageHash]:
+        """
+        Run the cascade on features computed elsewhere, e.g. in a worker process
+
+        The tier timers then only cover the lookups.
+
+        Args:
+            phash: Hash of the frame with the configured algorithm
+            digest: frame_digest() of the frame (optional, skips the exact tier if None)
+            signature: Verifier signature of the frame (optional, candidates
+                are decided by the hash alone if None)
+
+        Returns:
+            Tuple of (is_duplicate, hash of the frame)
+        """
+        return self._decide(lambda: digest, lambda: phash, lambda: signature)
+
+    def _decide(self, get_digest: Callable[[], Optional[bytes]], get_hash: Callable[[], ImageHash],
+                get_signature: Callable[[], Optional[np.ndarray]]) -> Tuple[bool, ImageHash]:
+        self._pending = None
+        self._apply_discards()
+
+        digest = None
+        if self.exact_match:
+            start = time.perf_counter()
+            digest = get_digest()
+            phash = self._find_digest(digest) if digest is not None else None
+            if digest is not None:
+                self._record("exact", start, phash is not None)
+            if phash is not None:
+                return True, phash
+
+        start = time.perf_counter()
+        phash = get_hash()
+        if self.verifier is None:
+            is_duplicate = self.last_hash is not None and self.compare_images(phash, self.last_hash) >= self.threshold
+            if not is_duplicate and self.find_in_history(phash) is not None:
+                self.history_matches += 1
+                is_duplicate = True
+            self._record("hash", start, is_duplicate)
+            if not is_duplicate:
+                self._pending = (phash, digest, None)
+            return is_duplicate, phash
+
+        candidates = self._candidates(phash)
+        # Candidates without a signature (loaded from disk or evicted from the
+        # cache) are decided by the hash alone
+        is_duplicate = any(reference is None and distance <= self.max_distance
+                           for distance, _, reference in candidates)
+        self._record("hash", start, is_duplicate)
+        if is_duplicate:
+            return True, phash
+
+        start = time.perf_counter()
+        signature = get_signature()
+        verified = None
+        for distance, position, reference in candidates:
+            if signature is None:
+                # Nothing to verify with: the hash decides
+                matched = distance <= self.max_distance
+            else:
+                matched = reference is not None and self.verifier.matches(signature, reference)
+            if matched:
+                verified = position
+                break
+        if candidates:
+            self._record("verify", start, verified is not None)
+        if verified is not None:
+            if verified != self._last_position:
+                self.history_matches += 1
+            return True, phash
+        self._pending = (phash, digest, signature)
+        return False, phash
+
+    def _record(self, tier: str, start: float, hit: bool):
+        self.tier_checks[tier] += 1
+        self.tier_hits[tier] += hit
+        self.tier_timers[tier].record(time.perf_counter() - start)
+
+    def _find_digest(self, digest: bytes) -> Optional[ImageHash]:
+        if digest == self._last_digest:
+            return self.last_hash
+        hash_value = self._digests.get(digest)
+        if hash_value is None:
+            return None
+        self._digests.move_to_end(digest)
+        self.history_matches += 1
+        return int_to_hash(hash_value)
+
+    def _candidates(self, phash: ImageHash) -> List[Tuple[int, Optional[int], Optional[np.ndarray]]]:
+        """Accepted frames within the verifier radius: (distance, history position, signature)"""
+        radius = max(self.max_distance, self.verifier.radius)
+        candidates = []
+        if self.last_hash is not None:
+            distance = phash - self.last_hash
+            if distance <= radius:
+                candidates.append((distance, self._last_position, self._last_signature))
+        if self.history is not None:
+            positions, distances = self.history.query(hash_to_int(phash), radius)
+            for position, distance in zip(positions[:self.MAX_CANDIDATES], distances):
+                position = int(position)
+                if position != self._last_position:
+                    candidates.append((int(distance), position, self._signatures.get(position)))
+        candidates.sort(key=lambda candidate: candidate[0])
+        return candidates
+
+    def tier_stats(self) -> dict:
+        """
+        Get the counters of the cascade tiers
+
+        Returns:
+            Dictionary with <tier>_checks, <tier>_hits and <tier>_ms for the
+            tiers "exact", "hash" and "verify"
+        """
+        stats = {}
+        for tier in TIERS:
+            stats[f"{tier}_checks"] = self.tier_checks[tier]
+            stats[f"{tier}_hits"] = self.tier_hits[tier]
+            stats[f"{tier}_ms"] = self.tier_timers[tier].total * 1000
+        return stats
+
+    def find_in_history(self, phash: ImageHash) -> Optional[Tuple[int, int]]:
+        """
+        Look for a previously accepted frame that meets the similarity threshold
+
+        Args:
+            phash: Hash of the frame to look up
+
+        Returns:
+            Tuple of (history position, Hamming distance) or None
+        """
+        if self.history is None:
+            return None
+        self._apply_discards()
+        return self.history.nearest(hash_to_int(phash), self.max_distance)
+
+    def discard(self, hash_value: int):
+        """
+        Forget the frames with a hash, e.g. after they were evicted from disk,
+        so the screen is saved again when it reappears
+
+        Safe to call from any thread; the history and the last accepted hash
+        are updated on their next use.
+
+        Args:
+            hash_value: 64-bit hash of the removed frames
+        """
+        self._discarded.append(hash_value)
+
+    def _apply_discards(self):
+        while self._discarded:
+            hash_value = self._discarded.popleft()
+            if self.last_hash is not None and hash_to_int(self.last_hash) == hash_value:
+                self.last_hash = None
+                self._last_digest = None
+                self._last_signature = None
+                self._last_position = None
+            if self.history is None:
+                continue
+            positions, _ = self.history.query(hash_value, 0)
+            self.history.remove(positions)
+            self.hashes_discarded += len(positions)
+            for position in positions:
+                self._signatures.pop(int(position), None)
+            for digest in [digest for digest, value in self._digests.items() if value == hash_value]:
+                del self._digests[digest]
+
+    def accept(self, phash: ImageHash, label: int = 0):
+        """
+        Record a hash as the last accepted frame
+
+        Args:
+            phash: Hash of the frame that was kept
+            label: Label stored with the hash in the history, e.g. capture time in ms
+        """
+        pending = self._pending if self._pending is not None and self._pending[0] == phash else None
+        self._pending = None
+        digest, signature = pending[1:] if pending is not None else (None, None)
+        self.last_hash = phash
+        self._last_digest = digest
+        self._last_signature = signature
+        self._last_position = None
+        if self.history is not None:
+            self._last_position = self.history.add(hash_to_int(phash), label)
+            if digest is not None:
+                self._remember(self._digests, digest, hash_to_int(phash))
+            if signature is not None:
+                self._remember(self._signatures, self._last_position, signature)
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def load_history(self, index: FrameIndex) -> int:
+        """
+        Fill the history with the hashes recorded in a frame index
+
+        Args:
+            index: Frame index of the output directory
+
+        Returns:
+            Number of hashes loaded
+        """
+        if self.history is None:
+            return 0
+        entries = [(h, int(ts * 1000)) for _, ts, _, h in index.entries() if h is not None]
+        if entries:
+            hashes, labels = zip(*entries)
+            self.history.extend(np.array(hashes, dtype=np.uint64), np.array(labels, dtype=np.int64))
+        return len(entries)
+
+    def load_last_hash(self, comparison_dir: str, index: Optional[FrameIndex] = None,
+                       pattern: str = "*.png") -> Optional[ImageHash]:
+        """
+        Seed the cached hash from the most recent image in a directory,
+        so a restart does not store a copy of the last frame again
+
+        Args:
+            comparison_dir: Directory holding previously saved images
+            index: Frame index of the directory, avoids the scan and decode (optional)
+            pattern: Glob pattern of the image files when scanning (default "*.png")
+
+        Returns:
+            Hash of the most recent image or None if there is none
+        """
+        if index is not None:
+            latest = index.latest()
+            if latest is not None and latest[3] is not None:
+                self.last_hash = int_to_hash(latest[3])
+                return self.last_hash
+
+        image_files = list(Path(comparison_dir).glob(pattern))
+        if not image_files:
+            return None
+        most_recent_file = max(image_files, key=lambda x: x.stat().st_mtime)
+        try:
+            with Image.open(most_recent_file) as image:
+                self.last_hash = self.calculate_hash(image)
+        except Exception:
+            # Leave the cache empty if the file can't be opened as an image
+            pass
+        return self.last_hash
+
+    def find_similar_images(self, image_path: str, comparison_dir: str,
+                            index: Optional[FrameIndex] = None, pattern: str = "*.png") -> List[str]:
         """
         Find similar images in a directory compared to a reference image
         Only compares with the most recent image in the directory
@@ -55,17 +601,28 @@ class SimilarityDetector:
         Args:
             image_path: Path to the reference image
             comparison_dir: Directory to search for similar images
+            index: Frame index of the directory; when given, the most recent
+                image and its hash come from the index instead of a scan (optional)
+            pattern: Glob pattern of the image files when scanning (default "*.png")
 
         Returns:
             List of paths to similar images
         """
         ref_image = Image.open(image_path)
-        ref_phash = self.calculate_phash(ref_image)
+        ref_phash = self.calculate_hash(ref_image)
 
         similar_images = []
 
+        if index is not None:
+            latest = index.latest(exclude=image_path)
+            if latest is not None and latest[3] is not None:
+                similarity = self.compare_images(ref_phash, int_to_hash(latest[3]))
+                if similarity >= self.threshold:
+                    similar_images.append(latest[0])
+                return similar_images
+
         # Get the most recent image in the directory (excluding the reference image)
-        image_files = list(Path(comparison_dir).glob("*.png"))
+        image_files = list(Path(comparison_dir).glob(pattern))
         image_files = [f for f in image_files if str(f) != image_path]
         
         # Sort by modification time, most recent first
@@ -76,7 +633,7 @@ class SimilarityDetector:
             most_recent_file = image_files[0]
             try:
                 comp_image = Image.open(most_recent_file)
-                comp_phash = self.calculate_phash(comp_image)
+                comp_phash = self.calculate_hash(comp_image)
 
                 similarity = self.compare_images(ref_phash, comp_phash)
 
@@ -0,0 +1,321 @@
+"""
+Transcript Module
+Scroll detection and stitching of scrolling frames into one tall transcript
+"""
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .encoder import ImageEncoder
+
+TILE_PREFIX = "transcript_"
+
+
+class ScrollDetector:
+    def __init__(self, min_overlap: float = 0.25, min_match: float = 0.98, max_candidates: int = 8):
+        """
+        Estimate how far the content scrolled up between consecutive frames
+
+        Every pixel row is reduced to a 64-bit signature, so matching two
+        frames is a 1-D problem: the offset d is the one where the rows of
+        the new frame line up with the rows of the previous frame shifted
+        up by d. The top rows of the new frame are compared against every
+        offset at once (a sliding window over the signatures), and the best
+        candidates are then checked over the whole overlap. Rows of a single
+        color (blank gaps between messages) match anything and are ignored.
+
+        Fixed content that doesn't scroll, like a window's title bar or input
+        box, makes the overlap fail to match; crop it away with a region.
+
+        Args:
+            min_overlap: Smallest overlap as a fraction of the frame height;
+                limits the largest detectable scroll to 1 - min_overlap
+            min_match: Fraction of the overlapping rows that must be equal,
+                below 1 to tolerate e.g. a blinking cursor
+            max_candidates: Offsets verified over the full overlap
+
+        Raises:
+            ValueError: If min_overlap or min_match is not in (0, 1]
+        """
+        if not 0 < min_overlap <= 1:
+            raise ValueError("min_overlap must be in (0, 1]")
+        if not 0 < min_match <= 1:
+            raise ValueError("min_match must be in (0, 1]")
+        self.min_overlap = min_overlap
+        self.min_match = min_match
+        self.max_candidates = max_candidates
+        self._reference: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._reference_key: Optional[tuple] = None
+        self._weights: Optional[np.ndarray] = None
+
+        self.checks = 0
+        self.scrolls = 0
+        self.rows_scrolled = 0
+        self.seconds = 0.0
+
+    def row_signatures(self, image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reduce every pixel row to a 64-bit signature
+
+        Args:
+            image: Frame
+
+        Returns:
+            Tuple of (uint64 signature per row, True per row of a single color)
+        """
+        pixels = np.asarray(image)
+        if pixels.dtype == bool:
+            pixels = pixels.astype(np.uint8)
+        height = pixels.shape[0]
+        rows = pixels.reshape(height, -1)
+        # A row is of a single color if it equals itself shifted by one pixel
+        step = rows.shape[1] // pixels.shape[1]
+        uniform = (rows[:, step:] == rows[:, :-step]).all(axis=1)
+
+        # View each row as 64-bit words and take a weighted sum; the product
+        # wraps around, which makes it a multiplicative hash of the row
+        padding = -rows.shape[1] % 8
+        if padding:
+            rows = np.pad(rows, ((0, 0), (0, padding)))
+        words = np.ascontiguousarray(rows).view(np.uint64)
+        if self._weights is None or len(self._weights) != words.shape[1]:
+            rng = np.random.default_rng(0)
+            self._weights = rng.integers(0, 2 ** 63, words.shape[1], dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        return (words * self._weights).sum(axis=1, dtype=np.uint64), uniform
+
+    def detect(self, image: Image.Image) -> Optional[int]:
+        """
+        Compare a frame with the previous one and make it the new reference
+
+        Args:
+            image: Frame
+
+        Returns:
+            Rows the content scrolled up by (0 if it didn't move), or None if
+            the frames don't overlap: the first frame, a size change, a jump
+            or scroll back, or a change of most of the content
+        """
+        start = time.perf_counter()
+        key = (image.mode, image.size)
+        current = self.row_signatures(image)
+        previous = self._reference if key == self._reference_key else None
+        self._reference, self._reference_key = current, key
+        offset = None if previous is None else self._match(previous[0], *current)
+        self.checks += 1
+        if offset:
+            self.scrolls += 1
+            self.rows_scrolled += offset
+        self.seconds += time.perf_counter() - start
+        return offset
+
+    def _match(self, previous: np.ndarray, current: np.ndarray, uniform: np.ndarray) -> Optional[int]:
+        height = len(current)
+        probe = max(int(height * self.min_overlap), 1)
+        informative = ~uniform[:probe]
+        count = int(informative.sum())
+        if count == 0:
+            # Only blank rows at the top: every offset fits equally well
+            return None
+
+        # windows[d] holds the previous rows d .. d + probe, one row per offset
+        windows = np.lib.stride_tricks.sliding_window_view(previous, probe)
+        matches = (windows[:, informative] == current[:probe][informative]).sum(axis=1)
+        candidates = np.flatnonzero(matches >= self.min_match * count)
+        # Best match first, smaller offset on ties
+        candidates = candidates[np.argsort(-matches[candidates], kind="stable")][:self.max_candidates]
+        for offset in candidates:
+            overlap = height - offset
+            mask = ~uniform[:overlap]
+            total = int(mask.sum())
+            equal = int((current[:overlap][mask] == previous[offset:][mask]).sum())
+            if equal >= self.min_match * total:
+                return int(offset)
+        return None
+
+    def reset(self):
+        """
+        Forget the previous frame
+        """
+        self._reference = None
+        self._reference_key = None
+
+    def stats(self) -> dict:
+        """
+        Get the detector counters
+
+        Returns:
+            Dictionary with checks, scrolls, rows_scrolled and ms
+        """
+        return {
+            "checks": self.checks,
+            "scrolls": self.scrolls,
+            "rows_scrolled": self.rows_scrolled,
+            "ms": self.seconds * 1000,
+        }
+
+
+class TranscriptStitcher:
+    def __init__(self, directory: str, encoder: Optional[ImageEncoder] = None, tile_height: int = 2048,
+                 detector: Optional[ScrollDetector] = None):
+        """
+        Stitch consecutive frames of a scrolling window into a tall transcript
+
+        When a frame is the previous one scrolled up by d rows, only its
+        bottom d rows are new and only those are appended. Any other change
+        (an edit in place, a jump, a resize) appends the whole frame. The
+        transcript is cut into tiles of tile_height rows saved as
+        transcript_00000.png, transcript_00001.png, ...; the last, partial
+        tile is rewritten by every add(), so an added frame is on disk when
+        add() returns. A restart continues with a new tile after the
+        existing ones.
+
+        Frames must be added in capture order.
+
+        Args:
+            directory: Directory for the transcript tiles
+            encoder: Tile format and settings (optional, defaults to PNG)
+            tile_height: Rows per tile
+            detector: Scroll detector (optional, created with defaults)
+
+        Raises:
+            ValueError: If tile_height is not positive
+        """
+        if tile_height <= 0:
+            raise ValueError("tile_height must be positive")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.encoder = encoder if encoder is not None else ImageEncoder()
+        self.tile_height = tile_height
+        self.detector = detector if detector is not None else ScrollDetector()
+        self._lock = threading.Lock()
+        self._rows: List[np.ndarray] = []
+        self._buffered = 0
+        self._dirty = False
+        # Tile the last added rows were written to
+        self._last_path: Optional[str] = None
+        self._key: Optional[tuple] = None
+        pattern = re.compile(re.escape(TILE_PREFIX) + r"(\d+)" + re.escape(self.encoder.extension) + "$")
+        existing = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m]
+        self._tile = max(existing) + 1 if existing else 0
+
+        self.frames = 0
+        self.breaks = 0
+        self.rows_appended = 0
+        self.tiles_written = 0
+        self.bytes_written = 0
+
+    @property
+    def tile_path(self) -> Path:
+        """Path of the tile currently being filled"""
+        return self.directory / f"{TILE_PREFIX}{self._tile:05d}{self.encoder.extension}"
+
+    def add(self, image: Image.Image) -> Tuple[str, int]:
+        """
+        Append the part of a frame that isn't in the transcript yet
+
+        Args:
+            image: Frame
+
+        Returns:
+            Tuple of (path of the tile the rows were written to, bytes written)
+        """
+        with self._lock:
+            written = 0
+            key = (image.mode, image.size[0])
+            if key != self._key:
+                # Tiles can only stack rows of the same width and mode
+                written += self._write_partial()
+                if self._buffered:
+                    self._next_tile()
+                self._key = key
+
+            offset = self.detector.detect(image)
+            pixels = np.asarray(image)
+            if offset is None:
+                if self.frames:
+                    self.breaks += 1
+                new_rows = pixels
+            else:
+                new_rows = pixels[len(pixels) - offset:]
+            self.frames += 1
+            if len(new_rows):
+                self._rows.append(new_rows)
+                self._buffered += len(new_rows)
+                self.rows_appended += len(new_rows)
+                self._dirty = True
+            while self._buffered >= self.tile_height:
+                rows = np.concatenate(self._rows)
+                self._rows, self._buffered = [rows[:self.tile_height]], self.tile_height
+                written += self._write_partial()
+                self._next_tile()
+                rest = rows[self.tile_height:]
+                if len(rest):
+                    self._rows, self._buffered, self._dirty = [rest], len(rest), True
+            # Rewrite the partial tile, so a crash loses no added frame
+            written += self._write_partial()
+            return self._last_path, written
+
+    def flush(self) -> int:
+        """
+        Write the partial last tile if its last write failed; add() keeps it up to date
+
+        Returns:
+            Bytes written
+        """
+        with self._lock:
+            return self._write_partial()
+
+    def _write_partial(self) -> int:
+        if not self._dirty:
+            return 0
+        rows = np.concatenate(self._rows)
+        self._rows = [rows]
+        if rows.dtype == bool:
+            tile = Image.fromarray(rows)
+        else:
+            tile = Image.frombytes(self._key[0], (rows.shape[1], rows.shape[0]), rows.tobytes())
+        data = self.encoder.encode(tile)
+        path = self.tile_path
+        temp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
+        self._dirty = False
+        self._last_path = str(path)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def _next_tile(self):
+        self._rows = []
+        self._buffered = 0
+        self._dirty = False
+        self._tile += 1
+        self.tiles_written += 1
+
+    def stats(self) -> dict:
+        """
+        Get the stitching counters
+
+        Returns:
+            Dictionary with frames, breaks (frames appended whole after the
+            first), rows_appended, tiles_written, bytes_written and the
+            detector's counters under "scroll"
+        """
+        return {
+            "frames": self.frames,
+            "breaks": self.breaks,
+            "rows_appended": self.rows_appended,
+            "tiles_written": self.tiles_written,
+            "bytes_written": self.bytes_written,
+            "scroll": self.detector.stats(),
+        }
@@ -3,13 +3,40 @@ Window Manager Module
 Handles window operations using Windows API
 """
 import ctypes
-from ctypes import wintypes
 import time
-from typing import Tuple, Optional, Union
+from typing import List, Sequence, Tuple, Optional, Union
+
+try:
+    from ctypes import wintypes
+except ValueError:
+    # Some non-Windows Pythons can't define the Windows types; the module
+    # stays importable so the rest of the package works there
+    wintypes = None
+
+SRCCOPY = 0x00CC0020
+# Include layered (e.g. translucent) windows in BitBlt reads
+CAPTUREBLT = 0x40000000
+BI_RGB = 0
+DIB_RGB_COLORS = 0
+
+if wintypes is not None:
+    class BITMAPINFOHEADER(ctypes.Structure):
+        _fields_ = [
+            ("biSize", wintypes.DWORD), ("biWidth", wintypes.LONG), ("biHeight", wintypes.LONG),
+            ("biPlanes", wintypes.WORD), ("biBitCount", wintypes.WORD), ("biCompression", wintypes.DWORD),
+            ("biSizeImage", wintypes.DWORD), ("biXPelsPerMeter", wintypes.LONG),
+            ("biYPelsPerMeter", wintypes.LONG), ("biClrUsed", wintypes.DWORD), ("biClrImportant", wintypes.DWORD),
+        ]
+
+    class BITMAPINFO(ctypes.Structure):
+        _fields_ = [("bmiHeader", BITMAPINFOHEADER), ("bmiColors", wintypes.DWORD * 3)]
 
 
 class WindowManager:
     def __init__(self):
+        if not hasattr(ctypes, "windll"):
+            raise OSError("WindowManager requires Windows; use a replay or synthetic frame source elsewhere")
+
         # Load required Windows API functions
         self.user32 = ctypes.windll.user32
         self.gdi32 = ctypes.windll.gdi32
@@ -37,6 +64,22 @@ class WindowManager:
         self.user32.ReleaseDC.restype = ctypes.c_int
         self.gdi32.GetPixel.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
         self.gdi32.GetPixel.restype = wintypes.COLORREF
+        self.gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+        self.gdi32.CreateCompatibleDC.restype = wintypes.HDC
+        self.gdi32.CreateCompatibleBitmap.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
+        self.gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+        self.gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+        self.gdi32.SelectObject.restype = wintypes.HGDIOBJ
+        self.gdi32.BitBlt.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                      wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD]
+        self.gdi32.BitBlt.restype = wintypes.BOOL
+        self.gdi32.GetDIBits.argtypes = [wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT,
+                                         ctypes.c_void_p, ctypes.POINTER(BITMAPINFO), wintypes.UINT]
+        self.gdi32.GetDIBits.restype = ctypes.c_int
+        self.gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+        self.gdi32.DeleteObject.restype = wintypes.BOOL
+        self.gdi32.DeleteDC.argtypes = [wintypes.HDC]
+        self.gdi32.DeleteDC.restype = wintypes.BOOL
 
     def find_window(self, class_name: Optional[str] = None, window_name: Optional[str] = None) -> Optional[int]:
         """
@@ -154,6 +197,60 @@ class WindowManager:
             # Release the device context
             self.user32.ReleaseDC(None, hdc)
 
+    def read_screen_boxes(self, boxes: Sequence[Tuple[int, int, int, int]]) -> Optional[List[bytes]]:
+        """
+        Read the pixels of several small screen rectangles in one go
+
+        The screen device context is acquired once for all boxes, and each
+        box is copied with a single BitBlt instead of a GetPixel per pixel,
+        so a tick of probes costs a few GDI calls.
+
+        Args:
+            boxes: Rectangles (left, top, right, bottom) in screen coordinates
+
+        Returns:
+            BGRA bytes of each box (top-down rows), or None if the screen
+            can't be read
+        """
+        screen_dc = self.user32.GetDC(None)
+        if not screen_dc:
+            return None
+        memory_dc = self.gdi32.CreateCompatibleDC(screen_dc)
+        try:
+            result = []
+            for left, top, right, bottom in boxes:
+                width, height = max(right - left, 1), max(bottom - top, 1)
+                bitmap = self.gdi32.CreateCompatibleBitmap(screen_dc, width, height)
+                if not bitmap:
+                    return None
+                try:
+                    previous = self.gdi32.SelectObject(memory_dc, bitmap)
+                    copied = self.gdi32.BitBlt(memory_dc, 0, 0, width, height, screen_dc, left, top,
+                                               SRCCOPY | CAPTUREBLT)
+                    # GetDIBits needs the bitmap deselected
+                    self.gdi32.SelectObject(memory_dc, previous)
+                    if not copied:
+                        return None
+                    info = BITMAPINFO()
+                    info.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+                    info.bmiHeader.biWidth = width
+                    # Negative height: rows top-down
+                    info.bmiHeader.biHeight = -height
+                    info.bmiHeader.biPlanes = 1
+                    info.bmiHeader.biBitCount = 32
+                    info.bmiHeader.biCompression = BI_RGB
+                    buffer = ctypes.create_string_buffer(width * height * 4)
+                    if self.gdi32.GetDIBits(memory_dc, bitmap, 0, height, buffer, ctypes.byref(info),
+                                            DIB_RGB_COLORS) != height:
+                        return None
+                    result.append(buffer.raw)
+                finally:
+                    self.gdi32.DeleteObject(bitmap)
+            return result
+        finally:
+            self.gdi32.DeleteDC(memory_dc)
+            self.user32.ReleaseDC(None, screen_dc)
+
     def convert_screenshot_coords_to_screen(self, hwnd: int, screenshot_x: int, screenshot_y: int, use_client_area: bool = True) -> Optional[Tuple[int, int]]:
         """
         Convert coordinates from a screenshot to screen coordinates
@@ -0,0 +1,103 @@
+"""
+Window Session Module
+Cached window handle and client-area geometry across capture cycles
+"""
+from typing import Optional, Tuple
+
+from .metrics import EVENTS, log
+
+Rect = Tuple[int, int, int, int]
+
+
+class WindowSession:
+    def __init__(self, window_manager, window_title: str):
+        """
+        Keep a window's handle and screen-space client rectangle between cycles
+
+        Finding a window by title (FindWindowW) and computing its client
+        rectangle (GetClientRect plus two ClientToScreen calls) on every
+        cycle is wasted work while the window stays put. The session
+        revalidates with a single GetWindowRect: it fails once the handle is
+        gone, which triggers a new lookup, and a changed window rectangle
+        (moved or resized) triggers a new client rectangle.
+
+        Args:
+            window_manager: WindowManager used for the Windows API calls
+            window_title: Title of the window to look up
+        """
+        self.window_manager = window_manager
+        self.window_title = window_title
+        self.hwnd: Optional[int] = None
+        self._window_rect: Optional[Rect] = None
+        self._client_rect: Optional[Rect] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.geometry_refreshes = 0
+
+    def client_rect(self, hwnd: Optional[int] = None) -> Optional[Rect]:
+        """
+        Get the screen-space client rectangle, using the cache when it is still valid
+
+        Args:
+            hwnd: Window handle to use instead of the cached one (optional)
+
+        Returns:
+            Tuple of (left, top, right, bottom) or None if the window is not found
+        """
+        if hwnd is not None and hwnd != self.hwnd:
+            self.invalidate()
+            self.hwnd = hwnd
+
+        window_rect = None
+        if self.hwnd is not None:
+            window_rect = self.window_manager.get_window_rect(self.hwnd)
+        if window_rect is None:
+            # No handle yet, or the window was destroyed: look it up again
+            self.misses += 1
+            self.invalidate()
+            if hwnd is not None:
+                return None
+            self.hwnd = self.window_manager.find_window(window_name=self.window_title)
+            if self.hwnd is None:
+                log(f"Window '{self.window_title}' not found.", EVENTS)
+                return None
+            window_rect = self.window_manager.get_window_rect(self.hwnd)
+            if window_rect is None:
+                return None
+        else:
+            self.hits += 1
+
+        if window_rect != self._window_rect:
+            self._client_rect = self._read_client_rect(window_rect)
+            self._window_rect = window_rect
+            self.geometry_refreshes += 1
+        return self._client_rect
+
+    def _read_client_rect(self, window_rect: Rect) -> Rect:
+        rect = self.window_manager.get_client_rect(self.hwnd)
+        if rect is None:
+            log("Could not get window client rectangle, falling back to window rectangle", EVENTS)
+            return window_rect
+        return rect
+
+    def invalidate(self):
+        """
+        Forget the cached handle and geometry, e.g. after a failed grab
+        """
+        self.hwnd = None
+        self._window_rect = None
+        self._client_rect = None
+
+    def stats(self) -> dict:
+        """
+        Get the lookup cache counters
+
+        Returns:
+            Dictionary with hits, misses and geometry_refreshes
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "geometry_refreshes": self.geometry_refreshes,
+        }
@@ -0,0 +1,141 @@
+"""
+Benchmark adaptive against fixed-interval capture over a replayed chat day
+
+A day of chat activity is generated as message arrival times: a few busy
+hours with bursts of messages, long idle stretches in between. Each mode
+replays it through an AutoShot on a virtual clock: the next tick is the
+current tick plus the scheduler's current interval, so a day replays in
+seconds while the real capture, dedupe and save code runs on every tick.
+Reported per mode: captures, CPU time, frames and bytes written, screen
+states never captured (replaced by the next message before a tick; the
+message itself usually stays visible higher up) and the mean delay between
+a message arriving and the first capture that shows it.
+
+Usage:
+    python benchmarks/bench_adaptive.py --hours 24 --interval 2 --min-interval 0.5 --max-interval 10
+    python benchmarks/bench_adaptive.py --hours 2 --width 400 --height 800 --seed 3
+"""
+import argparse
+import bisect
+import contextlib
+import io
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+from autoshot.frame_source import FrameSource, SyntheticFrameSource
+from autoshot.main import AutoShot
+
+
+def chat_day(hours: float, busy_periods: int, seed: int) -> List[float]:
+    """
+    Message arrival times in seconds: bursts inside busy periods, a trickle outside
+
+    Returns:
+        Sorted list of arrival times
+    """
+    rng = np.random.default_rng(seed)
+    duration = hours * 3600
+    arrivals = list(rng.uniform(0, duration, int(hours * 4)))  # About 4 stray messages an hour
+    for start in rng.uniform(0, duration, busy_periods):
+        end = min(start + rng.uniform(600, 2400), duration)
+        t = start
+        while t < end:
+            # A burst of quick replies, then a pause
+            for _ in range(int(rng.integers(2, 12))):
+                t += rng.exponential(4)
+                arrivals.append(t)
+            t += rng.exponential(90)
+    return sorted(float(t) for t in arrivals if t < duration)
+
+
+class TimelineFrameSource(FrameSource):
+    """Shows the chat as it looks at the virtual time set by the benchmark"""
+
+    def __init__(self, arrivals: List[float], width: int, height: int):
+        self.arrivals = arrivals
+        self.now = 0.0
+        self._pages = SyntheticFrameSource(width, height, change_rate=1.0, seed=0)
+        self._version = -1
+        self._frame: Optional[Image.Image] = None
+
+    def version(self) -> int:
+        """Number of messages arrived by now"""
+        return bisect.bisect_right(self.arrivals, self.now)
+
+    def grab(self) -> Optional[Image.Image]:
+        version = self.version()
+        if self._frame is None or version != self._version:
+            # Every new message scrolls the page once
+            self._frame = self._pages.grab()
+            self._version = version
+        return self._frame
+
+
+def replay(arrivals: List[float], hours: float, width: int, height: int, interval: float,
+           max_interval: Optional[float], backoff: float) -> dict:
+    source = TimelineFrameSource(arrivals, width, height)
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        autoshot = AutoShot("chat", width, height, interval=interval, frame_source=source, output_dir=directory,
+                            max_interval=max_interval, backoff=backoff)
+        autoshot.scheduler = autoshot.make_scheduler()
+        duration = hours * 3600
+        seen = set()
+        delays = []
+        ticks = 0
+        cpu_start = time.process_time()
+        while source.now < duration:
+            version = source.version()
+            if version not in seen:
+                seen.add(version)
+                if version:
+                    delays.append(source.now - arrivals[version - 1])
+            autoshot.single_capture_cycle()
+            ticks += 1
+            source.now += autoshot.scheduler.interval
+        cpu = time.process_time() - cpu_start
+        stats = autoshot.stats()
+    return {
+        "captures": ticks,
+        "cpu_s": cpu,
+        "frames_saved": stats["frames_saved"],
+        "bytes_written": stats["bytes_written"],
+        "states_unseen": len(arrivals) - len(delays),
+        "mean_delay_s": sum(delays) / len(delays) if delays else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark adaptive against fixed-interval capture")
+    parser.add_argument("--hours", type=float, default=24, help="Length of the replayed session (default: 24)")
+    parser.add_argument("--busy-periods", type=int, default=8, help="Busy stretches in the session (default: 8)")
+    parser.add_argument("--width", type=int, default=400, help="Frame width (default: 400)")
+    parser.add_argument("--height", type=int, default=800, help="Frame height (default: 800)")
+    parser.add_argument("--interval", type=float, default=2, help="Interval of the fixed mode (default: 2)")
+    parser.add_argument("--min-interval", type=float, default=0.5,
+                        help="Fast interval of the adaptive mode (default: 0.5)")
+    parser.add_argument("--max-interval", type=float, default=10,
+                        help="Slowest interval of the adaptive mode (default: 10)")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Backoff factor (default: 2)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the generated chat day (default: 1)")
+    args = parser.parse_args()
+
+    arrivals = chat_day(args.hours, args.busy_periods, args.seed)
+    print(f"{len(arrivals)} messages over {args.hours:g} h, {args.width}x{args.height} frames")
+    modes = {
+        f"fixed {args.interval:g}s": (args.interval, None),
+        f"fixed {args.min_interval:g}s": (args.min_interval, None),
+        f"adaptive {args.min_interval:g}-{args.max_interval:g}s": (args.min_interval, args.max_interval),
+    }
+    for name, (interval, max_interval) in modes.items():
+        result = replay(arrivals, args.hours, args.width, args.height, interval, max_interval, args.backoff)
+        print(f"{name}: captures={result['captures']}, cpu_s={result['cpu_s']:.1f}, "
+              f"saved={result['frames_saved']}, bytes_written={result['bytes_written']}, "
+              f"unseen={result['states_unseen']}, mean_delay_s={result['mean_delay_s']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark batch hashing against per-image imagehash calls
+
+Usage:
+    python benchmarks/bench_batch_hash.py --frames 64 --width 800 --height 300
+"""
+import argparse
+import time
+
+import imagehash
+import numpy as np
+from PIL import Image
+
+from autoshot.batch_hash import ALGORITHMS, batch_hash
+
+PER_IMAGE = {
+    "ahash": imagehash.average_hash,
+    "dhash": imagehash.dhash,
+    "phash": imagehash.phash,
+}
+
+
+def make_frames(count: int, width: int, height: int) -> np.ndarray:
+    # Light background with dark text-like bars, similar to a chat crop
+    rng = np.random.default_rng(0)
+    frames = np.full((count, height, width, 3), 245, dtype=np.uint8)
+    for frame in frames:
+        for top in range(10, height - 12, 18):
+            right = int(rng.integers(width // 4, width - 10))
+            frame[top:top + 10, 10:right] = rng.integers(0, 80)
+    return frames
+
+
+def run(count: int, width: int, height: int) -> dict:
+    frames = make_frames(count, width, height)
+    images = [Image.fromarray(frame) for frame in frames]
+    results = {}
+    for algorithm in ALGORITHMS:
+        start = time.perf_counter()
+        for image in images:
+            PER_IMAGE[algorithm](image.convert("L"))
+        per_image_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_hash(images, algorithm)
+        batch_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_hash(frames, algorithm)
+        array_s = time.perf_counter() - start
+
+        results[algorithm] = {
+            "imagehash_frames_per_s": count / per_image_s,
+            "batch_frames_per_s": count / batch_s,
+            "batch_array_frames_per_s": count / array_s,
+            "speedup": per_image_s / batch_s,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized batch hashing")
+    parser.add_argument("--frames", type=int, default=64, help="Frames per batch")
+    parser.add_argument("--width", type=int, default=800, help="Frame width")
+    parser.add_argument("--height", type=int, default=300, help="Frame height")
+    args = parser.parse_args()
+
+    for algorithm, result in run(args.frames, args.width, args.height).items():
+        print(f"{algorithm}: " + ", ".join(f"{k}={v:,.1f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark the change gate against hashing every frame
+
+Usage:
+    python benchmarks/bench_change_gate.py --frames 500 --change-rate 0.1
+"""
+import argparse
+import time
+
+from autoshot.change_gate import ChangeGate
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.similarity_detector import SimilarityDetector
+
+
+def run(count: int, width: int, height: int, change_rate: float) -> dict:
+    source = SyntheticFrameSource(width, height, change_rate=change_rate, seed=0)
+    frames = [source.grab() for _ in range(count)]
+    detector = SimilarityDetector()
+
+    start = time.perf_counter()
+    for frame in frames:
+        detector.hash_image(frame)
+    hash_s = time.perf_counter() - start
+
+    gate = ChangeGate()
+    start = time.perf_counter()
+    for frame in frames:
+        if gate.check(frame).changed:
+            detector.hash_image(frame)
+    gated_s = time.perf_counter() - start
+
+    stats = gate.stats()
+    return {
+        "hash_every_frame_ms": hash_s / count * 1000,
+        "gated_ms": gated_s / count * 1000,
+        "gate_check_ms": stats["mean_ms"],
+        "gate_hit_rate": stats["hit_rate"],
+        "speedup": hash_s / gated_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the change-detection gate")
+    parser.add_argument("--frames", type=int, default=500, help="Number of frames")
+    parser.add_argument("--width", type=int, default=800, help="Frame width")
+    parser.add_argument("--height", type=int, default=300, help="Frame height")
+    parser.add_argument("--change-rate", type=float, default=0.1, help="Probability that a frame changes")
+    args = parser.parse_args()
+
+    result = run(args.frames, args.width, args.height, args.change_rate)
+    print(", ".join(f"{k}={v:,.3f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark archive size and reconstruct latency for keyframe intervals
+
+Replays a chat session (a directory of saved frames, or a synthetic one)
+into an archive per keyframe interval and reports the bytes per frame,
+the savings against keyframes only, and how long it takes to read frames
+back in order and at random.
+
+Usage:
+    python benchmarks/bench_delta.py --frames 200 --intervals 1 10 30
+    python benchmarks/bench_delta.py --replay-path screenshots/
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from autoshot.archive import ArchiveReader, ArchiveWriter
+from autoshot.delta import DeltaEncoder
+from autoshot.encoder import ImageEncoder
+from autoshot.frame_source import ReplayFrameSource, SyntheticFrameSource
+
+
+def load_frames(args) -> list:
+    if args.replay_path:
+        source = ReplayFrameSource(args.replay_path)
+        if not source.open():
+            raise SystemExit(f"No frames found in {args.replay_path}")
+    else:
+        # Every frame differs from the last; most changes edit a line in place
+        # (typing, reactions), the rest scroll a new message in
+        source = SyntheticFrameSource(args.width, args.height, change_rate=1.0, seed=0,
+                                      scroll_rate=args.scroll_rate)
+    frames = []
+    while len(frames) < args.frames:
+        frame = source.grab()
+        if frame is None:
+            break
+        frames.append(frame)
+    return frames
+
+
+def run(frames: list, keyframe_interval: int, encoder: ImageEncoder, reads: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ArchiveWriter(directory, encoder.format)
+        delta = DeltaEncoder(encoder, keyframe_interval)
+        start = time.perf_counter()
+        total_bytes = 0
+        for frame in frames:
+            data, is_delta = delta.encode(frame, force_keyframe=writer.segment_frames == 0)
+            writer.append(data, delta=is_delta)
+            total_bytes += len(data)
+        encode_ms = (time.perf_counter() - start) / len(frames) * 1000
+        writer.close()
+
+        reader = ArchiveReader(directory)
+        archived = list(reader.frames())
+        start = time.perf_counter()
+        for frame in archived:
+            frame.image()
+        sequential_ms = (time.perf_counter() - start) / len(archived) * 1000
+
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(reads):
+            rng.choice(archived).image()
+        random_ms = (time.perf_counter() - start) / reads * 1000
+        reader.close()
+
+    return {
+        "bytes_per_frame": total_bytes / len(frames),
+        "keyframes": delta.keyframes,
+        "deltas": delta.deltas,
+        "encode_ms": encode_ms,
+        "sequential_read_ms": sequential_ms,
+        "random_read_ms": random_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keyframe + delta archives")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames")
+    parser.add_argument("--width", type=int, default=800, help="Synthetic frame width")
+    parser.add_argument("--height", type=int, default=300, help="Synthetic frame height")
+    parser.add_argument("--scroll-rate", type=float, default=0.3,
+                        help="Fraction of synthetic changes that scroll")
+    parser.add_argument("--replay-path", help="Directory of saved frames to replay instead")
+    parser.add_argument("--intervals", type=int, nargs="+", default=[1, 10, 30], help="Keyframe intervals")
+    parser.add_argument("--format", default="png", help="Keyframe encoder format")
+    parser.add_argument("--reads", type=int, default=50, help="Random reads per interval")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    encoder = ImageEncoder(args.format, compress_level=1) if args.format == "png" else ImageEncoder(args.format)
+    print(f"{len(frames)} frames, {frames[0].size[0]}x{frames[0].size[1]}, {encoder}")
+
+    results = {interval: run(frames, interval, encoder, args.reads) for interval in args.intervals}
+    # Savings are relative to storing every frame as a keyframe
+    baseline = (results[1] if 1 in results else run(frames, 1, encoder, args.reads))["bytes_per_frame"]
+    for interval, result in results.items():
+        savings = 1 - result["bytes_per_frame"] / baseline
+        print(f"keyframe_interval={interval}: bytes_per_frame={result['bytes_per_frame']:,.0f} "
+              f"({savings:.0%} saved), keyframes={result['keyframes']}, deltas={result['deltas']}, "
+              f"encode_ms={result['encode_ms']:.2f}, sequential_read_ms={result['sequential_read_ms']:.2f}, "
+              f"random_read_ms={result['random_read_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
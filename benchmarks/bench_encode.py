@@ -0,0 +1,50 @@
+"""
+Benchmark encode time and size per frame for each encoder mode
+
+Usage:
+    python benchmarks/bench_encode.py --frames 30 --width 800 --height 300
+"""
+import argparse
+import time
+
+from autoshot.encoder import ImageEncoder
+from autoshot.frame_source import SyntheticFrameSource
+
+MODES = {
+    "png-default": ImageEncoder("png"),
+    "png-level1": ImageEncoder("png", compress_level=1),
+    "png-level9": ImageEncoder("png", compress_level=9),
+    "png-optimize": ImageEncoder("png", optimize=True),
+    "webp-lossless-m0": ImageEncoder("webp", webp_method=0),
+    "webp-lossless-m4": ImageEncoder("webp", webp_method=4),
+    "qoi": ImageEncoder("qoi"),
+    "bmp": ImageEncoder("bmp"),
+}
+
+
+def run(count: int, width: int, height: int) -> dict:
+    # Every frame differs from the last, like the frames that actually get saved
+    source = SyntheticFrameSource(width, height, change_rate=1.0, seed=0)
+    frames = [source.grab() for _ in range(count)]
+    results = {}
+    for name, encoder in MODES.items():
+        start = time.perf_counter()
+        total_bytes = sum(len(encoder.encode(frame)) for frame in frames)
+        elapsed = time.perf_counter() - start
+        results[name] = {"encode_ms": elapsed / count * 1000, "bytes_per_frame": total_bytes / count}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame encoders")
+    parser.add_argument("--frames", type=int, default=30, help="Number of frames")
+    parser.add_argument("--width", type=int, default=800, help="Frame width")
+    parser.add_argument("--height", type=int, default=300, help="Frame height")
+    args = parser.parse_args()
+
+    for name, result in run(args.frames, args.width, args.height).items():
+        print(f"{name}: encode_ms={result['encode_ms']:.2f}, bytes_per_frame={result['bytes_per_frame']:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark HashSearchIndex against a linear scan
+
+Usage:
+    python benchmarks/bench_hash_search.py --size 1000000 --queries 2000 --radius 3
+"""
+import argparse
+import time
+import tracemalloc
+
+import imagehash
+import numpy as np
+
+from autoshot.hash_search import HashSearchIndex
+
+
+def make_hashes(size: int, rng: np.random.Generator) -> np.ndarray:
+    return rng.integers(0, np.iinfo(np.uint64).max, size=size, dtype=np.uint64, endpoint=True)
+
+
+def make_queries(hashes: np.ndarray, count: int, radius: int, rng: np.random.Generator) -> np.ndarray:
+    # Half the queries are near-duplicates of stored hashes, half are new
+    near = hashes[rng.integers(0, len(hashes), size=count // 2)].copy()
+    for i in range(len(near)):
+        for bit in rng.choice(64, size=rng.integers(0, radius + 1), replace=False):
+            near[i] ^= np.uint64(1) << np.uint64(bit)
+    return np.concatenate([near, make_hashes(count - len(near), rng)])
+
+
+def imagehash_bytes_per_hash(sample: int = 1000) -> float:
+    """Measured size of one hash kept as a Python ImageHash object"""
+    bits = np.random.default_rng(0).integers(0, 2, size=(sample, 8, 8)).astype(bool)
+    tracemalloc.start()
+    hashes = [imagehash.ImageHash(b.copy()) for b in bits]
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del hashes
+    return used / sample
+
+
+def run(size: int, queries: int, radius: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    hashes = make_hashes(size, rng)
+    query_hashes = make_queries(hashes, queries, radius, rng)
+
+    index = HashSearchIndex()
+    start = time.perf_counter()
+    index.extend(hashes)
+    index.build()
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mih_hits = sum(len(index.query(int(q), radius)[0]) for q in query_hashes)
+    mih_s = time.perf_counter() - start
+
+    linear_count = min(queries, 200)
+    start = time.perf_counter()
+    linear_hits = sum(len(index.query_linear(int(q), radius)[0]) for q in query_hashes[:linear_count])
+    linear_s = (time.perf_counter() - start) * queries / linear_count
+
+    return {
+        "size": size,
+        "radius": radius,
+        "build_s": build_s,
+        "mih_queries_per_s": queries / mih_s,
+        "linear_queries_per_s": queries / linear_s,
+        "speedup": linear_s / mih_s,
+        "mih_hits": mih_hits,
+        "linear_hits_sampled": linear_hits,
+        "index_bytes": index.nbytes,
+        "bytes_per_hash": index.nbytes / size,
+        "imagehash_objects_bytes_per_hash": imagehash_bytes_per_hash(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history-wide hash search")
+    parser.add_argument("--size", type=int, default=1_000_000, help="Number of stored hashes")
+    parser.add_argument("--queries", type=int, default=2000, help="Number of queries")
+    parser.add_argument("--radius", type=int, default=3, help="Hamming radius")
+    args = parser.parse_args()
+
+    result = run(args.size, args.queries, args.radius)
+    for key, value in result.items():
+        print(f"{key:>32}: {value:,.3f}" if isinstance(value, float) else f"{key:>32}: {value:,}")
+
+
+if __name__ == "__main__":
+    main()
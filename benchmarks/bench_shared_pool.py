@@ -0,0 +1,108 @@
+"""
+Benchmark the shared-memory process pool against the serial capture cycle
+
+Every mode replays the same pre-rendered synthetic frames through an
+AutoShot as fast as it can: "serial" calls single_capture_cycle() in a loop,
+"threads" runs the pipelined loop with encode threads and "processes" the
+pipelined loop with --encode-processes, whose workers hash and encode the
+frames from a shared-memory ring. Every mode must save the same frames.
+
+Usage:
+    python benchmarks/bench_shared_pool.py --frames 200 --width 1920 --height 1080
+    python benchmarks/bench_shared_pool.py --change-rate 0.1 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+from PIL import Image
+
+from autoshot.frame_source import FrameSource, SyntheticFrameSource
+from autoshot.main import AutoShot
+
+MODES = ("serial", "threads", "processes")
+
+
+class ListFrameSource(FrameSource):
+    """Replays a list of frames once, then has no frame"""
+
+    def __init__(self, frames: List[Image.Image]):
+        self.frames = frames
+        self.position = 0
+
+    def grab(self) -> Optional[Image.Image]:
+        if self.position >= len(self.frames):
+            return None
+        frame = self.frames[self.position]
+        self.position += 1
+        return frame
+
+
+def run(mode: str, frames: List[Image.Image], workers: int) -> dict:
+    width, height = frames[0].size
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        autoshot = AutoShot("synthetic", width, height, interval=0, frame_source=ListFrameSource(frames),
+                            output_dir=directory, pipelined=mode != "serial", overload_policy="block",
+                            encode_workers=workers, encode_processes=mode == "processes")
+        start = time.perf_counter()
+        if mode == "serial":
+            for _ in frames:
+                autoshot.single_capture_cycle()
+        else:
+            autoshot.start_capture_loop()
+            while True:
+                stats = autoshot.stats()
+                if stats["frames_saved"] + stats["frames_skipped"] >= len(frames):
+                    break
+                time.sleep(0.001)
+            autoshot.stop_capture_loop()
+        elapsed = time.perf_counter() - start
+        stats = autoshot.stats()
+    result = {
+        "fps": len(frames) / elapsed,
+        "ms_per_frame": elapsed / len(frames) * 1000,
+        "frames_saved": stats["frames_saved"],
+        "frames_skipped": stats["frames_skipped"],
+    }
+    shared = stats.get("pipeline", {}).get("shared_memory")
+    if shared:
+        result["frames_shared"] = shared["frames_shared"]
+        result["frames_pickled"] = shared["frames_pickled"]
+        result["slot_waits"] = shared["slot_waits"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared-memory process pool against the serial cycle")
+    parser.add_argument("--frames", type=int, default=200, help="Frames to replay (default: 200)")
+    parser.add_argument("--width", type=int, default=1920, help="Frame width (default: 1920)")
+    parser.add_argument("--height", type=int, default=1080, help="Frame height (default: 1080)")
+    parser.add_argument("--change-rate", type=float, default=0.5,
+                        help="Fraction of frames that differ from the previous one (default: 0.5)")
+    parser.add_argument("--workers", type=int, default=2, help="Encode threads or processes (default: 2)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="Modes to run (default: all)")
+    args = parser.parse_args()
+
+    source = SyntheticFrameSource(args.width, args.height, change_rate=args.change_rate, seed=0)
+    frames = [source.grab() for _ in range(args.frames)]
+    print(f"{args.frames} frames of {args.width}x{args.height}, {args.workers} workers, {os.cpu_count()} CPUs")
+
+    results = {mode: run(mode, frames, args.workers) for mode in args.modes}
+    serial = results.get("serial")
+    for mode, result in results.items():
+        speedup = f", speedup={result['fps'] / serial['fps']:.2f}x" if serial else ""
+        extra = "".join(f", {key}={result[key]}" for key in ("frames_shared", "frames_pickled", "slot_waits")
+                        if key in result)
+        mismatch = ""
+        if serial and result["frames_saved"] != serial["frames_saved"]:
+            mismatch = f"  MISMATCH (serial saved {serial['frames_saved']})"
+        print(f"{mode}: fps={result['fps']:.1f}, ms_per_frame={result['ms_per_frame']:.2f}, "
+              f"saved={result['frames_saved']}{speedup}{extra}{mismatch}")
+
+
+if __name__ == "__main__":
+    main()
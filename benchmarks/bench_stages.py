@@ -0,0 +1,241 @@
+"""
+Benchmark each stage of the capture loop in isolation and end to end
+
+Runs headless on synthetic frames. Sweeps the window resolution for the
+per-frame stages (crop, grayscale + hash, compare, the exact digest and
+verifier signatures of the dedupe cascade, PNG encode, save, a full capture
+cycle) and the directory size for the stages that depend on it (the
+scan in find_similar_images, with and without the frame index, and dedupe
+delete). Results can be written as JSON and compared against a saved run.
+
+Usage:
+    python benchmarks/bench_stages.py --output baseline.json
+    python benchmarks/bench_stages.py --baseline baseline.json --fail-on-regression
+    python benchmarks/bench_stages.py --resolutions 1920x1080 --dir-sizes 100 1000 10000 100000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from autoshot.encoder import ImageEncoder
+from autoshot.frame_index import FrameIndex
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.image_processor import ImageProcessor
+from autoshot.main import AutoShot
+from autoshot.similarity_detector import SimilarityDetector, Verifier, frame_digest
+
+
+def measure(func: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None) -> dict:
+    """
+    Time repeated calls of func; setup runs untimed before each call
+
+    Returns:
+        Dictionary with mean_ms, median_ms, p95_ms, min_ms and runs
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "mean_ms": statistics.fmean(times),
+        "median_ms": statistics.median(times),
+        "p95_ms": times[min(int(len(times) * 0.95), len(times) - 1)],
+        "min_ms": times[0],
+        "runs": len(times),
+    }
+
+
+def quiet():
+    # The capture loop reports every frame on stdout
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def bench_frame_stages(width: int, height: int, repeat: int, change_rate: float) -> dict:
+    source = SyntheticFrameSource(width, height, change_rate=1.0, seed=0)
+    frames = [source.grab() for _ in range(repeat)]
+    detector = SimilarityDetector()
+    encoder = ImageEncoder()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        processor = ImageProcessor(directory, encoder)
+        crops = [processor.crop_top_half(frame) for frame in frames]
+        hashes = [detector.calculate_hash(crop) for crop in crops]
+        encoded = [encoder.encode(crop) for crop in crops]
+
+        frame_iter, crop_iter, encoded_iter = iter(frames), iter(crops), iter(encoded)
+        results["crop"] = measure(lambda: processor.crop_top_half(next(frame_iter)), repeat)
+        results["grayscale_hash"] = measure(lambda: detector.calculate_hash(next(crop_iter)), repeat)
+        results["compare"] = measure(lambda: detector.compare_images(hashes[0], hashes[-1]), repeat)
+        # Dedupe cascade tiers: the digest before hashing, the verifier signatures after
+        crop_iter = iter(crops)
+        results["exact_digest"] = measure(lambda: frame_digest(next(crop_iter)), repeat)
+        for method in ("fine", "ssim"):
+            verifier = Verifier(method)
+            crop_iter = iter(crops)
+            results[f"verify_{method}"] = measure(lambda: verifier.signature(next(crop_iter)), repeat)
+        crop_iter = iter(crops)
+        results["png_encode"] = measure(lambda: encoder.encode(next(crop_iter)), repeat)
+        results["save"] = measure(
+            lambda: processor.save_encoded(next(encoded_iter), processor.create_unique_filename()), repeat)
+
+    with tempfile.TemporaryDirectory() as directory, quiet():
+        autoshot = AutoShot("bench", width, height, frame_source=SyntheticFrameSource(
+            width, height, change_rate=change_rate, seed=0), output_dir=directory)
+        results["end_to_end"] = measure(autoshot.single_capture_cycle, repeat)
+        autoshot.flush()
+    return results
+
+
+def populate(directory: Path, count: int, data: bytes):
+    # Tiny frames with strictly increasing mtimes, like a long capture session
+    now = time.time() - count
+    for i in range(count):
+        path = directory / f"screenshot_{i:08d}.png"
+        path.write_bytes(data)
+        os.utime(path, (now + i, now + i))
+
+
+def bench_directory_stages(count: int, repeat: int, width: int, height: int) -> dict:
+    detector = SimilarityDetector()
+    tiny = Image.new("RGB", (16, 16), "white")
+    buffer = io.BytesIO()
+    tiny.save(buffer, format="PNG")
+    tiny_hash = detector.hash_image(tiny)
+    # The top half of a window, as the capture loop saves it
+    frame = SyntheticFrameSource(width, height, seed=0).grab().crop((0, 0, width, height // 2))
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        populate(directory, count, buffer.getvalue())
+        start = time.perf_counter()
+        # The files are all the same, so skip decoding each one to hash it
+        FrameIndex(str(directory), lambda image: tiny_hash).close()
+        results["index_build"] = {"median_ms": (time.perf_counter() - start) * 1000, "runs": 1}
+
+        with quiet():
+            autoshot = AutoShot("bench", width, height, frame_source=SyntheticFrameSource(width, height),
+                                output_dir=str(directory))
+            processor = autoshot.image_processor
+            frame_hash = detector.hash_image(frame)
+            reference = processor.save_image(frame, processor.create_unique_filename(), frame_hash)
+
+            results["find_similar_scan"] = measure(
+                lambda: detector.find_similar_images(reference, str(directory)), repeat)
+            results["find_similar_index"] = measure(
+                lambda: detector.find_similar_images(reference, str(directory), processor.index), repeat)
+
+            # Each run saves a copy of the last frame and deletes the previous one,
+            # so the directory keeps its size
+            latest = [reference]
+
+            def save_copy():
+                latest[0] = processor.save_image(frame, processor.create_unique_filename(), frame_hash)
+
+            results["dedupe_delete"] = measure(lambda: autoshot.remove_duplicates(latest[0]), repeat, save_copy)
+            processor.index.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Print the median of every result next to the baseline's
+
+    Returns:
+        Keys whose median grew by more than the tolerance
+    """
+    regressions = []
+    print(f"\n{'benchmark':<48}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["median_ms"], result["median_ms"]
+        change = after / before - 1 if before > 0 else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<48}{before:>14.3f}{after:>14.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def parse_resolution(value: str) -> tuple:
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the capture pipeline stage by stage")
+    parser.add_argument("--resolutions", type=parse_resolution, nargs="+",
+                        default=[(640, 480), (1280, 720), (1920, 1080)], metavar="WxH",
+                        help="Window resolutions (default: 640x480 1280x720 1920x1080)")
+    parser.add_argument("--dir-sizes", type=int, nargs="*", default=[100, 1000, 10000], metavar="N",
+                        help="Directory sizes for the scan and delete stages (default: 100 1000 10000)")
+    parser.add_argument("--repeat", type=int, default=30, help="Runs per per-frame stage (default: 30)")
+    parser.add_argument("--dir-repeat", type=int, default=5, help="Runs per directory stage (default: 5)")
+    parser.add_argument("--change-rate", type=float, default=0.2,
+                        help="Probability that a frame changes in the end-to-end cycle (default: 0.2)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Median slowdown counted as a regression (default: 0.10)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if a stage regressed against the baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for width, height in args.resolutions:
+        for stage, result in bench_frame_stages(width, height, args.repeat, args.change_rate).items():
+            results[f"frame/{width}x{height}/{stage}"] = result
+            print(f"frame/{width}x{height}/{stage}: median_ms={result['median_ms']:.3f}, "
+                  f"p95_ms={result['p95_ms']:.3f}")
+    width, height = args.resolutions[0]
+    for count in args.dir_sizes:
+        for stage, result in bench_directory_stages(count, args.dir_repeat, width, height).items():
+            results[f"directory/{count}/{stage}"] = result
+            print(f"directory/{count}/{stage}: median_ms={result['median_ms']:.3f}")
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pillow": PIL.__version__,
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.tolerance:.0%}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark the startup time of the command line paths
+
+Each scenario runs in a fresh interpreter, so the time includes every
+import it triggers. The bare interpreter is timed too and subtracted. A run
+also checks that the quick paths (importing autoshot.main, --query-pixel)
+load none of the imaging libraries. Results can be written as JSON and
+compared against a saved run, like bench_stages.py.
+
+Usage:
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --fail-on-regression
+    python benchmarks/bench_startup.py --importtime
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HEAVY_MODULES = ("numpy", "PIL", "imagehash", "scipy", "pywt", "http.server")
+
+# name -> (code run in a fresh interpreter, must stay free of HEAVY_MODULES)
+SCENARIOS = {
+    "python": ("pass", True),
+    "import_main": ("import autoshot.main", True),
+    "query_pixel": ("from autoshot.main import main\n"
+                    "try:\n"
+                    "    main(['--title', 'No such window', '--query-pixel', '1', '2'])\n"
+                    "except SystemExit:\n"
+                    "    pass", True),
+    "help": ("from autoshot.main import main\n"
+             "import contextlib, io\n"
+             "with contextlib.redirect_stdout(io.StringIO()):\n"
+             "    try:\n"
+             "        main(['--help'])\n"
+             "    except SystemExit:\n"
+             "        pass", False),
+    "import_capture": ("from autoshot.main import AutoShot\n"
+                       "from autoshot.capture_stream import CaptureStream", False),
+}
+
+
+def run(code: str) -> tuple:
+    """
+    Run code in a fresh interpreter
+
+    Returns:
+        Tuple of (wall time in ms, heavy modules it loaded)
+    """
+    script = (f"{code}\nimport json, sys\n"
+              f"print('\\n' + json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return elapsed, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench(repeat: int) -> dict:
+    results = {}
+    for name, (code, _) in SCENARIOS.items():
+        run(code)  # Warm up the bytecode caches
+        times, loaded = [], []
+        for _ in range(repeat):
+            elapsed, loaded = run(code)
+            times.append(elapsed)
+        times.sort()
+        results[name] = {
+            "median_ms": statistics.median(times),
+            "min_ms": times[0],
+            "p95_ms": times[min(int(len(times) * 0.95), len(times) - 1)],
+            "runs": len(times),
+            "heavy_modules": loaded,
+        }
+    python = results["python"]["median_ms"]
+    for result in results.values():
+        result["over_python_ms"] = result["median_ms"] - python
+    return results
+
+
+def print_importtime(limit: int):
+    """
+    Print the modules with the largest cumulative import time under autoshot.main
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import autoshot.main"],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    rows.sort(reverse=True)
+    print(f"\n{'cumulative ms':>14}  module")
+    for cumulative_us, name in rows[:limit]:
+        print(f"{cumulative_us / 1000:>14.1f}  {name}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Print the time over the bare interpreter next to the baseline's
+
+    Returns:
+        Scenarios that got slower by more than the tolerance
+    """
+    regressions = []
+    print(f"\n{'scenario':<20}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for key, result in results.items():
+        if key not in baseline or key == "python":
+            continue
+        before, after = baseline[key]["over_python_ms"], result["over_python_ms"]
+        change = after / before - 1 if before > 0 else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<20}{before:>14.1f}{after:>14.1f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the command line paths")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per scenario (default: 10)")
+    parser.add_argument("--importtime", action="store_true",
+                        help="Also list the slowest imports of autoshot.main (python -X importtime)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Slowdown over the bare interpreter counted as a regression (default: 0.25)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 on a regression, or if a quick path loads an imaging library")
+    args = parser.parse_args()
+
+    results = bench(args.repeat)
+    failed = False
+    for name, result in results.items():
+        light = SCENARIOS[name][1]
+        note = ""
+        if light and result["heavy_modules"]:
+            note = f"  LOADS {', '.join(result['heavy_modules'])}"
+            failed = True
+        print(f"{name}: median_ms={result['median_ms']:.1f}, over_python_ms={result['over_python_ms']:.1f}{note}")
+    if args.importtime:
+        print_importtime(15)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.tolerance:.0%}")
+            failed = True
+    if failed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
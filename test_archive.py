@@ -0,0 +1,113 @@
+"""
+Tests for segmented archive storage
+"""
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot import archive
+from autoshot.archive import ArchiveReader, ArchiveWriter, export_frames
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot
+
+
+def fill(directory, count, segment_size=archive.DEFAULT_SEGMENT_SIZE):
+    writer = ArchiveWriter(str(directory), segment_size=segment_size)
+    locations = [writer.append(bytes([i]) * (100 + i), hash_value=i * 7 if i % 3 else None)
+                 for i in range(count)]
+    return writer, locations
+
+
+def test_segments_roll_and_read_back(tmp_path):
+    writer, _ = fill(tmp_path, 20, segment_size=500)
+    writer.close()
+    reader = ArchiveReader(str(tmp_path))
+    assert len(reader.segments) > 3
+    frames = list(reader.frames())
+    assert [frame.data for frame in frames] == [bytes([i]) * (100 + i) for i in range(20)]
+    assert [frame.hash for frame in frames] == [i * 7 if i % 3 else None for i in range(20)]
+    timestamps = [frame.timestamp for frame in frames]
+    assert timestamps == sorted(set(timestamps))
+    reader.close()
+
+
+def test_time_range_and_random_access(tmp_path):
+    writer, _ = fill(tmp_path, 30, segment_size=700)
+    writer.close()
+    reader = ArchiveReader(str(tmp_path))
+    timestamps = [frame.timestamp for frame in reader.frames()]
+    selected = list(reader.frames(timestamps[5], timestamps[17]))
+    assert [frame.timestamp for frame in selected] == timestamps[5:17]
+
+    assert reader.get(timestamps[9]).data == bytes([9]) * 109
+    assert reader.get(timestamps[9] + 0.5).timestamp == timestamps[9]
+    assert reader.get(timestamps[0] - 1) is None
+    reader.close()
+
+
+def test_open_segment_without_footer_is_recovered(tmp_path):
+    writer, _ = fill(tmp_path, 5)
+    # Simulate a crash: never closed, and the last record is torn
+    segment = ArchiveReader(str(tmp_path)).segments[0]
+    with open(segment, "ab") as f:
+        f.write(archive.RECORD.pack(123, 0, 0, 1000) + b"partial")
+    reader = ArchiveReader(str(tmp_path))
+    assert [frame.data[:1] for frame in reader.frames()] == [bytes([i]) for i in range(5)]
+    reader.close()
+
+
+def test_writer_serves_as_frame_index(tmp_path):
+    writer, locations = fill(tmp_path, 6, segment_size=300)
+    assert len(writer) == 6
+    assert [entry[0] for entry in writer.entries()] == locations
+    assert writer.latest()[0] == locations[-1]
+    writer.close()
+
+    reopened = ArchiveWriter(str(tmp_path))
+    assert len(reopened) == 6
+    assert reopened.latest()[3] == 5 * 7
+
+
+def test_capture_into_archive_and_export(tmp_path):
+    source = SyntheticFrameSource(160, 100, change_rate=0.5, seed=4)
+    autoshot = AutoShot("synthetic", 160, 100, frame_source=source, output_dir=str(tmp_path / "archive"),
+                        storage="archive")
+    for _ in range(12):
+        autoshot.single_capture_cycle()
+    autoshot.flush()
+    saved = autoshot.stats()["frames_saved"]
+    assert not list((tmp_path / "archive").glob("*.png"))
+
+    reader = ArchiveReader(str(tmp_path / "archive"))
+    assert export_frames(reader, str(tmp_path / "png")) == saved
+    exported = sorted((tmp_path / "png").glob("*.png"))
+    assert len(exported) == saved
+    last = reader.get(reader.latest()[1] * 1000)
+    with Image.open(exported[-1]) as image:
+        assert np.array_equal(np.asarray(image), np.asarray(last.image()))
+    reader.close()
+
+    # A restart dedupes against the archived history instead of saving the same frame again
+    restarted = AutoShot("synthetic", 160, 100, frame_source=source, output_dir=str(tmp_path / "archive"),
+                         storage="archive")
+    source._rng.seed(99)
+    source.change_rate = 0.0
+    restarted.single_capture_cycle()
+    assert restarted.stats()["frames_saved"] == 0
+
+
+def test_cli_list_and_get(tmp_path, monkeypatch, capsys):
+    writer, _ = fill(tmp_path / "a", 4)
+    writer.close()
+    monkeypatch.setattr(sys, "argv", ["archive", "list", str(tmp_path / "a")])
+    archive.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 4
+    timestamp = lines[2].split("\t")[0]
+
+    output = tmp_path / "frame.bin"
+    monkeypatch.setattr(sys, "argv", ["archive", "get", str(tmp_path / "a"), timestamp, str(output)])
+    archive.main()
+    assert output.read_bytes() == bytes([2]) * 102
@@ -0,0 +1,176 @@
+"""
+Tests for the asyncio streaming interface
+"""
+import asyncio
+import concurrent.futures
+import gc
+import threading
+import time
+
+import pytest
+
+from autoshot import metrics
+from autoshot.async_capture import AsyncAutoShot
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot
+from autoshot.roi import Region
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    level = metrics.get_verbosity()
+    metrics.set_verbosity(metrics.QUIET)
+    yield
+    metrics.set_verbosity(level)
+
+
+def make_autoshot(tmp_path, interval=0.0, **kwargs):
+    source = SyntheticFrameSource(160, 100, change_rate=0.5, seed=3)
+    return AutoShot("synthetic", 160, 100, interval=interval, frame_source=source, output_dir=str(tmp_path),
+                    **kwargs)
+
+
+def test_frames_yield_dedupe_verdicts_and_saved_paths(tmp_path):
+    autoshot = make_autoshot(tmp_path)
+
+    async def consume():
+        records = []
+        async with AsyncAutoShot(autoshot) as shot:
+            async for record in shot.frames():
+                records.append(record)
+                if len(records) == 20:
+                    break
+        return records
+
+    records = asyncio.run(consume())
+    new = [record for record in records if not record.is_duplicate]
+    assert len(new) == autoshot.frame_source.frames_changed + 1
+    assert all(record.saved_path is None for record in records if record.is_duplicate)
+    assert sorted(str(path) for path in tmp_path.glob("*.png")) == sorted(record.saved_path for record in new)
+    assert all(record.hash_value is not None for record in new)
+    assert records[0].region == "top_half" and records[0].image.size == (160, 50)
+    assert autoshot.stats()["scheduler"]["ticks"] == 20
+
+
+def test_unsaved_frames_still_dedupe(tmp_path):
+    autoshot = make_autoshot(tmp_path, regions=[Region(0, 0, 80, 100, name="left"),
+                                                Region(80, 0, 160, 100, name="right")])
+
+    async def consume():
+        shot = AsyncAutoShot(autoshot, save=False, duplicates=False)
+        first = await shot.capture()
+        again = await shot.capture()
+        await shot.aclose()
+        return first, again
+
+    first, again = asyncio.run(consume())
+    assert [record.region for record in first] == ["left", "right"]
+    assert not any(record.is_duplicate or record.saved_path for record in first)
+    assert len(again) == 2 and not list(tmp_path.rglob("*.png"))
+    stats = autoshot.stats()
+    assert stats["frames_captured"] == 2 and stats["frames_saved"] == 0
+    assert stats["frames_skipped"] == sum(record.is_duplicate for record in again)
+
+
+def test_slow_consumer_is_the_backpressure(tmp_path):
+    autoshot = make_autoshot(tmp_path, interval=0.01)
+
+    async def consume():
+        async with AsyncAutoShot(autoshot) as shot:
+            count = 0
+            async for _ in shot.frames():
+                count += 1
+                await asyncio.sleep(0.05)
+                if count == 4:
+                    break
+
+    asyncio.run(consume())
+    # Nothing is captured ahead of the consumer; the missed ticks are skipped
+    assert autoshot.stats()["frames_captured"] == 4
+    assert autoshot.stats()["scheduler"]["skipped_ticks"] >= 3
+
+
+def test_cancel_waits_for_the_cycle_in_progress(tmp_path):
+    autoshot = make_autoshot(tmp_path, interval=0.01)
+    grab, release = autoshot.frame_source.grab_regions, threading.Event()
+
+    def slow_grab(regions):
+        release.wait(5)
+        return grab(regions)
+
+    autoshot.frame_source.grab_regions = slow_grab
+
+    async def run():
+        shot = AsyncAutoShot(autoshot)
+
+        async def consume():
+            async for _ in shot.frames():
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        threading.Timer(0.05, release.set).start()
+        start = time.monotonic()
+        await shot.aclose()
+        return time.monotonic() - start
+
+    waited = asyncio.run(run())
+    assert waited >= 0.04
+    # The frame grabbed while cancelling was still processed and saved
+    assert autoshot.stats()["frames_saved"] == 1 == len(list(tmp_path.glob("*.png")))
+
+
+def test_cycles_never_overlap_on_a_shared_executor(tmp_path):
+    autoshot = make_autoshot(tmp_path)
+    grab, active, overlaps = autoshot.frame_source.grab_regions, [], []
+
+    def tracked_grab(regions):
+        active.append(None)
+        overlaps.append(len(active))
+        time.sleep(0.01)
+        active.pop()
+        return grab(regions)
+
+    autoshot.frame_source.grab_regions = tracked_grab
+
+    async def run():
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            shot = AsyncAutoShot(autoshot, executor=executor)
+            await asyncio.gather(*(shot.capture() for _ in range(6)))
+            await shot.aclose()
+
+    asyncio.run(run())
+    assert len(overlaps) == 6 and max(overlaps) == 1
+    assert autoshot.stats()["frames_captured"] == 6
+
+
+def test_aclose_logs_the_error_of_a_cancelled_cycle(tmp_path, capsys):
+    autoshot = make_autoshot(tmp_path, interval=0.01)
+    release = threading.Event()
+
+    def failing_grab():
+        release.wait(5)
+        raise RuntimeError("window closed")
+
+    autoshot.grab_regions = failing_grab
+
+    async def run():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        shot = AsyncAutoShot(autoshot)
+        task = asyncio.create_task(shot.capture())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+        await shot.aclose()
+        gc.collect()
+        await asyncio.sleep(0)
+        return errors
+
+    assert asyncio.run(run()) == []
+    assert "Error in capture cycle: window closed" in capsys.readouterr().out
@@ -0,0 +1,52 @@
+"""
+Tests for vectorized batch hashing
+"""
+import imagehash
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot.batch_hash import batch_hash
+from autoshot.similarity_detector import SimilarityDetector, hash_to_int
+
+REFERENCE = {
+    "ahash": imagehash.average_hash,
+    "dhash": imagehash.dhash,
+    "phash": imagehash.phash,
+}
+
+
+def make_images(height, width, mode="RGB", count=6):
+    rng = np.random.default_rng(height * 1000 + width)
+    frames = rng.integers(0, 256, size=(count, height, width, 3), dtype=np.uint8)
+    # Smooth gradients give many near-ties, which is where rounding shows
+    ramp = np.linspace(0, 255, width)[None, None, :, None]
+    frames[: count // 2] = (ramp + rng.normal(0, 2, (count // 2, height, width, 3))).clip(0, 255)
+    return [Image.fromarray(frame).convert(mode) for frame in frames]
+
+
+@pytest.mark.parametrize("algorithm", sorted(REFERENCE))
+@pytest.mark.parametrize("size", [(300, 800), (31, 47), (5, 6)])
+def test_bit_identical_to_imagehash(algorithm, size):
+    images = make_images(*size)
+    expected = [hash_to_int(REFERENCE[algorithm](image)) for image in images]
+    assert batch_hash(images, algorithm).tolist() == expected
+    array = np.stack([np.asarray(image) for image in images])
+    assert batch_hash(array, algorithm).tolist() == expected
+
+
+def test_grayscale_array_input():
+    images = make_images(40, 60, mode="L")
+    array = np.stack([np.asarray(image) for image in images])
+    assert batch_hash(array).tolist() == [hash_to_int(imagehash.average_hash(i)) for i in images]
+
+
+def test_detector_batch_matches_single():
+    detector = SimilarityDetector(hash_algorithm="dhash")
+    images = make_images(30, 90)
+    assert detector.hash_batch(images).tolist() == [detector.hash_image(i) for i in images]
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        batch_hash(make_images(8, 8), "whash")
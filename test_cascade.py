@@ -0,0 +1,126 @@
+"""
+Tests for the tiered dedupe cascade
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot, build_parser, make_verifier
+from autoshot.similarity_detector import SimilarityDetector, Verifier, frame_digest, hash_to_int
+
+
+def chat_page(seed=0):
+    """White page with rows of dark words, like a chat window"""
+    rng = np.random.default_rng(seed)
+    page = np.full((300, 800), 255, np.uint8)
+    for y in range(10, 280, 18):
+        x = 20
+        while x < 700:
+            width = int(rng.integers(15, 60))
+            page[y:y + 10, x:x + width] = 40
+            x += width + 8
+    return page
+
+
+@pytest.fixture
+def page():
+    return chat_page()
+
+
+@pytest.fixture
+def new_word(page):
+    # A short new line: different content with the same 64-bit hash
+    changed = page.copy()
+    changed[284:294, 20:70] = 40
+    return Image.fromarray(changed)
+
+
+@pytest.fixture
+def blink(page):
+    # A text cursor that flips one bit of the 64-bit hash
+    changed = page.copy()
+    changed[8:24, 242:244] = 0
+    return Image.fromarray(changed)
+
+
+def test_exact_tier_skips_the_hash():
+    source = SyntheticFrameSource(200, 100, change_rate=1.0, seed=2)
+    first, second = source.grab(), source.grab()
+    detector = SimilarityDetector()
+    for frame in (first, second):
+        is_duplicate, phash = detector.is_duplicate(frame)
+        assert not is_duplicate
+        detector.accept(phash)
+    # The last frame and a revisited one are found by digest
+    for frame in (second, first.copy()):
+        is_duplicate, phash = detector.is_duplicate(frame)
+        assert is_duplicate and phash == detector.calculate_hash(frame)
+    assert detector.tier_checks == {"exact": 4, "hash": 2, "verify": 0}
+    assert detector.tier_hits["exact"] == 2
+    assert detector.history_matches == 1
+    assert frame_digest(first) == frame_digest(first.copy()) != frame_digest(second)
+
+
+def test_discarded_frames_leave_the_exact_tier():
+    frame = SyntheticFrameSource(120, 80, seed=4).grab()
+    detector = SimilarityDetector()
+    detector.accept(detector.is_duplicate(frame)[1])
+    detector.accept(detector.calculate_hash(Image.new("RGB", (120, 80))))
+    detector.discard(hash_to_int(detector.calculate_hash(frame)))
+    assert not detector.is_duplicate(frame)[0]
+
+
+def test_fine_verifier_splits_hash_collisions(page, new_word):
+    plain = SimilarityDetector()
+    verified = SimilarityDetector(verifier=Verifier("fine"))
+    for detector in (plain, verified):
+        detector.accept(detector.is_duplicate(Image.fromarray(page))[1])
+    assert plain.is_duplicate(new_word)[0]
+    assert not verified.is_duplicate(new_word)[0]
+    assert verified.tier_checks["verify"] == 1 and verified.tier_hits["verify"] == 0
+
+
+@pytest.mark.parametrize("method", ["fine", "ssim"])
+def test_verifier_merges_cursor_blinks(page, new_word, blink, method):
+    plain = SimilarityDetector(exact_match=False)
+    verified = SimilarityDetector(exact_match=False, verifier=Verifier(method))
+    for detector in (plain, verified):
+        detector.accept(detector.is_duplicate(Image.fromarray(page))[1])
+    assert not plain.is_duplicate(blink)[0]
+    assert verified.is_duplicate(blink)[0]
+    assert not verified.is_duplicate(new_word)[0]
+    assert verified.tier_hits == {"exact": 0, "hash": 0, "verify": 1}
+
+
+def test_history_candidates_are_verified(page, new_word):
+    detector = SimilarityDetector(exact_match=False, verifier=Verifier("fine"))
+    for frame in (Image.fromarray(page), Image.fromarray(chat_page(seed=1))):
+        detector.accept(detector.is_duplicate(frame)[1])
+    # The first page is only in the history now
+    assert not detector.is_duplicate(new_word)[0]
+    assert detector.is_duplicate(Image.fromarray(page))[0]
+    assert detector.history_matches == 1
+
+
+def test_stats_and_cli(tmp_path):
+    args = build_parser().parse_args(["--title", "t", "--width", "200", "--height", "100",
+                                      "--verify", "ssim", "--verify-threshold", "0.9"])
+    verifier = make_verifier(args)
+    assert (verifier.method, verifier.radius, verifier.threshold) == ("ssim", 4, 0.9)
+
+    source = SyntheticFrameSource(200, 100, change_rate=0.5, seed=1)
+    autoshot = AutoShot("t", 200, 100, frame_source=source, output_dir=str(tmp_path),
+                        change_gate=False, verifier=verifier)
+    for _ in range(20):
+        autoshot.single_capture_cycle()
+    stats = autoshot.stats()
+    assert stats["exact_checks"] == 20
+    assert stats["exact_hits"] + stats["hash_hits"] + stats["verify_hits"] == stats["frames_skipped"]
+    assert 0 < stats["exact_hit_rate"] < 1
+    assert 'autoshot_dedupe_hits_total{region="top_half",tier="exact"}' in autoshot.metrics.prometheus()
+
+
+def test_unknown_verify_method():
+    with pytest.raises(ValueError):
+        Verifier("mse")
@@ -0,0 +1,69 @@
+"""
+Tests for the change-detection gate
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot.change_gate import ChangeGate
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot
+
+
+def make_frame(mode="RGB", size=(200, 130)):
+    pixels = np.random.default_rng(0).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    return Image.fromarray(pixels).convert(mode)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "1"])
+def test_reports_dirty_tiles(mode):
+    gate = ChangeGate(tile_size=64)
+    frame = make_frame(mode)
+    first = gate.check(frame)
+    assert first.changed and first.grid == (4, 3) and len(first.dirty_tiles) == 12
+
+    assert not gate.check(frame.copy()).changed
+
+    edited = frame.copy()
+    edited.putpixel((150, 100), 0 if frame.getpixel((150, 100)) else 1)
+    result = gate.check(edited)
+    assert result.changed
+    assert result.dirty_tiles == [(128, 64, 192, 128)]
+    assert gate.stats()["unchanged"] == 1
+
+
+def test_edge_tiles_are_clamped():
+    gate = ChangeGate(tile_size=64)
+    frame = make_frame()
+    gate.check(frame)
+    edited = frame.copy()
+    edited.putpixel((199, 129), (1, 2, 3))
+    assert gate.check(edited).dirty_tiles == [(192, 128, 200, 130)]
+
+
+def test_size_change_and_reset_mark_everything_dirty():
+    gate = ChangeGate(tile_size=64)
+    gate.check(make_frame())
+    assert gate.check(make_frame(size=(64, 64))).dirty_tiles == [(0, 0, 64, 64)]
+    gate.reset()
+    assert gate.check(make_frame(size=(64, 64))).changed
+
+
+def test_unchanged_frames_skip_hashing(tmp_path):
+    source = SyntheticFrameSource(160, 120, change_rate=0.3, seed=5)
+    autoshot = AutoShot("synthetic", 160, 120, frame_source=source, output_dir=str(tmp_path))
+    detector = autoshot.similarity_detector
+    hashed = []
+    original = detector.is_duplicate
+    detector.is_duplicate = lambda image: hashed.append(1) or original(image)
+
+    for _ in range(30):
+        autoshot.single_capture_cycle()
+
+    stats = autoshot.stats()
+    assert len(hashed) == source.frames_changed + 1
+    assert stats["gate_unchanged"] == 30 - len(hashed)
+    assert stats["frames_saved"] == source.frames_changed + 1
+    assert stats["frames_skipped"] == 30 - stats["frames_saved"]
+    assert stats["gate_hit_rate"] == pytest.approx(stats["gate_unchanged"] / 30)
+    assert autoshot.streams[0].last_change is not None
@@ -0,0 +1,53 @@
+"""
+Tests for in-memory dedupe in AutoShot.process_frame
+"""
+from PIL import Image, ImageDraw
+
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot
+from autoshot.similarity_detector import SimilarityDetector
+
+
+def make_frame(text: str) -> Image.Image:
+    image = Image.new("RGB", (200, 80), "white")
+    ImageDraw.Draw(image).rectangle((10, 10, 10 + 15 * len(text), 60), fill="black")
+    return image
+
+
+def make_autoshot(tmp_path):
+    return AutoShot("test", 200, 160, frame_source=SyntheticFrameSource(200, 160),
+                    output_dir=str(tmp_path))
+
+
+def test_is_duplicate_uses_cached_hash():
+    detector = SimilarityDetector()
+    frame = make_frame("a")
+    is_duplicate, phash = detector.is_duplicate(frame)
+    assert not is_duplicate
+    detector.accept(phash)
+    assert detector.is_duplicate(frame.copy())[0]
+    assert not detector.is_duplicate(make_frame("abcdefgh"))[0]
+
+
+def test_process_frame_skips_duplicates_without_writing(tmp_path):
+    autoshot = make_autoshot(tmp_path)
+
+    is_duplicate, first_path = autoshot.process_frame(make_frame("a"))
+    assert not is_duplicate and first_path is not None
+
+    is_duplicate, path = autoshot.process_frame(make_frame("a"))
+    assert is_duplicate and path is None
+    assert len(list(tmp_path.glob("*.png"))) == 1
+
+    stats = autoshot.stats()
+    assert stats["frames_saved"] == 1
+    assert stats["frames_skipped"] == 1
+    assert stats["bytes_not_written"] == stats["bytes_written"] > 0
+
+
+def test_last_hash_is_seeded_from_directory(tmp_path):
+    make_frame("a").save(tmp_path / "screenshot_1.png")
+    autoshot = make_autoshot(tmp_path)
+
+    is_duplicate, _ = autoshot.process_frame(make_frame("a"))
+    assert is_duplicate
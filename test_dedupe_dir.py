@@ -0,0 +1,110 @@
+"""
+Tests for the offline directory dedupe command
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot import dedupe
+from autoshot.dedupe import DirectoryDeduper
+
+
+def write_frame(path, seed, mtime, noise=0):
+    rng = np.random.default_rng(seed)
+    pixels = np.repeat(np.repeat(rng.integers(0, 256, (8, 8), dtype=np.uint8), 8, 0), 8, 1)
+    if noise:
+        pixels = pixels.copy()
+        pixels[:noise, :noise] = 255 - pixels[:noise, :noise]
+    Image.fromarray(pixels).convert("RGB").save(path)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def frames(tmp_path):
+    now = time.time() - 100
+    # Three distinct screens, each saved several times
+    for i in range(12):
+        write_frame(tmp_path / f"screenshot_{i:04d}.png", seed=i % 3, mtime=now + i)
+    (tmp_path / "notes.txt").write_text("not a frame")
+    (tmp_path / "broken.png").write_bytes(b"not a png")
+    return tmp_path
+
+
+def test_dry_run_reports_without_deleting(frames, tmp_path_factory):
+    report = tmp_path_factory.mktemp("report") / "report.jsonl"
+    deduper = DirectoryDeduper(str(frames), workers=1, batch_size=4)
+    summary = deduper.run(dry_run=True, report=str(report))
+    deduper.close()
+    assert summary["scanned"] == 13
+    assert summary["files"] == 12
+    assert summary["clusters"] == 3
+    assert summary["duplicates"] == 9
+    assert summary["removed"] == 0
+    assert len(list(frames.glob("screenshot_*.png"))) == 12
+
+    lines = [json.loads(line) for line in report.read_text().splitlines()]
+    assert len(lines) == 9
+    # The newest copy of each screen is kept
+    kept = {line["keep"] for line in lines}
+    assert {os.path.basename(path) for path in kept} == {f"screenshot_{i:04d}.png" for i in (9, 10, 11)}
+    assert all(line["distance"] == 0 for line in lines)
+
+
+def test_apply_keeps_oldest(frames):
+    deduper = DirectoryDeduper(str(frames), keep="oldest", workers=1)
+    summary = deduper.run(dry_run=False)
+    deduper.close()
+    assert summary["removed"] == 9
+    assert sorted(path.name for path in frames.glob("screenshot_*.png")) == [
+        f"screenshot_{i:04d}.png" for i in range(3)]
+
+
+def test_radius_never_chains(tmp_path):
+    base = np.zeros((64, 64), dtype=np.uint8)
+    base[:, 32:] = 255
+    now = time.time()
+    # Each frame flips one more block of the hash grid than the one before
+    for i in range(6):
+        pixels = base.copy()
+        for block in range(i):
+            pixels[block * 8:block * 8 + 8, :8] = 255
+        Image.fromarray(pixels).convert("RGB").save(tmp_path / f"frame_{i}.png")
+        os.utime(tmp_path / f"frame_{i}.png", (now + i, now + i))
+
+    deduper = DirectoryDeduper(str(tmp_path), radius=2, pattern="frame_*.png", workers=1)
+    deduper.scan()
+    _, leaders, distances, _ = deduper.cluster()
+    deduper.close()
+    assert distances.max() <= 2
+    # Single linkage would merge the whole chain into one cluster
+    assert len(set(leaders.tolist())) > 1
+
+
+def test_checkpoint_resumes(frames):
+    deduper = DirectoryDeduper(str(frames), workers=1)
+    assert deduper.scan() == 13
+    deduper.close()
+
+    write_frame(frames / "screenshot_9999.png", seed=7, mtime=time.time())
+    os.remove(frames / "screenshot_0000.png")
+    deduper = DirectoryDeduper(str(frames), workers=1)
+    # Only the new file is hashed again, the deleted one is forgotten
+    assert deduper.scan() == 1
+    assert deduper.apply()["files"] == 12
+    deduper.close()
+
+    # Another algorithm invalidates the stored hashes
+    deduper = DirectoryDeduper(str(frames), algorithm="dhash", workers=1)
+    assert deduper.scan() == 13
+    deduper.close()
+
+
+def test_command_line(frames, capsys):
+    dedupe.main([str(frames), "--dry-run", "--workers", "1"])
+    assert "would remove 9 duplicates" in capsys.readouterr().out
+    with pytest.raises(ValueError):
+        DirectoryDeduper(str(frames), keep="smallest")
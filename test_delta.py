@@ -0,0 +1,119 @@
+"""
+Tests for keyframe + delta storage
+"""
+import time
+
+import numpy as np
+import pytest
+
+from autoshot.archive import ArchiveReader, export_frames
+from autoshot.delta import DeltaEncoder, apply_delta
+from autoshot.encoder import ImageEncoder
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.image_processor import ImageProcessor
+from autoshot.main import AutoShot
+from autoshot.multi_capture import MultiCapture
+from autoshot.similarity_detector import hash_to_int
+
+
+def session(count, scroll_rate=0.2, seed=3):
+    source = SyntheticFrameSource(320, 200, change_rate=1.0, seed=seed, scroll_rate=scroll_rate)
+    return [source.grab() for _ in range(count)]
+
+
+def test_delta_round_trip():
+    encoder = DeltaEncoder(ImageEncoder(), keyframe_interval=10)
+    frames = session(6, scroll_rate=0.0)
+    previous = None
+    for frame in frames:
+        data, is_delta = encoder.encode(frame)
+        if is_delta:
+            assert len(data) < len(ImageEncoder().encode(frame))
+            previous = apply_delta(previous, data)
+        else:
+            previous = frame
+        assert np.array_equal(np.asarray(previous), np.asarray(frame))
+    assert (encoder.keyframes, encoder.deltas) == (1, 5)
+
+
+def test_keyframe_interval_and_scroll_fallback():
+    encoder = DeltaEncoder(ImageEncoder(), keyframe_interval=3)
+    kinds = [encoder.encode(frame)[1] for frame in session(7, scroll_rate=0.0)]
+    assert kinds == [False, True, True, False, True, True, False]
+
+    # Scrolling changes every tile, so a delta would not be smaller
+    encoder = DeltaEncoder(ImageEncoder(), keyframe_interval=10)
+    assert [encoder.encode(frame)[1] for frame in session(4, scroll_rate=1.0)] == [False] * 4
+
+
+def test_delta_needs_archive_storage(tmp_path):
+    with pytest.raises(ValueError):
+        ImageProcessor(str(tmp_path), keyframe_interval=5)
+
+
+def test_archive_reconstructs_exactly(tmp_path):
+    frames = session(25)
+    processor = ImageProcessor(str(tmp_path), storage="archive", segment_size=60_000, keyframe_interval=8)
+    for frame in frames:
+        processor.save_frame(frame)
+    processor.flush()
+
+    reader = ArchiveReader(str(tmp_path))
+    stored = list(reader.frames())
+    assert any(frame.delta for frame in stored)
+    # Each segment starts with a keyframe
+    for _, index in reader.segment_indexes():
+        assert not index[0]["flags"] & 2
+    # Sequential streaming
+    for original, frame in zip(frames, stored):
+        assert np.array_equal(np.asarray(frame.image()), np.asarray(original))
+    # Random access, backwards
+    for position in (21, 13, 2, 17):
+        frame = reader.get(stored[position].timestamp)
+        assert np.array_equal(np.asarray(frame.image()), np.asarray(frames[position]))
+
+    assert export_frames(reader, str(tmp_path / "png")) == 25
+    reader.close()
+
+
+def test_capture_with_deltas(tmp_path):
+    source = SyntheticFrameSource(200, 120, change_rate=0.6, seed=8, scroll_rate=0.0)
+    autoshot = AutoShot("synthetic", 200, 120, frame_source=source, output_dir=str(tmp_path),
+                        storage="archive", keyframe_interval=5)
+    for _ in range(20):
+        autoshot.single_capture_cycle()
+    autoshot.flush()
+    reader = ArchiveReader(str(tmp_path))
+    assert len(reader) == autoshot.stats()["frames_saved"]
+    assert any(frame.delta for frame in reader.frames())
+    reader.close()
+
+
+def test_shared_encode_workers_archive_in_capture_order(tmp_path):
+    source = SyntheticFrameSource(200, 120, change_rate=1.0, seed=8, scroll_rate=0.0)
+    autoshot = AutoShot("synthetic", 200, 120, interval=0.005, frame_source=source, output_dir=str(tmp_path),
+                        storage="archive", keyframe_interval=5)
+    stream = autoshot.streams[0]
+    accept, save_frame, decided = stream.accept, stream.image_processor.save_frame, []
+
+    def record_accept(phash):
+        decided.append(hash_to_int(phash))
+        accept(phash)
+
+    def slow_first_save(image, hash_value=None):
+        # The first frame reaches the archive late, after the other workers picked up the next ones
+        if hash_value == decided[0]:
+            time.sleep(0.1)
+        return save_frame(image, hash_value)
+
+    stream.accept, stream.image_processor.save_frame = record_accept, slow_first_save
+    manager = MultiCapture([autoshot], encode_workers=4)
+    manager.start()
+    time.sleep(0.3)
+    manager.stop()
+    reader = ArchiveReader(str(tmp_path))
+    stored = list(reader.frames())
+    assert len(stored) == len(decided) > 10
+    assert any(frame.delta for frame in stored)
+    assert [frame.hash for frame in stored] == decided
+    reader.close()
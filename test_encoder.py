@@ -0,0 +1,70 @@
+"""
+Tests for the frame encoders and atomic saving
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot.encoder import ENCODER_FORMATS, ImageEncoder
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.image_processor import ImageProcessor
+from autoshot.main import AutoShot
+from autoshot.similarity_detector import SimilarityDetector
+
+
+@pytest.mark.parametrize("format", list(ENCODER_FORMATS))
+def test_formats_are_lossless(tmp_path, format):
+    frame = SyntheticFrameSource(240, 120, seed=1).grab()
+    processor = ImageProcessor(str(tmp_path), ImageEncoder(format))
+    path = processor.save_image(frame, processor.create_unique_filename())
+    assert path.endswith(ENCODER_FORMATS[format][1])
+    with Image.open(path) as saved:
+        assert np.array_equal(np.asarray(saved.convert("RGB")), np.asarray(frame))
+
+
+def test_png_settings_are_applied():
+    frame = SyntheticFrameSource(240, 120, seed=1).grab()
+    stored = ImageEncoder("png", compress_level=0).encode(frame)
+    compressed = ImageEncoder("png", compress_level=9).encode(frame)
+    assert len(stored) > len(frame.tobytes()) > len(compressed)
+
+
+def test_bad_settings_are_rejected():
+    with pytest.raises(ValueError):
+        ImageEncoder("jpeg")
+    with pytest.raises(ValueError):
+        ImageEncoder(compress_level=10)
+
+
+def test_failed_write_leaves_no_partial_file(tmp_path):
+    processor = ImageProcessor(str(tmp_path))
+    processor.save_encoded(b"old", "frame.png")
+    # A directory at the target path makes the rename fail
+    (tmp_path / "blocked.png").mkdir()
+    with pytest.raises(OSError):
+        processor.save_encoded(b"new", "blocked.png")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["blocked.png", "frame.png"]
+    assert (tmp_path / "frame.png").read_bytes() == b"old"
+
+
+def test_index_follows_the_format(tmp_path):
+    source = SyntheticFrameSource(160, 100, change_rate=1.0, seed=2)
+    autoshot = AutoShot("synthetic", 160, 100, frame_source=source, output_dir=str(tmp_path),
+                        encoder=ImageEncoder("qoi"))
+    for _ in range(3):
+        autoshot.single_capture_cycle()
+    assert len(list(tmp_path.glob("*.qoi"))) == 3
+    assert len(autoshot.image_processor.index) == 3
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_scans_without_index_follow_the_format(tmp_path):
+    frame = SyntheticFrameSource(160, 100, seed=4).grab()
+    (tmp_path / "screenshot_1.webp").write_bytes(ImageEncoder("webp").encode(frame))
+    detector = SimilarityDetector()
+    assert detector.load_last_hash(str(tmp_path)) is None
+    assert detector.load_last_hash(str(tmp_path), pattern="*.webp") == detector.calculate_hash(frame)
+    reference = tmp_path / "reference.png"
+    frame.save(reference)
+    similar = detector.find_similar_images(str(reference), str(tmp_path), pattern="*.webp")
+    assert similar == [str(tmp_path / "screenshot_1.webp")]
@@ -0,0 +1,115 @@
+"""
+Tests for the persistent frame index
+"""
+import os
+import sqlite3
+
+from PIL import Image
+
+from autoshot.frame_index import FrameIndex
+from autoshot.image_processor import ImageProcessor
+
+
+class OldSqliteConnection:
+    """Connection that rejects RETURNING, like SQLite before 3.35"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, sql, *args):
+        if "RETURNING" in sql.upper():
+            raise sqlite3.OperationalError('near "RETURNING": syntax error')
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+
+def save_frame(directory, name, shade, mtime):
+    path = directory / name
+    Image.new("L", (32, 16), shade).save(path)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_rebuilds_from_directory_and_finds_latest(tmp_path):
+    save_frame(tmp_path, "screenshot_1.png", 10, 1000)
+    newest = save_frame(tmp_path, "screenshot_2.png", 200, 2000)
+
+    index = FrameIndex(str(tmp_path), hash_func=lambda image: image.getpixel((0, 0)))
+    assert len(index) == 2
+    path, timestamp, size, hash_value = index.latest()
+    assert path == str(newest)
+    assert timestamp == 2000
+    assert size == newest.stat().st_size
+    assert hash_value == 200
+    assert index.latest(exclude=str(newest))[3] == 10
+    index.close()
+
+
+def test_resyncs_when_directory_changes_behind_its_back(tmp_path):
+    save_frame(tmp_path, "screenshot_1.png", 10, 1000)
+    FrameIndex(str(tmp_path)).close()
+
+    os.remove(tmp_path / "screenshot_1.png")
+    save_frame(tmp_path, "screenshot_3.png", 30, 3000)
+
+    index = FrameIndex(str(tmp_path))
+    assert [entry[0] for entry in index.entries()] == [str(tmp_path / "screenshot_3.png")]
+    index.close()
+
+
+def test_own_writes_keep_index_fresh(tmp_path):
+    processor = ImageProcessor(str(tmp_path))
+    index = processor.open_index()
+    path = processor.save_image(Image.new("L", (8, 8)), "screenshot_5.png", hash_value=(1 << 64) - 1)
+    assert not index.is_stale()
+    assert index.latest()[3] == (1 << 64) - 1
+
+    processor.delete_image(path)
+    assert not index.is_stale()
+    assert index.latest() is None
+    index.close()
+
+
+def test_find_near_uses_hamming_distance(tmp_path):
+    index = FrameIndex(str(tmp_path))
+    base = 0x0123456789ABCDEF
+    index.add("a.png", 1, base, 1.0)
+    index.add("b.png", 1, base ^ 0b111, 2.0)
+    index.add("c.png", 1, base ^ 0xFFFF_FFFF, 3.0)
+
+    assert [(e[0], d) for e, d in index.find_near(base, 0)] == [("a.png", 0)]
+    assert [(e[0], d) for e, d in index.find_near(base, 3)] == [("a.png", 0), ("b.png", 3)]
+    assert len(index.find_near(base, 32)) == 3
+    index.close()
+
+
+def test_works_without_returning(tmp_path, monkeypatch):
+    connect = FrameIndex._connect
+
+    def old_connect(self):
+        connect(self)
+        self._conn = OldSqliteConnection(self._conn)
+
+    monkeypatch.setattr(FrameIndex, "_connect", old_connect)
+    save_frame(tmp_path, "screenshot_1.png", 10, 1000)
+    FrameIndex(str(tmp_path)).close()
+    os.remove(tmp_path / "screenshot_1.png")
+    kept = save_frame(tmp_path, "screenshot_2.png", 20, 2000)
+
+    # The stale entry is dropped by sync(), a re-added path replaces its entry
+    index = FrameIndex(str(tmp_path))
+    assert (index.frame_count, index.total_bytes) == (1, kept.stat().st_size)
+    index.add(str(kept), 100, 7, 2000.0)
+    index.add(str(kept), 40, 7, 2000.0)
+    assert (index.frame_count, index.total_bytes) == (1, 40)
+    index.remove(str(kept))
+    assert (index.frame_count, index.total_bytes) == (0, 0)
+    index.close()
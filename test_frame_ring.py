@@ -0,0 +1,153 @@
+"""
+Tests for the shared-memory frame ring and process pool
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot import frame_ring, metrics
+from autoshot.encoder import ImageEncoder
+from autoshot.frame_ring import FrameRing, SharedFramePool, frame_bytes, frame_features, hash_slot
+from autoshot.frame_source import FrameSource, SyntheticFrameSource
+from autoshot.main import AutoShot
+from autoshot.similarity_detector import Verifier
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    level = metrics.get_verbosity()
+    metrics.set_verbosity(metrics.QUIET)
+    yield
+    metrics.set_verbosity(level)
+
+
+class ListFrameSource(FrameSource):
+    """Replays a list of frames once"""
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def grab(self):
+        return self.frames.pop(0) if self.frames else None
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(2, frame_bytes(Image.new("RGBA", (64, 48))))
+    yield ring
+    ring.close()
+
+
+def test_ring_round_trip_and_release(ring):
+    frame = SyntheticFrameSource(64, 48, seed=3).grab()
+    small = Image.new("L", (10, 10), 77)
+    first, second = ring.put(frame), ring.put(small)
+    assert {first, second} == {0, 1} and ring.free == 0
+    assert ring.put(frame, block=False) is None
+    assert ring.image(first).tobytes() == frame.tobytes()
+    assert ring.image(second).tobytes() == small.tobytes()
+    ring.release(first)
+    assert ring.put(small, block=False) == first
+    assert not ring.fits(Image.new("RGBA", (65, 48))) and not ring.fits(Image.new("P", (4, 4)))
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_slot_features_match_in_memory(ring, mode):
+    frame = SyntheticFrameSource(64, 48, seed=5).grab().convert(mode)
+    verifier = Verifier("fine")
+    slot = ring.put(frame)
+    shared = hash_slot(*ring.location(slot), "phash", True, verifier)
+    local = frame_features(frame, "phash", True, verifier)
+    assert shared[:2] == local[:2]
+    assert np.array_equal(shared[2], local[2])
+
+
+def test_workers_detach_replaced_rings():
+    frame = SyntheticFrameSource(64, 48, seed=5).grab()
+    old, new = FrameRing(1, frame_bytes(frame)), FrameRing(1, 2 * frame_bytes(frame))
+    try:
+        hash_slot(*old.location(old.put(frame)), "phash", False, None)
+        stale = frame_ring._segments[old.name]
+        hash_slot(*new.location(new.put(frame)), "phash", False, None)
+        assert list(frame_ring._segments) == [new.name]
+        assert stale.buf is None
+    finally:
+        old.close()
+        new.close()
+
+
+def test_pool_encodes_through_the_ring_and_falls_back():
+    encoder = ImageEncoder()
+    frame = SyntheticFrameSource(80, 60, seed=1).grab()
+    gray_alpha = frame.convert("LA")
+    pool = SharedFramePool(workers=1, slots=2)
+    pool.start()
+    try:
+        assert pool.encode(frame, encoder).result() == encoder.encode(frame)
+        assert pool.encode(gray_alpha, encoder).result() == encoder.encode(gray_alpha)
+        stats = pool.stats()
+        assert (stats["frames_shared"], stats["frames_pickled"]) == (1, 1)
+        assert stats["slots_free"] == 2 and stats["slot_bytes"] == frame_bytes(frame)
+    finally:
+        pool.shutdown()
+    assert pool.stats()["slot_bytes"] == frame_bytes(frame)
+
+
+def test_waiting_put_does_not_hold_up_the_pool():
+    frame = SyntheticFrameSource(64, 48, seed=2).grab()
+    pool = SharedFramePool(workers=1, slots=1)
+    pool.reserve(frame_bytes(frame))
+    first = pool.put(frame)
+    waiter = threading.Thread(target=lambda: pool.put(frame))
+    waiter.start()
+    time.sleep(0.05)
+    results = []
+
+    def other_thread():
+        pool.reserve(4 * frame_bytes(frame))
+        results.append((pool.fits(frame), pool.put(frame, block=False)))
+
+    # Other threads go on while the waiter blocks, and the ring isn't replaced under it
+    other = threading.Thread(target=other_thread)
+    other.start()
+    other.join(0.5)
+    done = not other.is_alive()
+    pool.ring.release(first)
+    other.join(1)
+    assert done and results == [(True, None)]
+    assert pool.slot_bytes == frame_bytes(frame)
+    waiter.join(1)
+    assert not waiter.is_alive() and pool.ring.free == 0
+    pool.shutdown()
+
+
+def test_processes_save_the_same_frames_as_serial(tmp_path):
+    source = SyntheticFrameSource(160, 120, change_rate=0.5, seed=9)
+    frames = [source.grab() for _ in range(40)]
+    serial = AutoShot("synthetic", 160, 120, frame_source=ListFrameSource(frames),
+                      output_dir=str(tmp_path / "serial"))
+    for _ in frames:
+        serial.single_capture_cycle()
+
+    shared = AutoShot("synthetic", 160, 120, interval=0, frame_source=ListFrameSource(frames),
+                      output_dir=str(tmp_path / "shared"), pipelined=True, overload_policy="block",
+                      encode_processes=True)
+    shared.start_capture_loop()
+    try:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            stats = shared.stats()
+            if stats["frames_saved"] + stats["frames_skipped"] >= len(frames):
+                break
+            time.sleep(0.01)
+    finally:
+        shared.stop_capture_loop()
+
+    stats = shared.stats()
+    assert stats["frames_saved"] == serial.stats()["frames_saved"]
+    assert stats["pipeline"]["shared_memory"]["frames_pickled"] == 0
+    saved = sorted(path.read_bytes() for path in (tmp_path / "shared").glob("*.png"))
+    assert saved == sorted(path.read_bytes() for path in (tmp_path / "serial").glob("*.png"))
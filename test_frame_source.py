@@ -0,0 +1,54 @@
+"""
+Tests for the replay and synthetic frame sources
+"""
+import pytest
+from PIL import Image
+
+from autoshot.frame_source import FrameSource, ReplayFrameSource, SyntheticFrameSource
+from autoshot.main import AutoShot
+
+
+def test_synthetic_change_rate():
+    static = SyntheticFrameSource(120, 90, change_rate=0.0)
+    first = static.grab()
+    assert first.size == (120, 90)
+    assert static.grab().tobytes() == first.tobytes()
+
+    scrolling = SyntheticFrameSource(120, 90, change_rate=1.0)
+    assert scrolling.grab().tobytes() != scrolling.grab().tobytes()
+    assert scrolling.frames_changed == 1
+
+
+def test_replay_plays_directory_in_order(tmp_path):
+    for i, shade in enumerate((10, 20, 30)):
+        Image.new("L", (4, 4), shade).save(tmp_path / f"frame_{i}.png")
+
+    source = ReplayFrameSource(str(tmp_path))
+    assert source.open()
+    assert [source.grab().getpixel((0, 0)) for _ in range(3)] == [10, 20, 30]
+    assert source.grab() is None
+
+    looping = ReplayFrameSource(str(tmp_path), loop=True)
+    assert [looping.grab().getpixel((0, 0)) for _ in range(4)] == [10, 20, 30, 10]
+
+
+def test_full_pipeline_runs_on_synthetic_frames(tmp_path):
+    source = SyntheticFrameSource(200, 160, change_rate=0.5, seed=3)
+    autoshot = AutoShot("synthetic", 200, 160, interval=0, frame_source=source,
+                        output_dir=str(tmp_path))
+    assert autoshot.setup_window()
+    for _ in range(20):
+        assert autoshot.single_capture_cycle()
+
+    stats = autoshot.stats()
+    assert stats["frames_captured"] == 20
+    assert stats["frames_saved"] == source.frames_changed + 1
+    assert len(list(tmp_path.glob("*.png"))) == stats["frames_saved"]
+
+
+def test_sources_must_implement_grab():
+    class NoGrab(FrameSource):
+        pass
+
+    with pytest.raises(TypeError):
+        NoGrab()
@@ -0,0 +1,57 @@
+"""
+Tests for history-wide hash search
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+from autoshot.hash_search import HashSearchIndex, popcount64
+from autoshot.similarity_detector import SimilarityDetector
+
+
+def test_popcount64():
+    values = np.array([0, 1, 0xFF, (1 << 64) - 1], dtype=np.uint64)
+    assert popcount64(values).tolist() == [0, 1, 8, 64]
+
+
+def test_query_matches_linear_scan():
+    rng = np.random.default_rng(1)
+    hashes = rng.integers(0, np.iinfo(np.uint64).max, size=20000, dtype=np.uint64, endpoint=True)
+    # Plant near-duplicates of the first hash, some in the unbuilt tail
+    base = int(hashes[0])
+    index = HashSearchIndex()
+    index.extend(hashes)
+    index.build()
+    index.extend(np.array([base ^ 0b1, base ^ (0b11 << 40), base ^ 0xFF], dtype=np.uint64))
+
+    for radius in (0, 2, 5, 9, 12):
+        for query in [base, int(hashes[123]), base ^ (1 << 63)]:
+            fast = index.query(query, radius)
+            slow = index.query_linear(query, radius)
+            assert sorted(fast[0].tolist()) == sorted(slow[0].tolist())
+
+
+def test_remove_hides_entries():
+    index = HashSearchIndex()
+    position = index.add(42, label=7)
+    assert index.nearest(42) == (position, 0)
+    assert index.labels[position] == 7
+    index.remove([position])
+    assert index.nearest(42) is None
+    assert len(index) == 0
+
+
+def test_detector_catches_revisited_frames():
+    def frame(width):
+        image = Image.new("L", (64, 64), 255)
+        ImageDraw.Draw(image).rectangle((0, 0, width, 63), fill=0)
+        return image
+
+    detector = SimilarityDetector()
+    for width in (10, 40):
+        is_duplicate, phash = detector.is_duplicate(frame(width))
+        assert not is_duplicate
+        detector.accept(phash)
+
+    # Flipping back to the first screen is not the last frame, but is in history
+    assert detector.is_duplicate(frame(10))[0]
+    assert detector.history_matches == 1
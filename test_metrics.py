@@ -0,0 +1,96 @@
+"""
+Tests for metrics, exporters and verbosity
+"""
+import json
+import urllib.request
+
+import pytest
+
+from autoshot import metrics
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot
+from autoshot.metrics import Histogram, MetricsDumper, MetricsRegistry, MetricsServer
+
+
+@pytest.fixture
+def verbosity():
+    level = metrics.get_verbosity()
+    yield metrics.set_verbosity
+    metrics.set_verbosity(level)
+
+
+def test_histogram_percentiles():
+    histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+    for seconds in [0.0005] * 90 + [0.005] * 9 + [0.05]:
+        histogram.record(seconds)
+    stats = histogram.stats()
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == pytest.approx(1)
+    assert stats["p95_ms"] == pytest.approx(10)
+    # Capped at the largest recorded value
+    assert stats["p99_ms"] == pytest.approx(10)
+    assert histogram.percentile(1.0) == pytest.approx(0.05)
+    assert stats["max_ms"] == pytest.approx(50)
+
+
+def test_registry_stats_and_prometheus():
+    registry = MetricsRegistry()
+    saved = registry.counter("frames_saved_total", "Frames saved", {"region": "top"})
+    saved.inc(3)
+    assert registry.counter("frames_saved_total", "Frames saved", {"region": "top"}) is saved
+    registry.gauge("queue_depth", "Queue depth", func=lambda: 7)
+    registry.histogram("stage_seconds", "Stage latency", {"stage": "hash"}).record(0.002)
+    with pytest.raises(ValueError):
+        registry.gauge("frames_saved_total", "Not a gauge")
+
+    stats = registry.stats()
+    assert stats["counters"] == {'frames_saved_total{region="top"}': 3}
+    assert stats["gauges"] == {"queue_depth": 7}
+    assert stats["histograms"]['stage_seconds{stage="hash"}']["count"] == 1
+
+    text = registry.prometheus()
+    assert "# TYPE frames_saved_total counter" in text
+    assert 'frames_saved_total{region="top"} 3' in text
+    assert 'stage_seconds_bucket{stage="hash",le="0.0025"} 1' in text
+    assert 'stage_seconds_bucket{stage="hash",le="+Inf"} 1' in text
+    assert 'stage_seconds_count{stage="hash"} 1' in text
+
+
+def test_autoshot_metrics(tmp_path, verbosity, capsys):
+    verbosity(metrics.QUIET)
+    autoshot = AutoShot("synthetic", 200, 160, frame_source=SyntheticFrameSource(200, 160, change_rate=0.5, seed=1),
+                        output_dir=str(tmp_path))
+    for _ in range(10):
+        autoshot.single_capture_cycle()
+    # The hot path stays quiet
+    assert capsys.readouterr().out == ""
+
+    stats = autoshot.stats()
+    counters = autoshot.metrics.stats()["counters"]
+    assert counters["autoshot_frames_captured_total"] == 10
+    assert counters['autoshot_frames_saved_total{region="top_half"}'] == stats["frames_saved"]
+    assert counters['autoshot_frames_skipped_total{region="top_half"}'] == stats["frames_skipped"]
+    assert autoshot.metrics.stats()["gauges"]['autoshot_index_frames{region="top_half"}'] == stats["frames_saved"]
+    assert stats["latency"]["cycle"]["count"] == 10
+    assert stats["regions"]["top_half"]["latency"]["check"]["count"] == 10
+
+
+def test_dumper_and_server(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("events_total", "Events").inc()
+
+    path = tmp_path / "metrics.jsonl"
+    dumper = MetricsDumper(registry, str(path), interval=60)
+    dumper.start()
+    dumper.stop()
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["counters"] == {"events_total": 1}
+
+    server = MetricsServer(registry, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert "events_total 1" in response.read().decode()
+    finally:
+        server.stop()
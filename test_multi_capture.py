@@ -0,0 +1,116 @@
+"""
+Tests for capturing several windows from one process
+"""
+import json
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from autoshot.frame_ring import SharedFramePool
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot, build_parser, load_targets
+from autoshot.multi_capture import MultiCapture
+
+
+def make_target(tmp_path, title, interval, change_rate, seed):
+    source = SyntheticFrameSource(160, 100, change_rate=change_rate, seed=seed)
+    return AutoShot(title, 160, 100, interval=interval, frame_source=source,
+                    output_dir=str(tmp_path / title))
+
+
+def test_targets_keep_their_own_rate_and_dedupe_state(tmp_path):
+    fast = make_target(tmp_path, "fast", 0.02, 0.5, 1)
+    slow = make_target(tmp_path, "slow", 0.1, 1.0, 2)
+    manager = MultiCapture([fast, slow], capture_workers=2, encode_workers=2)
+    manager.start()
+    time.sleep(0.45)
+    manager.stop()
+
+    stats = manager.stats()
+    fast_stats, slow_stats = stats["targets"]["fast"], stats["targets"]["slow"]
+    assert fast_stats["frames_captured"] > 2 * slow_stats["frames_captured"] >= 6
+    for target, target_stats in ((fast, fast_stats), (slow, slow_stats)):
+        assert target_stats["frames_saved"] == target.frame_source.frames_changed + 1
+        assert target_stats["frames_saved"] + target_stats["frames_skipped"] == target_stats["frames_captured"]
+        assert len(list((tmp_path / target.window_title).glob("*.png"))) == target_stats["frames_saved"]
+    assert stats["frames_captured"] == fast_stats["frames_captured"] + slow_stats["frames_captured"]
+    assert stats["encode_queue_depth"] == 0
+
+
+def test_duplicate_titles_are_rejected(tmp_path):
+    manager = MultiCapture([make_target(tmp_path, "a", 1, 0, 0)])
+    with pytest.raises(ValueError):
+        manager.add_target(make_target(tmp_path, "a", 1, 0, 0))
+
+
+def test_stop_does_not_wait_for_long_intervals(tmp_path):
+    manager = MultiCapture([make_target(tmp_path, "a", 10, 0, 0)])
+    manager.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    manager.stop()
+    assert time.monotonic() - start < 1
+    assert manager.stats()["frames_captured"] == 1
+
+
+def test_restart_keeps_saving(tmp_path):
+    target = make_target(tmp_path, "a", 0.01, 1.0, 4)
+    manager = MultiCapture([target], capture_workers=1, encode_workers=1)
+    for _ in range(2):
+        manager.start()
+        time.sleep(0.15)
+        manager.stop()
+        saved = manager.stats()["frames_saved"]
+        assert saved == manager.stats()["frames_captured"] == len(list((tmp_path / "a").glob("*.png")))
+    assert saved > 2
+    assert 'autoshot_queue_depth{queue="encode"} 0' in manager.metrics.prometheus()
+
+
+def test_encode_errors_keep_the_workers_running(tmp_path, monkeypatch):
+    target = make_target(tmp_path, "a", 0.01, 1.0, 4)
+    manager = MultiCapture([target], capture_workers=1, encode_workers=1, encode_queue_size=2,
+                           encode_processes=True)
+
+    def broken_encode(pool, image, encoder):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    stream = target.streams[0]
+    accept, accepted = stream.accept, []
+
+    def record_accept(phash):
+        accepted.append(phash)
+        accept(phash)
+
+    stream.accept = record_accept
+    monkeypatch.setattr(SharedFramePool, "encode", broken_encode)
+    manager.start()
+    time.sleep(0.3)
+    manager.stop()
+    stats = manager.stats()
+    # Capturing went on past the first queueful, and no failed frame stays in the dedupe state
+    assert stats["frames_captured"] > 10
+    assert stats["frames_saved"] == 0 == len(list((tmp_path / "a").glob("*.png")))
+    assert all(stream.similarity_detector.find_in_history(phash) is None for phash in accepted)
+    assert stream.similarity_detector.last_hash is None
+
+
+def test_load_targets(tmp_path):
+    config = [{"title": "one", "width": 120, "height": 80, "interval": 0.5},
+              {"title": "two", "width": 200, "height": 100, "roi": ["badge=0,0,40,20"],
+               "output_dir": str(tmp_path / "custom")}]
+    path = tmp_path / "targets.json"
+    path.write_text(json.dumps(config))
+    args = build_parser().parse_args(["--targets", str(path), "--source", "synthetic",
+                                      "--output-dir", str(tmp_path / "out"), "--compress-level", "1"])
+
+    one, two = load_targets(str(path), args)
+    assert (one.window_title, one.interval, two.interval) == ("one", 0.5, 2.0)
+    assert one.image_processor.output_dir == tmp_path / "out" / "one"
+    assert two.image_processor.output_dir == tmp_path / "custom"
+    assert [region.name for region in two.regions] == ["badge"]
+    assert two.grab_frame().size == (40, 20)
+    assert one.image_processor.encoder.compress_level == 1
@@ -0,0 +1,131 @@
+"""
+Tests for the staged capture pipeline
+"""
+import threading
+import time
+
+import pytest
+
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot
+from autoshot.pipeline import BoundedQueue, QueueClosed
+from autoshot.similarity_detector import hash_to_int, int_to_hash
+
+
+def test_drop_oldest_keeps_newest_items():
+    queue = BoundedQueue(2, "drop-oldest")
+    for item in range(4):
+        assert queue.put(item)
+    assert queue.dropped == 2
+    assert [queue.get(), queue.get()] == [2, 3]
+
+
+def test_drop_newest_rejects_new_items():
+    queue = BoundedQueue(2, "drop-newest")
+    assert [queue.put(item) for item in range(3)] == [True, True, False]
+    assert [queue.get(), queue.get()] == [0, 1]
+
+
+def test_block_waits_for_room_and_close_drains():
+    queue = BoundedQueue(1, "block")
+    queue.put("a")
+    thread = threading.Thread(target=queue.put, args=("b",))
+    thread.start()
+    time.sleep(0.05)
+    assert thread.is_alive()
+    assert queue.get() == "a"
+    thread.join(1)
+    queue.close()
+    assert queue.get() == "b"
+    with pytest.raises(QueueClosed):
+        queue.get()
+
+
+def test_pipelined_loop_saves_every_new_frame(tmp_path):
+    source = SyntheticFrameSource(200, 160, change_rate=0.5, seed=7)
+    autoshot = AutoShot("synthetic", 200, 160, interval=0.01, frame_source=source,
+                        output_dir=str(tmp_path), pipelined=True, overload_policy="block")
+    autoshot.start_capture_loop()
+    time.sleep(0.3)
+    autoshot.stop_capture_loop()
+
+    stats = autoshot.stats()
+    pipeline = stats["pipeline"]
+    assert stats["frames_captured"] > 5
+    assert stats["frames_saved"] + stats["frames_skipped"] == stats["frames_captured"]
+    assert stats["frames_saved"] == source.frames_changed + 1
+    assert len(list(tmp_path.glob("*.png"))) == stats["frames_saved"]
+    assert pipeline["capture_queue_depth"] == pipeline["encode_queue_depth"] == 0
+    assert pipeline["latency"]["encode"]["count"] == stats["frames_saved"]
+
+
+def test_pipelined_loop_restarts(tmp_path):
+    source = SyntheticFrameSource(120, 80, change_rate=1.0, seed=2)
+    autoshot = AutoShot("synthetic", 120, 80, interval=0.01, frame_source=source,
+                        output_dir=str(tmp_path), pipelined=True, overload_policy="block")
+    autoshot.start_capture_loop()
+    time.sleep(0.15)
+    autoshot.stop_capture_loop()
+    first = autoshot.stats()["frames_saved"]
+    assert first > 0
+
+    autoshot.start_capture_loop()
+    time.sleep(0.15)
+    autoshot.stop_capture_loop()
+    stats = autoshot.stats()
+    assert stats["frames_saved"] > first
+    assert stats["frames_saved"] == stats["frames_captured"] == len(list(tmp_path.glob("*.png")))
+    assert 'autoshot_queue_depth{queue="capture"} 0' in autoshot.metrics.prometheus()
+
+
+def test_failed_save_is_retried_by_the_next_frame(tmp_path):
+    # A static screen: only the first frame is new, and its save fails
+    source = SyntheticFrameSource(120, 80, change_rate=0.0, seed=2)
+    autoshot = AutoShot("synthetic", 120, 80, interval=0.01, frame_source=source,
+                        output_dir=str(tmp_path), pipelined=True, overload_policy="block")
+    processor = autoshot.streams[0].image_processor
+    save_frame, calls = processor.save_frame, []
+
+    def failing_first_save(image, hash_value=None):
+        calls.append(hash_value)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return save_frame(image, hash_value)
+
+    processor.save_frame = failing_first_save
+    autoshot.start_capture_loop()
+    time.sleep(0.2)
+    autoshot.stop_capture_loop()
+    assert len(calls) == 2 and calls[0] == calls[1]
+    assert autoshot.stats()["frames_saved"] == 1 == len(list(tmp_path.glob("*.png")))
+
+
+def test_frames_cut_off_by_stop_are_not_left_accepted(tmp_path):
+    source = SyntheticFrameSource(120, 80, change_rate=1.0, seed=2)
+    autoshot = AutoShot("synthetic", 120, 80, interval=0.01, frame_source=source, output_dir=str(tmp_path),
+                        pipelined=True, overload_policy="block", encode_workers=1)
+    autoshot.pipeline.encode_queue_size = 1
+    stream = autoshot.streams[0]
+    accept, save_frame, accepted, saved = stream.accept, stream.image_processor.save_frame, [], []
+
+    def record_accept(phash):
+        accepted.append(hash_to_int(phash))
+        accept(phash)
+
+    def slow_save(image, hash_value=None):
+        time.sleep(0.2)
+        saved.append(hash_value)
+        return save_frame(image, hash_value)
+
+    stream.accept, stream.image_processor.save_frame = record_accept, slow_save
+    autoshot.start_capture_loop()
+    time.sleep(0.1)
+    # The hash thread is still waiting for room in the encode queue when it is closed
+    autoshot.pipeline.stop(timeout=0.05)
+    autoshot.stop_capture_loop()
+    time.sleep(0.6)
+    unsaved = set(accepted) - set(saved)
+    assert unsaved
+    detector = stream.similarity_detector
+    assert all(detector.find_in_history(int_to_hash(hash_value)) is None for hash_value in unsaved)
+    assert detector.last_hash is None or hash_to_int(detector.last_hash) not in unsaved
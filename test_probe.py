@@ -0,0 +1,112 @@
+"""
+Tests for pixel-probe triggered capture
+"""
+import pytest
+
+from autoshot import metrics
+from autoshot.frame_source import FrameSource, SyntheticFrameSource, Win32FrameSource
+from autoshot.main import AutoShot, build_parser
+from autoshot.probe import ProbeTrigger, parse_probe
+from autoshot.roi import Region
+from test_window_session import FakeWindowManager
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    level = metrics.get_verbosity()
+    metrics.set_verbosity(metrics.QUIET)
+    yield
+    metrics.set_verbosity(level)
+
+
+class ProbedWindowManager(FakeWindowManager):
+    """Fake window whose probed pixels are set by the test"""
+
+    def __init__(self):
+        super().__init__()
+        self.screen = {}
+        self.reads = []
+
+    def read_screen_boxes(self, boxes):
+        self.reads.append(list(boxes))
+        return [self.screen.get(box, b"\0\0\0\0") for box in boxes]
+
+
+class Counter(FrameSource):
+    """Source without probe support"""
+
+    def __init__(self):
+        self.grabs = 0
+
+    def grab(self):
+        from PIL import Image
+        self.grabs += 1
+        return Image.new("RGB", (40, 40), (self.grabs % 256, 0, 0))
+
+
+def test_parse_probe():
+    assert repr(parse_probe("badge=10,20")) == repr(Region(10, 20, 11, 21, name="badge"))
+    assert repr(parse_probe("line=0,300,400,310")) == repr(Region(0, 300, 400, 310, name="line"))
+    assert parse_probe("line=0.0,0.9,1.0,1.0").fractional
+    with pytest.raises(ValueError):
+        parse_probe("badge=10")
+
+
+def test_trigger_fires_on_change_and_max_interval():
+    manager = ProbedWindowManager()
+    source = Win32FrameSource("Chat", window_manager=manager)
+    trigger = ProbeTrigger([parse_probe("a=5,5"), parse_probe("b=0,0,2,2")], max_interval=30)
+    # Client area starts at (108, 81): probes are read in one call, offset to the screen
+    assert trigger.check(source, now=0)
+    assert manager.reads == [[(113, 86, 114, 87), (108, 81, 110, 83)]]
+    assert not trigger.check(source, now=10)
+    manager.screen[(113, 86, 114, 87)] = b"\xff\0\0\0"
+    assert trigger.check(source, now=20)
+    assert not trigger.check(source, now=40)
+    assert trigger.check(source, now=50)
+    assert trigger.stats() == {"checks": 5, "changes": 2, "timeouts": 1, "fallbacks": 0, "skipped": 2,
+                               "ms": pytest.approx(trigger.timer.total * 1000)}
+
+
+def test_unprobeable_source_captures_every_tick():
+    trigger = ProbeTrigger([parse_probe("a=1,1")])
+    assert all(trigger.check(Counter()) for _ in range(3))
+    assert trigger.fallbacks == 3
+
+    manager = ProbedWindowManager()
+    manager.windows.clear()
+    assert trigger.check(Win32FrameSource("Chat", window_manager=manager))
+
+
+def test_probed_capture_loop_skips_unchanged_ticks(tmp_path):
+    source = SyntheticFrameSource(120, 80, change_rate=0.3, seed=5)
+    autoshot = AutoShot("synthetic", 120, 80, frame_source=source, output_dir=str(tmp_path),
+                        regions=[Region(0, 0, 120, 80)], probes=[parse_probe("all=0,0,120,80")],
+                        probe_max_interval=3600)
+    for _ in range(50):
+        if autoshot.should_capture():
+            autoshot.single_capture_cycle()
+    stats = autoshot.stats()
+    # A probe covering the whole frame captures exactly the changed frames
+    assert stats["frames_captured"] == source.frames_changed + 1
+    assert stats["probe"]["skipped"] == 50 - stats["frames_captured"]
+    assert stats["gate_unchanged"] == 0
+    assert "autoshot_probe_skipped_total" in autoshot.metrics.prometheus()
+
+
+def test_failed_capture_fires_next_tick(tmp_path):
+    source = SyntheticFrameSource(60, 40, change_rate=0.0, seed=1)
+    autoshot = AutoShot("synthetic", 60, 40, frame_source=source, output_dir=str(tmp_path),
+                        probes=[parse_probe("a=1,1")])
+    assert autoshot.should_capture()
+    source.grab_regions = lambda regions: None
+    assert autoshot.grab_regions() is None
+    assert autoshot.should_capture()
+    assert not autoshot.should_capture()
+
+
+def test_cli_options():
+    args = build_parser().parse_args(["--title", "Chat", "--width", "400", "--height", "300",
+                                      "--probe", "badge=380,10", "--probe-max-interval", "15"])
+    assert [repr(probe) for probe in args.probe] == [repr(Region(380, 10, 381, 11, name="badge"))]
+    assert args.probe_max_interval == 15
@@ -0,0 +1,150 @@
+"""
+Tests for retention policies and index-backed eviction
+"""
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from autoshot import metrics
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.image_processor import ImageProcessor
+from autoshot.main import AutoShot
+from autoshot.retention import RetentionManager, RetentionPolicy, parse_duration, parse_size, parse_thinning
+from autoshot.similarity_detector import SimilarityDetector
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    level = metrics.get_verbosity()
+    metrics.set_verbosity(metrics.QUIET)
+    yield
+    metrics.set_verbosity(level)
+
+
+def populate(directory, count, start, step=1.0):
+    processor = ImageProcessor(str(directory))
+    detector = SimilarityDetector()
+    processor.open_index(detector.hash_image)
+    for i in range(count):
+        image = Image.new("RGB", (16, 16), (i % 256, i // 256, 0))
+        path = processor.save_image(image, f"screenshot_{i:05d}.png", detector.hash_image(image))
+        timestamp = start + i * step
+        os.utime(path, (timestamp, timestamp))
+        processor.index.add(path, os.path.getsize(path), detector.hash_image(image), timestamp)
+    return processor, detector
+
+
+def test_parsers():
+    assert parse_size("20G") == 20 * 1024 ** 3
+    assert parse_size("1.5MB") == 1536 * 1024
+    assert parse_size("4096") == 4096
+    assert parse_duration("15m") == 900
+    assert parse_duration("7d") == 7 * 86400
+    assert parse_thinning("1h:10s,1d:5m") == [(3600, 10), (86400, 300)]
+    with pytest.raises(ValueError):
+        parse_size("lots")
+    with pytest.raises(ValueError):
+        parse_thinning("1h")
+
+
+def test_policy_spacing():
+    policy = RetentionPolicy(thinning=[(86400, 300), (3600, 10)])
+    assert policy.spacing(60) is None
+    assert policy.spacing(7200) == 10
+    assert policy.spacing(2 * 86400) == 300
+    assert not RetentionPolicy().enabled
+
+
+def test_max_frames_and_bytes(tmp_path):
+    processor, detector = populate(tmp_path, 20, time.time() - 100)
+    index = processor.index
+    manager = RetentionManager(processor, detector, RetentionPolicy(max_frames=15), batch_size=4)
+    # Each pass is bounded
+    assert manager.enforce() == 4
+    while manager.enforce():
+        pass
+    assert index.frame_count == 15 == len(list(tmp_path.glob("*.png")))
+    assert sorted(p.name for p in tmp_path.glob("*.png"))[0] == "screenshot_00005.png"
+
+    size = os.path.getsize(tmp_path / "screenshot_00019.png")
+    manager.policy = RetentionPolicy(max_bytes=size * 3)
+    while manager.enforce():
+        pass
+    assert index.total_bytes <= size * 3
+    assert index.total_bytes == sum(p.stat().st_size for p in tmp_path.glob("*.png"))
+    assert manager.stats()["frames_evicted"] == 20 - index.frame_count
+
+
+def test_max_age_keeps_newest(tmp_path):
+    processor, detector = populate(tmp_path, 10, time.time() - 1000, step=10)
+    manager = RetentionManager(processor, detector, RetentionPolicy(max_age=50))
+    manager.enforce(now=time.time())
+    # Everything is older than 50 seconds, but the newest frame stays
+    assert [p.name for p in tmp_path.glob("*.png")] == ["screenshot_00009.png"]
+
+
+def test_thinning(tmp_path):
+    now = time.time()
+    # One frame per second over the last 20 minutes
+    processor, detector = populate(tmp_path, 1200, now - 1200)
+    manager = RetentionManager(processor, detector, RetentionPolicy(thinning=[(300, 10), (600, 60)]),
+                               batch_size=100)
+    # A pass over kept frames removes nothing, so run enough passes for a full sweep
+    for _ in range(30):
+        manager.enforce(now=now)
+    timestamps = [entry[1] for entry in processor.index.entries()]
+    old = [t for t in timestamps if now - t >= 600]
+    middle = [t for t in timestamps if 300 <= now - t < 600]
+    recent = [t for t in timestamps if now - t < 300]
+    assert len(recent) == 299
+    assert 29 <= len(middle) <= 31
+    assert 9 <= len(old) <= 11
+    assert all(b - a >= 60 for a, b in zip(old, old[1:]))
+
+
+def test_evicted_screens_are_saved_again(tmp_path):
+    source = SyntheticFrameSource(120, 80, change_rate=1.0, seed=3)
+    frames = [source.grab() for _ in range(3)]
+
+    class Replay:
+        window_manager = None
+        images = iter(frames + frames)
+
+        def open(self):
+            return True
+
+        def grab_regions(self, regions):
+            return [next(self.images).crop((0, 0, 120, 40))]
+
+    autoshot = AutoShot("replay", 120, 80, frame_source=Replay(), output_dir=str(tmp_path),
+                        retention=RetentionPolicy(max_frames=1))
+    stream = autoshot.streams[0]
+    for _ in range(3):
+        autoshot.single_capture_cycle()
+    assert stream.retention.enforce() == 2
+    # The first two screens were evicted, so they count as new when they return
+    for _ in range(3):
+        autoshot.single_capture_cycle()
+    stats = autoshot.stats()
+    assert stats["frames_saved"] == 5
+    assert stats["frames_evicted"] == 2
+    assert stats["hashes_discarded"] == 2
+
+
+def test_retention_needs_file_storage(tmp_path):
+    processor = ImageProcessor(str(tmp_path), storage="archive")
+    with pytest.raises(ValueError):
+        RetentionManager(processor, SimilarityDetector(), RetentionPolicy(max_frames=1))
+
+
+def test_background_thread(tmp_path):
+    processor, detector = populate(tmp_path, 10, time.time() - 100)
+    manager = RetentionManager(processor, detector, RetentionPolicy(max_frames=2), interval=0.01, batch_size=3)
+    manager.start()
+    deadline = time.time() + 5
+    while processor.index.frame_count > 2 and time.time() < deadline:
+        time.sleep(0.01)
+    manager.stop()
+    assert processor.index.frame_count == 2
@@ -0,0 +1,56 @@
+"""
+Tests for region-of-interest capture
+"""
+import pytest
+
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.image_processor import ImageProcessor
+from autoshot.main import AutoShot
+from autoshot.roi import TOP_HALF, Region, parse_region, union_box
+
+
+def test_top_half_matches_crop_top_half(tmp_path):
+    frame = SyntheticFrameSource(201, 151).grab()
+    expected = ImageProcessor(str(tmp_path)).crop_top_half(frame)
+    assert frame.crop(TOP_HALF.resolve(*frame.size)).tobytes() == expected.tobytes()
+
+
+def test_parse_region():
+    fractional = parse_region("chat=0,0.25,1,0.75")
+    assert fractional.fractional and fractional.name == "chat"
+    assert fractional.resolve(800, 400) == (0, 100, 800, 300)
+
+    pixels = parse_region("badge=760,10,790,30")
+    assert not pixels.fractional
+    assert pixels.resolve(780, 400) == (760, 10, 780, 30)
+
+    with pytest.raises(ValueError):
+        parse_region("badge=1,2,3")
+
+
+def test_union_box():
+    assert union_box([(0, 10, 5, 20), (3, 2, 9, 12)]) == (0, 2, 9, 20)
+
+
+def test_regions_have_separate_streams(tmp_path):
+    regions = [Region(0, 0, 200, 40, name="header"), Region(0.0, 0.5, 1.0, 1.0, name="chat", fractional=True)]
+    source = SyntheticFrameSource(200, 160, change_rate=1.0)
+    autoshot = AutoShot("synthetic", 200, 160, frame_source=source,
+                        output_dir=str(tmp_path), regions=regions)
+
+    images = autoshot.grab_regions()
+    assert [image.size for image in images] == [(200, 40), (200, 80)]
+
+    for _ in range(3):
+        autoshot.single_capture_cycle()
+    stats = autoshot.stats()
+    assert set(stats["regions"]) == {"header", "chat"}
+    assert stats["frames_saved"] == sum(s["frames_saved"] for s in stats["regions"].values())
+    assert len(list((tmp_path / "chat").glob("*.png"))) == stats["regions"]["chat"]["frames_saved"]
+    assert len(list((tmp_path / "header").glob("*.png"))) == stats["regions"]["header"]["frames_saved"]
+
+
+def test_region_names_must_be_unique(tmp_path):
+    with pytest.raises(ValueError):
+        AutoShot("synthetic", 200, 160, frame_source=SyntheticFrameSource(200, 160),
+                 output_dir=str(tmp_path), regions=[TOP_HALF, TOP_HALF])
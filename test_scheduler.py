@@ -0,0 +1,152 @@
+"""
+Tests for the fixed-rate capture scheduler
+"""
+import threading
+import time
+
+import pytest
+
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.main import AutoShot, build_parser, main
+from autoshot.scheduler import AdaptiveScheduler, FixedRateScheduler
+
+
+def test_ticks_stay_on_grid_despite_work():
+    scheduler = FixedRateScheduler(0.02)
+    start = time.monotonic()
+    for _ in range(10):
+        assert scheduler.wait()
+        # Work shorter than the interval must not stretch the period
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    # 10 ticks at t = 0, 0.02 .. 0.18, plus the last cycle's work
+    assert 0.18 <= elapsed < 0.26
+    assert scheduler.missed_deadlines == 0
+
+
+def test_skip_drops_missed_ticks():
+    scheduler = FixedRateScheduler(0.05, overrun_policy="skip")
+    assert scheduler.wait()
+    time.sleep(0.175)
+    before = time.monotonic()
+    assert scheduler.wait()
+    # Ticks at 0.05, 0.10 and 0.15 are gone; the next one is at 0.20
+    assert time.monotonic() - before > 0.01
+    stats = scheduler.stats()
+    assert stats["missed_deadlines"] == 1
+    assert stats["skipped_ticks"] == 3
+    assert stats["ticks"] == 2
+
+
+def test_coalesce_fires_once_immediately():
+    scheduler = FixedRateScheduler(0.05, overrun_policy="coalesce")
+    assert scheduler.wait()
+    time.sleep(0.175)
+    before = time.monotonic()
+    assert scheduler.wait()
+    assert time.monotonic() - before < 0.01
+    # The next tick is back on the grid at 0.20, not a burst of catch-up ticks
+    assert scheduler.wait()
+    stats = scheduler.stats()
+    assert stats["missed_deadlines"] == 1
+    assert stats["skipped_ticks"] == 2
+    assert stats["ticks"] == 3
+    assert stats["jitter_max_ms"] > 10
+
+
+def test_stop_wakes_waiting_loop():
+    scheduler = FixedRateScheduler(10)
+    assert scheduler.wait()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(scheduler.wait()))
+    thread.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    scheduler.stop()
+    thread.join(1)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 0.5
+    assert results == [False]
+    assert not scheduler.wait()
+
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        FixedRateScheduler(-1)
+    with pytest.raises(ValueError):
+        FixedRateScheduler(1, overrun_policy="catch-up")
+
+
+def test_capture_loop_reports_scheduler_stats(tmp_path):
+    source = SyntheticFrameSource(120, 80, change_rate=0.5, seed=3)
+    autoshot = AutoShot("synthetic", 120, 80, interval=5, frame_source=source,
+                        output_dir=str(tmp_path))
+    autoshot.start_capture_loop()
+    time.sleep(0.1)
+    start = time.monotonic()
+    autoshot.stop_capture_loop()
+    # The loop is in the middle of a 5 s wait and must not sleep it out
+    assert time.monotonic() - start < 1
+    assert not autoshot.capture_thread.is_alive()
+    scheduler = autoshot.stats()["scheduler"]
+    assert scheduler["ticks"] == 1
+    assert scheduler["interval_ms"] == 5000
+
+
+def test_adaptive_backs_off_and_snaps_back():
+    scheduler = AdaptiveScheduler(0.5, 10, backoff=2)
+    tick = time.monotonic()
+    scheduler.mark_tick(tick)
+    intervals = []
+    for _ in range(6):
+        scheduler.report(False)
+        intervals.append(scheduler.interval)
+    assert intervals == [1, 2, 4, 8, 10, 10]
+    assert scheduler.next_deadline() == tick + 10
+    scheduler.report(True)
+    assert scheduler.interval == 0.5 and scheduler.next_deadline() == tick + 0.5
+    stats = scheduler.stats()
+    assert (stats["changes"], stats["unchanged"], stats["rate_hz"]) == (1, 6, 2)
+
+
+def test_change_wakes_a_waiting_loop():
+    scheduler = AdaptiveScheduler(0.05, 10)
+    assert scheduler.wait()
+    for _ in range(8):
+        scheduler.report(False)
+    # The next tick is 10 s away until a change moves it to 0.05 s after the last one
+    threading.Timer(0.05, scheduler.report, [True]).start()
+    start = time.monotonic()
+    assert scheduler.wait()
+    assert time.monotonic() - start < 1
+    scheduler.stop()
+
+
+def test_adaptive_rejects_bad_bounds():
+    for args in ((0, 1), (2, 1), (1, 2, 0.5)):
+        with pytest.raises(ValueError):
+            AdaptiveScheduler(*args)
+    with pytest.raises(ValueError):
+        AutoShot("synthetic", 120, 80, interval=5, max_interval=1, frame_source=SyntheticFrameSource(120, 80))
+    with pytest.raises(SystemExit):
+        main(["--title", "t", "--width", "1", "--height", "1", "--source", "synthetic", "--interval", "0",
+              "--max-interval", "5"])
+
+
+def test_adaptive_capture_loop(tmp_path):
+    source = SyntheticFrameSource(120, 80, change_rate=0.0, seed=3)
+    autoshot = AutoShot("synthetic", 120, 80, interval=0.01, max_interval=0.08, frame_source=source,
+                        output_dir=str(tmp_path))
+    autoshot.start_capture_loop()
+    time.sleep(0.4)
+    autoshot.stop_capture_loop()
+    scheduler = autoshot.stats()["scheduler"]
+    # An idle window is captured at the slow rate after a few ticks
+    assert scheduler["interval_ms"] == pytest.approx(80)
+    assert 4 <= scheduler["ticks"] <= 12
+    assert scheduler["changes"] == 1
+    assert "autoshot_capture_interval_seconds" in autoshot.metrics.prometheus()
+
+    args = build_parser().parse_args(["--title", "t", "--width", "1", "--height", "1", "--max-interval", "30",
+                                      "--backoff", "1.5"])
+    assert (args.max_interval, args.backoff) == (30, 1.5)
@@ -0,0 +1,38 @@
+"""
+Tests that quick command line paths don't load the imaging libraries
+"""
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ("numpy", "PIL", "imagehash", "scipy", "pywt", "http.server")
+
+
+def loaded_after(code: str) -> list:
+    script = (f"import sys\n{code}\n"
+              f"print('\\n' + __import__('json').dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_main_is_light():
+    assert loaded_after("import autoshot.main") == []
+
+
+def test_query_pixel_path_is_light():
+    # Without Windows (or without the window) the probe fails, but it must
+    # get there without loading anything heavy
+    code = ("from autoshot.main import main\n"
+            "try:\n"
+            "    main(['--title', 'No such window', '--width', '800', '--query-pixel', '1', '2'])\n"
+            "except SystemExit:\n"
+            "    pass")
+    assert loaded_after(code) == []
+
+
+def test_capture_still_loads_what_it_needs():
+    code = ("from autoshot.main import AutoShot\n"
+            "from autoshot.frame_source import SyntheticFrameSource\n"
+            "import tempfile\n"
+            "AutoShot('s', 64, 48, frame_source=SyntheticFrameSource(64, 48), output_dir=tempfile.mkdtemp())")
+    assert {"numpy", "PIL", "imagehash"} <= set(loaded_after(code))
@@ -0,0 +1,137 @@
+"""
+Tests for scroll detection and transcript stitching
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from autoshot.frame_source import SyntheticFrameSource
+from autoshot.image_processor import ImageProcessor
+from autoshot.main import AutoShot
+from autoshot.transcript import ScrollDetector, TranscriptStitcher
+
+
+def session(count, scroll_rate=1.0, seed=5):
+    source = SyntheticFrameSource(240, 180, change_rate=1.0, seed=seed, scroll_rate=scroll_rate)
+    return [source.grab() for _ in range(count)]
+
+
+def read_transcript(directory):
+    tiles = sorted(directory.glob("transcript_*.png"))
+    return np.concatenate([np.asarray(Image.open(tile)) for tile in tiles])
+
+
+def test_detects_scroll_offset():
+    detector = ScrollDetector()
+    frames = session(4)
+    assert detector.detect(frames[0]) is None
+    assert [detector.detect(frame) for frame in frames[1:]] == [18, 18, 18]
+    # Same frame again: no movement
+    assert detector.detect(frames[3]) == 0
+
+    # Scrolling back or a different size doesn't overlap
+    assert detector.detect(frames[1]) is None
+    assert detector.detect(frames[2].crop((0, 0, 240, 100))) is None
+    assert detector.stats()["scrolls"] == 3
+
+
+def test_detects_arbitrary_offsets():
+    tall = np.asarray(session(1, seed=9)[0].resize((240, 600)))
+    detector = ScrollDetector()
+    tops = [0, 7, 40, 41, 150]
+    detector.detect(Image.fromarray(tall[:180]))
+    for before, top in zip(tops, tops[1:]):
+        assert detector.detect(Image.fromarray(tall[top:top + 180])) == top - before
+
+
+def test_stitches_transcript(tmp_path):
+    frames = session(30)
+    stitcher = TranscriptStitcher(str(tmp_path), tile_height=256)
+    for frame in frames:
+        stitcher.add(frame)
+    stitcher.flush()
+    stats = stitcher.stats()
+    assert stats["breaks"] == 0
+    # Only the first frame is stored in full, then one line per frame
+    assert stats["rows_appended"] == 180 + 29 * 18
+    transcript = read_transcript(tmp_path)
+    assert transcript.shape == (180 + 29 * 18, 240, 3)
+    for position in (0, 11, 29):
+        frame = np.asarray(frames[position])
+        top = position * 18
+        assert np.array_equal(transcript[top:top + 180], frame)
+
+    # A restart continues with a new tile
+    tiles = len(list(tmp_path.glob("transcript_*.png")))
+    again = TranscriptStitcher(str(tmp_path), tile_height=256)
+    path, _ = again.add(frames[0])
+    assert path.endswith(f"transcript_{tiles:05d}.png")
+
+
+def test_added_frames_are_on_disk(tmp_path):
+    frames = session(4)
+    stitcher = TranscriptStitcher(str(tmp_path), tile_height=256)
+    for count, frame in enumerate(frames, 1):
+        path, written = stitcher.add(frame)
+        # Without a flush, the tile holds every row added so far
+        assert written == os.path.getsize(path)
+        assert read_transcript(tmp_path).shape[0] == stitcher.rows_appended == 180 + (count - 1) * 18
+
+
+def test_edit_in_place_appends_whole_frame(tmp_path):
+    frames = session(6, scroll_rate=0.0)
+    stitcher = TranscriptStitcher(str(tmp_path))
+    for frame in frames:
+        stitcher.add(frame)
+    assert stitcher.stats()["rows_appended"] >= 180 * 5
+
+
+def test_transcript_storage(tmp_path):
+    source = SyntheticFrameSource(200, 240, change_rate=0.5, seed=2)
+    autoshot = AutoShot("synthetic", 200, 240, frame_source=source, output_dir=str(tmp_path),
+                        storage="transcript")
+    for _ in range(20):
+        autoshot.single_capture_cycle()
+    autoshot.flush()
+    stitcher = autoshot.streams[0].image_processor.transcript
+    assert stitcher.frames == autoshot.stats()["frames_saved"]
+    assert autoshot.stats()["transcript_rows"] == stitcher.rows_appended
+    # The top half of the window is captured, so whole frames are 120 rows
+    assert stitcher.rows_appended < 120 * stitcher.frames / 2
+    assert read_transcript(tmp_path / "transcript").shape[0] == stitcher.rows_appended
+    assert not list(tmp_path.glob("*.png"))
+
+
+def test_transcript_frames_cant_be_saved_encoded(tmp_path):
+    processor = ImageProcessor(str(tmp_path), storage="transcript")
+    assert processor.needs_raw_frames
+    with pytest.raises(ValueError):
+        processor.save_encoded(b"", "frame.png")
+
+
+def test_pipelined_transcript_stays_in_order(tmp_path):
+    source = SyntheticFrameSource(200, 240, change_rate=1.0, seed=4)
+    autoshot = AutoShot("synthetic", 200, 240, interval=0.005, frame_source=source, output_dir=str(tmp_path),
+                        storage="transcript", pipelined=True, overload_policy="block", encode_workers=4)
+    processor = autoshot.streams[0].image_processor
+    save_frame, calls = processor.save_frame, []
+
+    def slow_first_save(image, hash_value=None):
+        # The first frame reaches the disk late, after the other workers picked up the next ones
+        calls.append(hash_value)
+        if len(calls) == 1:
+            time.sleep(0.1)
+        return save_frame(image, hash_value)
+
+    processor.save_frame = slow_first_save
+    autoshot.start_capture_loop()
+    time.sleep(0.4)
+    autoshot.stop_capture_loop()
+    autoshot.flush()
+    stats = autoshot.stats()
+    assert stats["frames_saved"] == stats["frames_captured"] > 10
+    # Every frame scrolls by one line from the one before, so frames stored out of order break the transcript
+    assert stats["transcript_breaks"] == 0
@@ -0,0 +1,83 @@
+"""
+Tests for the cached window session
+"""
+from autoshot.frame_source import Win32FrameSource
+from autoshot.main import AutoShot
+from autoshot.roi import FULL
+from autoshot.window_session import WindowSession
+
+
+class FakeWindowManager:
+    """Stands in for the Windows API: one window that can move or close"""
+
+    def __init__(self):
+        self.windows = {"Chat": 101}
+        self.window_rects = {101: (100, 50, 516, 389)}
+        self.calls = []
+
+    def find_window(self, class_name=None, window_name=None):
+        self.calls.append("find_window")
+        return self.windows.get(window_name)
+
+    def get_window_rect(self, hwnd):
+        self.calls.append("get_window_rect")
+        return self.window_rects.get(hwnd)
+
+    def get_client_rect(self, hwnd):
+        self.calls.append("get_client_rect")
+        left, top, right, bottom = self.window_rects[hwnd]
+        # 8 px borders and a 31 px title bar
+        return (left + 8, top + 31, right - 8, bottom - 8)
+
+    def get_pixel_color(self, x, y):
+        return (x % 256, y % 256, 0)
+
+
+def test_cache_hits_cost_one_call():
+    manager = FakeWindowManager()
+    session = WindowSession(manager, "Chat")
+    assert session.client_rect() == (108, 81, 508, 381)
+    manager.calls.clear()
+
+    for _ in range(5):
+        assert session.client_rect() == (108, 81, 508, 381)
+    assert manager.calls == ["get_window_rect"] * 5
+    assert session.stats() == {"hits": 5, "misses": 1, "geometry_refreshes": 1}
+
+
+def test_moved_window_refreshes_geometry():
+    manager = FakeWindowManager()
+    session = WindowSession(manager, "Chat")
+    session.client_rect()
+    manager.window_rects[101] = (200, 50, 616, 389)
+    assert session.client_rect() == (208, 81, 608, 381)
+    assert session.hits == 1 and session.geometry_refreshes == 2
+
+
+def test_reopened_window_is_looked_up_again():
+    manager = FakeWindowManager()
+    session = WindowSession(manager, "Chat")
+    session.client_rect()
+
+    del manager.window_rects[101]
+    manager.windows["Chat"] = None
+    assert session.client_rect() is None
+
+    manager.windows["Chat"] = 202
+    manager.window_rects[202] = (0, 0, 416, 339)
+    assert session.client_rect() == (8, 31, 408, 331)
+    assert session.hwnd == 202
+    assert session.misses == 3
+
+
+def test_pixel_query_uses_cached_geometry(tmp_path):
+    manager = FakeWindowManager()
+    source = Win32FrameSource("Chat", window_manager=manager)
+    autoshot = AutoShot("Chat", 400, 300, frame_source=source, output_dir=str(tmp_path), regions=[FULL])
+    assert source.open() and source.hwnd == 101
+    manager.calls.clear()
+
+    for x in range(3):
+        assert autoshot.get_pixel_at_screenshot_coords(101, x, 2) == (108 + x, 83, 0)
+    assert "find_window" not in manager.calls and "get_client_rect" not in manager.calls
+    assert autoshot.stats()["window_session"]["hits"] == 3